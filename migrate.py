@@ -0,0 +1,32 @@
+from flask import Flask
+
+from song_server.shared.configs import DevConfig
+from song_server.extensions.dbhelper import init_db
+from song_server.extensions.hashpool import init_hash_pool
+from song_server.extensions.extinit import migrate_db
+
+
+"""
+Db migrations,
+Creates the indexes and the first admin user, run once per deploy
+and start the servers with DB_MIGRATE_ON_STARTUP=0
+
+python3 migrate.py && DB_MIGRATE_ON_STARTUP=0 python3 serve.py
+"""
+
+
+def main():
+    # Only the extensions the migrations use, no blueprints
+    app = Flask(__name__)
+    app.config.from_object(DevConfig)
+    init_hash_pool(app)
+    init_db(app)
+
+    migrate_db()
+
+    from song_server.extensions.hashpool import hash_pool
+    hash_pool.shutdown()
+
+
+if __name__ == "__main__":
+    main()
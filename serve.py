@@ -0,0 +1,89 @@
+import argparse
+from gunicorn.app.base import BaseApplication
+
+from song_server.app import create_app
+from song_server.shared.configs import ProdConfig
+from song_server.shared.configs import DB_BACKEND_MEMORY
+from song_server.extensions.extinit import prepare_extensions_for_fork
+from song_server.extensions.extinit import reinit_extensions_after_fork
+
+
+"""
+Production entry point,
+Serves the app with gunicorn, `workers` processes of `threads` threads
+
+The app is created once and the workers are forked from it, so they
+share its jwt secret, tokens are valid on every worker. Each worker
+then creates its own Mongo client, caches and pools after the fork
+
+The memory backend keeps the catalog in process, it only serves
+from a single worker, more workers need mongod
+
+Gunicorn docs - https://docs.gunicorn.org/en/stable/custom.html
+"""
+
+
+class SongServer(BaseApplication):
+
+    def __init__(self, flask_app, options):
+        self.flask_app = flask_app
+        self.options = options
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.options.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        return self.flask_app
+
+
+def check_workers(db_backend, workers):
+    """
+    Forked workers of the memory backend would each serve their own
+    copy of the catalog, a write is only seen by the worker that made it
+
+    :raise ValueError: more than one worker on the memory backend
+    """
+
+    if db_backend == DB_BACKEND_MEMORY and workers > 1:
+        raise ValueError(f'{workers} workers on the memory backend, '
+                         f'serve a single worker or run on mongod')
+
+
+def serve(bind, workers, threads, timeout):
+    check_workers(ProdConfig.DB_BACKEND, workers)
+    flask_app = create_app(config=ProdConfig)
+
+    def pre_fork(server, worker):
+        prepare_extensions_for_fork()
+
+    def post_fork(server, worker):
+        reinit_extensions_after_fork(flask_app)
+
+    SongServer(flask_app, {
+        'bind': bind,
+        'workers': workers,
+        'threads': threads,
+        'timeout': timeout,
+        'worker_class': 'gthread',
+        'preload_app': True,
+        'pre_fork': pre_fork,
+        'post_fork': post_fork,
+    }).run()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--bind', default=ProdConfig.SERVE_BIND)
+    parser.add_argument('--workers', type=int, default=ProdConfig.SERVE_WORKERS)
+    parser.add_argument('--threads', type=int, default=ProdConfig.SERVE_THREADS)
+    parser.add_argument('--timeout', type=int,
+                        default=ProdConfig.SERVE_TIMEOUT_SEC)
+    args = parser.parse_args()
+
+    serve(args.bind, args.workers, args.threads, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,207 @@
+import time
+import threading
+
+
+class TopSongs:
+
+    """
+    In memory top-K of songs by a counter (times_played, num_likes),
+    Kept up to date by offering every song whose counter changed,
+    so serving a chart doesn't need a sort over the collection.
+
+    Counters only ever increase, so a song outside the top-K can only
+    enter it through an `offer`. Removals leave a gap that only the db
+    can fill, the top-K is then reloaded on the next read, as it is
+    every `refresh_sec` to pick up increments made by other processes.
+    Changes made while a reload reads the db are replayed after it
+    """
+
+    def __init__(self, field, capacity, refresh_sec, load_func):
+        """
+        :param field: str, the counter songs are ranked by
+        :param capacity: int, number of songs kept in memory
+        :param refresh_sec: int, reload from the db after this long
+        :param load_func: callable(field, limit, explicit_query),
+                          returns the top songs from the db
+        """
+
+        self.field = field
+        self.capacity = capacity
+        self.refresh_sec = refresh_sec
+        self._load_func = load_func
+
+        # {song_id: song}, lowest ranked song cached for offers
+        self._songs = {}
+        self._lowest = None
+        self._loaded_ts = None
+        self._is_exhaustive = False
+        self._lock = threading.Lock()
+
+        # Changes made while the db is read, [(method, args)]
+        self._load_lock = threading.Lock()
+        self._pending_changes = None
+
+        # Metrics
+        self.num_loads = 0
+        self.num_db_fallbacks = 0
+
+    def offer(self, song):
+        """
+        Update the top-K with a song's current counters
+
+        :param song: dict, song with its up to date counters
+        """
+
+        with self._lock:
+            self._apply(self._offer, song)
+
+    def offer_counter(self, song_id, field, value):
+        """
+        Update the top-K with a single counter of a song,
+        Songs in the top-K are updated in place, a song entering it
+        makes the next read reload the top-K, its document is only
+        known to the db
+
+        :param field: str, the counter that changed
+        :param value: int, the up to date value of the counter
+        """
+
+        with self._lock:
+            self._apply(self._offer_counter, song_id, field, value)
+
+    def remove(self, song_id=None, name=None, source_url=None):
+        """
+        Drop a song from the top-K, by id or by name and source url
+        """
+
+        with self._lock:
+            self._apply(self._remove, song_id, name, source_url)
+
+    def top(self, limit, explicit_query=False):
+        """
+        :param limit: int, number of songs, at most `capacity`
+        :param explicit_query: bool, filters explicit songs when True
+        :return: list of songs, highest counter first
+        """
+
+        with self._lock:
+            is_stale = self._is_stale()
+
+        if is_stale:
+            self._load()
+
+        with self._lock:
+            songs = sorted(self._songs.values(), key=self._rank_key)
+            is_exhaustive = self._is_exhaustive
+
+        if explicit_query:
+            songs = [s for s in songs if not s.get('is_explicit')]
+
+        # Explicit songs filled the top-K, rank the rest in the db
+        if len(songs) < limit and not is_exhaustive:
+            self.num_db_fallbacks += 1
+            return self._load_func(self.field, limit, explicit_query)
+
+        return songs[:limit]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'size': len(self._songs),
+                'capacity': self.capacity,
+                'loads': self.num_loads,
+                'db_fallbacks': self.num_db_fallbacks,
+            }
+
+    def _load(self):
+        with self._load_lock:
+            with self._lock:
+                # Reloaded by another reader while this one waited
+                if not self._is_stale():
+                    return
+                self._pending_changes = []
+
+            songs = self._load_func(self.field, self.capacity, False)
+
+            with self._lock:
+                self._songs = {s['_id']: s for s in songs}
+                self._lowest = None
+                self._is_exhaustive = len(songs) < self.capacity
+                self._loaded_ts = time.monotonic()
+                self.num_loads += 1
+
+                # The db read may or may not have seen them,
+                # offers never lower a counter of the loaded songs
+                for method, args in self._pending_changes:
+                    method(*args)
+                self._pending_changes = None
+
+    def _is_stale(self):
+        # Called with `_lock` held
+        return self._loaded_ts is None or \
+            time.monotonic() - self._loaded_ts > self.refresh_sec
+
+    def _apply(self, method, *args):
+        # Called with `_lock` held
+        if self._pending_changes is not None:
+            self._pending_changes.append((method, args))
+        if self._loaded_ts is not None:
+            method(*args)
+
+    def _offer(self, song):
+        song_id = song['_id']
+        current = self._songs.get(song_id)
+        if current is not None:
+            # Counters only increase, a lower one is an older offer
+            if song.get(self.field, 0) >= current.get(self.field, 0):
+                self._songs[song_id] = song
+                self._lowest = None
+            return
+
+        if self._is_exhaustive or len(self._songs) < self.capacity:
+            self._songs[song_id] = song
+            self._lowest = None
+            return
+
+        # Replace the lowest ranked song if the new one beats it
+        if self._beats_lowest(song.get(self.field, 0)):
+            del self._songs[self._lowest['_id']]
+            self._songs[song_id] = song
+            self._lowest = None
+
+    def _offer_counter(self, song_id, field, value):
+        current = self._songs.get(song_id)
+        if current is not None:
+            if value >= current.get(field, 0):
+                self._songs[song_id] = {**current, field: value}
+                self._lowest = None
+            return
+
+        # Doesn't change the ranking of this chart
+        if field != self.field:
+            return
+
+        if self._is_exhaustive or len(self._songs) < self.capacity \
+                or self._beats_lowest(value):
+            self._loaded_ts = None
+
+    def _remove(self, song_id, name, source_url):
+        removed = [k for k, s in self._songs.items()
+                   if k == song_id or (s['name'] == name and
+                                       s['source_url'] == source_url)]
+        for k in removed:
+            del self._songs[k]
+        self._lowest = None
+
+        # Next song in line is only known to the db
+        if removed and not self._is_exhaustive:
+            self._loaded_ts = None
+
+    def _beats_lowest(self, value):
+        if self._lowest is None:
+            self._lowest = max(self._songs.values(), key=self._rank_key)
+        return value > self._lowest.get(self.field, 0)
+
+    def _rank_key(self, song):
+        # Highest counter first, ties by ascending _id as in the db
+        return -song.get(self.field, 0), str(song['_id'])
@@ -0,0 +1,247 @@
+import gzip
+import zlib
+import threading
+from flask import request
+from flask import current_app
+
+from song_server.shared.cache import LruCache
+from song_server.shared.serializers import WIRE_FORMATS
+
+# Optional codecs, only gzip is offered without them
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+"""
+Response compression negotiated with Accept-Encoding,
+Json, ndjson and binary list responses above a size threshold are
+compressed with zstd, br or gzip, whichever the client prefers and the
+server has.
+Compressed bytes of responses with a strong ETag are cached,
+a hot page is compressed once per ETag, not once per request
+"""
+
+ENCODING_GZIP = 'gzip'
+ENCODING_BROTLI = 'br'
+ENCODING_ZSTD = 'zstd'
+
+COMPRESSIBLE_MIMETYPES = {*WIRE_FORMATS, 'application/x-ndjson'}
+
+
+class _GzipCodec:
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        # No timestamp, the same data gives the same bytes
+        return gzip.compress(data, self.level, mtime=0)
+
+    def compress_stream(self, chunks):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, 31)
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+
+        yield compressor.flush()
+
+
+class _BrotliCodec:
+
+    def __init__(self, level):
+        self.level = level
+
+    def compress(self, data):
+        return brotli.compress(data, quality=self.level)
+
+    def compress_stream(self, chunks):
+        compressor = brotli.Compressor(quality=self.level)
+        for chunk in chunks:
+            data = compressor.process(chunk)
+            if data:
+                yield data
+
+        yield compressor.finish()
+
+
+class _ZstdCodec:
+
+    def __init__(self, level):
+        self.level = level
+        self._local = threading.local()
+
+    def compress(self, data):
+        # Compressors aren't thread safe, one per thread
+        compressor = getattr(self._local, 'compressor', None)
+        if compressor is None:
+            compressor = zstandard.ZstdCompressor(level=self.level)
+            self._local.compressor = compressor
+
+        return compressor.compress(data)
+
+    def compress_stream(self, chunks):
+        compressor = zstandard.ZstdCompressor(
+            level=self.level).compressobj()
+        for chunk in chunks:
+            data = compressor.compress(chunk)
+            if data:
+                yield data
+
+        yield compressor.flush()
+
+
+class ResponseCompressor:
+
+    """
+    Picks the encoding of a response and compresses it,
+    Codecs are listed in server preference order, used on a tie
+    of the client's quality values
+    """
+
+    def __init__(self, min_bytes, gzip_level, brotli_level, zstd_level,
+                 cache_size, cache_ttl_sec):
+
+        self.min_bytes = min_bytes
+        self.cache_size = cache_size
+        self.cache_ttl_sec = cache_ttl_sec
+
+        # {encoding: codec}, best ratio / speed first
+        self.codecs = {}
+        if zstandard is not None:
+            self.codecs[ENCODING_ZSTD] = _ZstdCodec(zstd_level)
+        if brotli is not None:
+            self.codecs[ENCODING_BROTLI] = _BrotliCodec(brotli_level)
+        self.codecs[ENCODING_GZIP] = _GzipCodec(gzip_level)
+
+        self.reset()
+
+    def reset(self):
+        # Per process state, recreated in forked workers
+        self.cache = LruCache(self.cache_size, self.cache_ttl_sec) \
+            if self.cache_size > 0 else None
+        self.counters = dict.fromkeys(self.codecs, 0)
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    def negotiate(self, accept_encodings):
+        """
+        :param accept_encodings: werkzeug `Accept`, the parsed
+                                 Accept-Encoding header
+        :return: str, the encoding to use, None to send as is
+        """
+
+        best, best_quality = None, 0
+        for encoding in self.codecs:
+            quality = accept_encodings.quality(encoding)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+
+        return best
+
+    def compress(self, data, encoding, cache_key=None):
+        """
+        :param data: bytes, the response body
+        :param encoding: str, a negotiated encoding
+        :param cache_key: hashable, identifies `data`, None to not cache
+        :return: bytes, the compressed body
+        """
+
+        if cache_key is not None and self.cache is not None:
+            compressed = self.cache.get((cache_key, encoding))
+            if compressed is not None:
+                return compressed
+
+        compressed = self.codecs[encoding].compress(data)
+        self.counters[encoding] += 1
+        self.bytes_in += len(data)
+        self.bytes_out += len(compressed)
+
+        if cache_key is not None and self.cache is not None:
+            self.cache.put((cache_key, encoding), compressed)
+
+        return compressed
+
+    def compress_stream(self, chunks, encoding):
+        """
+        :param chunks: iterable of bytes, closed once consumed
+        :return: generator of the compressed bytes
+        """
+
+        self.counters[encoding] += 1
+        try:
+            yield from self.codecs[encoding].compress_stream(chunks)
+        finally:
+            # Ends the request context of a `stream_with_context` body
+            if hasattr(chunks, 'close'):
+                chunks.close()
+
+    def stats(self):
+        return {
+            'encodings': dict(self.counters),
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'cache': self.cache.stats() if self.cache is not None else None,
+        }
+
+
+def _compress_response(response):
+    if response.status_code < 200 or response.status_code in [204, 304]:
+        return response
+    if response.mimetype not in COMPRESSIBLE_MIMETYPES:
+        return response
+    if response.direct_passthrough or 'Content-Encoding' in response.headers:
+        return response
+
+    # Caches must keep one copy per encoding
+    response.vary.add('Accept-Encoding')
+
+    compressor = current_app.extensions['compression']
+    encoding = compressor.negotiate(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        # Length unknown up front, every stream is compressed
+        response.response = compressor.compress_stream(
+            response.response, encoding)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < compressor.min_bytes:
+            return response
+
+        # A strong ETag identifies the body of a url
+        etag, is_weak = response.get_etag()
+        cache_key = (request.full_path, response.mimetype, etag) \
+            if etag is not None and not is_weak else None
+        response.set_data(compressor.compress(data, encoding, cache_key))
+
+        # The compressed bytes differ, the ETag only matches weakly
+        if etag is not None:
+            response.set_etag(etag, weak=True)
+
+    response.headers['Content-Encoding'] = encoding
+    return response
+
+
+def init_compression(app):
+    # Disabled, no compressor exists at all
+    if not app.config['COMPRESSION_ENABLED']:
+        return
+
+    app.extensions['compression'] = ResponseCompressor(
+        app.config['COMPRESSION_MIN_BYTES'],
+        app.config['COMPRESSION_GZIP_LEVEL'],
+        app.config['COMPRESSION_BROTLI_LEVEL'],
+        app.config['COMPRESSION_ZSTD_LEVEL'],
+        app.config['COMPRESSION_CACHE_SIZE'],
+        app.config['COMPRESSION_CACHE_TTL_SEC'])
+    app.after_request(_compress_response)
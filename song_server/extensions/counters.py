@@ -0,0 +1,449 @@
+import time
+import uuid
+import atexit
+import random
+import threading
+from pymongo import UpdateOne
+from pymongo.errors import PyMongoError
+from pymongo.errors import BulkWriteError
+
+
+class CounterAggregator:
+
+    """
+    Write-behind buffer for song counters (times_played, num_likes),
+    Increments are merged per song id in memory and written as a single
+    unordered bulk write, every `flush_interval_ms` or as soon as
+    `max_entries` songs are pending, whichever comes first
+    """
+
+    def __init__(self, collection, flush_interval_ms, max_entries,
+                 on_flush=None):
+        """
+        :param on_flush: callable(song_ids), called after every
+                         successful flush with the ids written
+        """
+
+        self.collection = collection
+        self.on_flush = on_flush
+        self.flush_interval_sec = flush_interval_ms / 1000
+        self.max_entries = max_entries
+
+        # {song_id: {field: increment}}
+        self._pending = {}
+        self._oldest_ts = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+        # Metrics
+        self.num_flushes = 0
+        self.num_failed_flushes = 0
+        self.num_flushed_songs = 0
+        self.last_flush_size = 0
+        self.max_flush_size = 0
+        self.last_flush_lag_ms = 0
+        self.max_flush_lag_ms = 0
+
+        # Background flusher
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name='counter-aggregator', daemon=True)
+        self._thread.start()
+
+        # Flush whatever is left on shutdown
+        atexit.register(self.close)
+
+    def add(self, song_id, field, amount=1):
+        """
+        Buffer an increment of `field` by `amount` for a song
+        """
+
+        with self._lock:
+            counters = self._pending.setdefault(song_id, {})
+            counters[field] = counters.get(field, 0) + amount
+
+            if self._oldest_ts is None:
+                self._oldest_ts = time.monotonic()
+            is_full = len(self._pending) >= self.max_entries
+
+        if is_full:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Write all pending increments to the db
+
+        :return: int, number of songs flushed
+        """
+
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+                oldest_ts, self._oldest_ts = self._oldest_ts, None
+
+            if not pending:
+                return 0
+
+            requests = [UpdateOne({'_id': song_id}, {'$inc': counters})
+                        for song_id, counters in pending.items()]
+            try:
+                self.collection.bulk_write(requests, ordered=False)
+            except BulkWriteError:
+                # Per document failures won't succeed on a retry
+                self.num_failed_flushes += 1
+                return 0
+            except PyMongoError:
+                # Db unreachable, keep the increments for the next flush
+                self.num_failed_flushes += 1
+                self._requeue(pending, oldest_ts)
+                return 0
+
+            # Metrics
+            lag_ms = (time.monotonic() - oldest_ts) * 1000
+            self.num_flushes += 1
+            self.num_flushed_songs += len(pending)
+            self.last_flush_size = len(pending)
+            self.max_flush_size = max(self.max_flush_size, len(pending))
+            self.last_flush_lag_ms = lag_ms
+            self.max_flush_lag_ms = max(self.max_flush_lag_ms, lag_ms)
+
+            if self.on_flush is not None:
+                self.on_flush(list(pending.keys()))
+
+            return len(pending)
+
+    def close(self):
+        """
+        Stop the background flusher and flush pending increments
+        """
+
+        if self._stopped.is_set():
+            return
+
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            num_pending = len(self._pending)
+
+        return {
+            'pending_songs': num_pending,
+            'flushes': self.num_flushes,
+            'failed_flushes': self.num_failed_flushes,
+            'flushed_songs': self.num_flushed_songs,
+            'last_flush_size': self.last_flush_size,
+            'max_flush_size': self.max_flush_size,
+            'last_flush_lag_ms': self.last_flush_lag_ms,
+            'max_flush_lag_ms': self.max_flush_lag_ms,
+        }
+
+    def _requeue(self, pending, oldest_ts):
+        with self._lock:
+            for song_id, counters in pending.items():
+                current = self._pending.setdefault(song_id, {})
+                for field, amount in counters.items():
+                    current[field] = current.get(field, 0) + amount
+
+            if self._oldest_ts is None or oldest_ts < self._oldest_ts:
+                self._oldest_ts = oldest_ts
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval_sec)
+            self._wakeup.clear()
+            self.flush()
+
+
+class ShardedCounters:
+
+    """
+    Spreads the increments of hot songs over `num_shards` counter
+    documents, so concurrent plays / likes of a single song don't all
+    serialize on the song document.
+    A song is promoted once it gets more than `hot_threshold` increments
+    within a second in this process, shards are folded back into the song
+    document every `fold_interval_ms`, where all reads see the total.
+    Songs left idle for a whole fold interval are demoted.
+    Shards left by a process that died before its last fold are swept,
+    folded with the songs of the first timed fold and then every
+    ORPHAN_SWEEP_FOLDS folds, whichever process tracks them
+    """
+
+    COUNTER_FIELDS = ['times_played', 'num_likes']
+
+    # Fold ids kept per song, to skip the folds it already got
+    FOLD_HISTORY = 32
+
+    # Timed folds between two sweeps of untracked shards
+    ORPHAN_SWEEP_FOLDS = 60
+
+    def __init__(self, songs_collection, shards_collection, num_shards,
+                 hot_threshold, fold_interval_ms, on_fold=None):
+        """
+        :param shards_collection: pymongo collection of the counter shards,
+                                  {_id: {song_id, shard}, times_played,
+                                  num_likes, pending}
+        :param on_fold: callable(song_ids), called after every
+                        successful fold with the ids written
+        """
+
+        self.songs = songs_collection
+        self.shards = shards_collection
+        self.num_shards = num_shards
+        self.hot_threshold = hot_threshold
+        self.fold_interval_sec = fold_interval_ms / 1000
+        self.on_fold = on_fold
+
+        # {song_id: True if incremented since the last fold}
+        self._hot = {}
+
+        # Direct increments per song, within the current second
+        self._window_ts = time.monotonic()
+        self._window_counts = {}
+
+        self._lock = threading.Lock()
+        self._fold_lock = threading.Lock()
+
+        # Metrics
+        self.num_promotions = 0
+        self.num_demotions = 0
+        self.num_sharded_incs = 0
+        self.num_folds = 0
+        self.num_failed_folds = 0
+        self.last_fold_size = 0
+
+        # Background folder
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name='counter-shards', daemon=True)
+        self._thread.start()
+
+        # Fold whatever is left on shutdown
+        atexit.register(self.close)
+
+    def add(self, song_id, field, amount=1):
+        """
+        Increment `field` of a hot song through one of its shards
+
+        :return: bool, False if the song isn't hot,
+                 the caller then updates the song document
+        """
+
+        with self._lock:
+            if song_id not in self._hot:
+                return False
+            self._hot[song_id] = True
+
+        shard = random.randrange(self.num_shards)
+        self.shards.update_one(
+            {'_id': {'song_id': song_id, 'shard': shard}},
+            {'$inc': {field: amount}}, upsert=True)
+
+        self.num_sharded_incs += 1
+        return True
+
+    def record(self, song_id):
+        """
+        Count an increment written to the song document,
+        promotes the song once above `hot_threshold` per second
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            if now - self._window_ts >= 1:
+                self._window_ts = now
+                self._window_counts = {}
+
+            count = self._window_counts.get(song_id, 0) + 1
+            self._window_counts[song_id] = count
+            if count > self.hot_threshold and song_id not in self._hot:
+                self._hot[song_id] = True
+                self.num_promotions += 1
+
+    def fold(self, is_sweep=False):
+        """
+        Move the shard counts of every hot song into its song document,
+        demote the songs that were idle since the previous fold
+
+        :param is_sweep: bool, also fold the shards holding counts of
+                         songs this process doesn't track.
+                         Folds are idempotent, shards also folded by
+                         another process are added once
+        :return: int, number of songs updated
+        """
+
+        with self._fold_lock:
+            with self._lock:
+                song_ids = list(self._hot)
+                idle = [song_id for song_id, is_active in self._hot.items()
+                        if not is_active]
+                self._hot = dict.fromkeys(song_ids, False)
+
+            if is_sweep:
+                song_ids += self._find_orphans(song_ids)
+
+            if not song_ids:
+                return 0
+
+            shard_ids = [{'song_id': song_id, 'shard': shard}
+                         for song_id in song_ids
+                         for shard in range(self.num_shards)]
+
+            # Moved to a pending fold in phase 1, even if phase 2 fails
+            is_moved = self._move_to_pending(shard_ids, uuid.uuid4().hex)
+
+            try:
+                totals = self._apply_pending(shard_ids)
+            except PyMongoError:
+                # Pending folds stay on the shards, applied on the next fold
+                self.num_failed_folds += 1
+                return 0
+
+            # Demote, unless incremented again during this fold,
+            # or its shards may still hold counts
+            with self._lock:
+                for song_id in idle if is_moved else []:
+                    if self._hot.get(song_id) is False:
+                        del self._hot[song_id]
+                        self.num_demotions += 1
+
+            self.num_folds += 1
+            self.last_fold_size = len(totals)
+
+            if self.on_fold is not None and totals:
+                self.on_fold(list(totals.keys()))
+
+            return len(totals)
+
+    def _find_orphans(self, song_ids):
+        """
+        :param song_ids: list, the songs this process tracks
+        :return: list, ids of the other songs with counts or a pending
+                 fold on their shards
+        """
+
+        try:
+            orphans = self.shards.distinct('_id.song_id', {'$or': [
+                *[{f: {'$ne': 0, '$exists': True}}
+                  for f in self.COUNTER_FIELDS],
+                {'pending': {'$ne': None}},
+            ]})
+        except PyMongoError:
+            self.num_failed_folds += 1
+            return []
+
+        tracked = set(song_ids)
+        return [song_id for song_id in orphans if song_id not in tracked]
+
+    def _move_to_pending(self, shard_ids, fold_id):
+        """
+        Phase 1, move the counts of every shard to its pending fold,
+        atomic per shard, shards with a pending fold left by a failed
+        fold are skipped until it is applied
+
+        :return: bool, False if some shards may not have been moved
+        """
+
+        try:
+            requests = []
+            for doc in self.shards.find(
+                    {'_id': {'$in': shard_ids}, 'pending': None}):
+                counters = {f: doc[f] for f in self.COUNTER_FIELDS
+                            if doc.get(f)}
+                if not counters:
+                    continue
+
+                # Decrement by what was read, increments made
+                # meanwhile are kept for the next fold
+                requests.append(UpdateOne(
+                    {'_id': doc['_id'], 'pending': None},
+                    {'$inc': {f: -v for f, v in counters.items()},
+                     '$set': {'pending': {'fold_id': fold_id, **counters}}}))
+
+            if requests:
+                self.shards.bulk_write(requests, ordered=False)
+            return True
+        except PyMongoError:
+            # Shards not moved keep their counts, the others are pending
+            self.num_failed_folds += 1
+            return False
+
+    def _apply_pending(self, shard_ids):
+        """
+        Phase 2, add every pending fold to its song once, then clear it,
+        A song keeps the ids of its last FOLD_HISTORY folds, a fold
+        retried after a failure isn't added twice
+
+        :return: dict, {song_id: {field: amount}} added by this call
+        """
+
+        # {(song_id, fold_id): {field: amount}}
+        pending = {}
+        clear_requests = []
+        for doc in self.shards.find(
+                {'_id': {'$in': shard_ids}, 'pending': {'$ne': None}}):
+            fold_id = doc['pending']['fold_id']
+            total = pending.setdefault((doc['_id']['song_id'], fold_id), {})
+            for f in self.COUNTER_FIELDS:
+                total[f] = total.get(f, 0) + doc['pending'].get(f, 0)
+
+            clear_requests.append(UpdateOne(
+                {'_id': doc['_id'], 'pending.fold_id': fold_id},
+                {'$unset': {'pending': ''}}))
+
+        if not pending:
+            return {}
+
+        self.songs.bulk_write([UpdateOne(
+            {'_id': song_id, 'counter_folds': {'$ne': fold_id}},
+            {'$inc': {f: v for f, v in counters.items() if v},
+             '$push': {'counter_folds': {
+                 '$each': [fold_id], '$slice': -self.FOLD_HISTORY}}})
+            for (song_id, fold_id), counters in pending.items()],
+            ordered=False)
+        self.shards.bulk_write(clear_requests, ordered=False)
+
+        totals = {}
+        for (song_id, _), counters in pending.items():
+            total = totals.setdefault(song_id, {})
+            for f, v in counters.items():
+                total[f] = total.get(f, 0) + v
+
+        return totals
+
+    def close(self):
+        """
+        Stop the background folder and fold the pending shard counts
+        """
+
+        if self._stopped.is_set():
+            return
+
+        self._stopped.set()
+        self._thread.join()
+        self.fold()
+
+    def stats(self):
+        with self._lock:
+            num_hot = len(self._hot)
+
+        return {
+            'shards': self.num_shards,
+            'hot_songs': num_hot,
+            'promotions': self.num_promotions,
+            'demotions': self.num_demotions,
+            'sharded_increments': self.num_sharded_incs,
+            'folds': self.num_folds,
+            'failed_folds': self.num_failed_folds,
+            'last_fold_size': self.last_fold_size,
+        }
+
+    def _run(self):
+        num_runs = 0
+        while not self._stopped.wait(self.fold_interval_sec):
+            self.fold(is_sweep=num_runs % self.ORPHAN_SWEEP_FOLDS == 0)
+            num_runs += 1
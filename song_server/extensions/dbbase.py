@@ -0,0 +1,227 @@
+from song_server.models.user import User
+
+
+class BaseDbHelper:
+
+    """
+    Storage interface used by the services,
+    Every backend returns the same data and error codes,
+    songs and users are plain dicts keyed like their db documents.
+
+    Backends must enforce the unique keys,
+    users: username, songs: (name, source_url)
+    """
+
+    """
+    Songs Db
+    """
+
+    def add_item(self, item):
+        """
+        :param item: `Song` or `User`
+        :return: int, error code
+        """
+
+        raise NotImplementedError
+
+    def add_songs(self, songs):
+        """
+        :param songs: list of valid `Song`
+        :return: list, the error code of every song, in order
+        """
+
+        raise NotImplementedError
+
+    def get_song(self, song_id):
+        """
+        :return: dict, the song or None if it doesn't exist
+        """
+
+        raise NotImplementedError
+
+    def get_songs(self, page_number=1, explicit_query=False):
+        """
+        :param page_number: int, pages of DB_ENTRIES_PER_PAGE songs
+        :param explicit_query: bool, filters explicit songs when True
+        :return: list of songs, sorted by name
+        """
+
+        raise NotImplementedError
+
+    def get_songs_after(self, last_seen=None, explicit_query=False):
+        """
+        :param last_seen: dict, decoded cursor returned by a previous call,
+                          None to start from the first page
+        :param explicit_query: bool, filters explicit songs when True
+        :return: tuple, (list of songs, next cursor or None if no more pages)
+        """
+
+        raise NotImplementedError
+
+    def get_catalog_version(self):
+        """
+        Version of the catalog, bumped by every song added or removed,
+        shared by every worker, not by plays / likes
+
+        :return: int
+        """
+
+        raise NotImplementedError
+
+    def remove_song(self, song_name, source_url):
+        """
+        :return: int, error code
+        """
+
+        raise NotImplementedError
+
+    def search_songs(self, query, limit, explicit_query=False):
+        """
+        :param query: str, the search terms
+        :param limit: int, max number of songs
+        :param explicit_query: bool, filters explicit songs when True
+        :return: list of songs, most relevant first
+        """
+
+        raise NotImplementedError
+
+    def suggest_songs(self, prefix, limit):
+        """
+        :param prefix: str, case insensitive name prefix
+        :param limit: int, max number of names
+        :return: list of song names, sorted
+        """
+
+        raise NotImplementedError
+
+    def export_songs(self, last_seen=None, explicit_query=False,
+                     batch_size=100):
+        """
+        :param last_seen: dict, _id of the last song of a previous
+                          export, None to export every song
+        :param explicit_query: bool, filters explicit songs when True
+        :param batch_size: int, songs fetched per db round trip
+        :return: iterable of songs, ordered by _id
+        """
+
+        raise NotImplementedError
+
+    def get_chart(self, field, limit, explicit_query=False):
+        """
+        :param field: str, 'times_played' or 'num_likes'
+        :param limit: int, number of songs, at most MAX_CHART_LIMIT
+        :param explicit_query: bool, filters explicit songs when True
+        :return: list of songs, highest counter first
+        """
+
+        raise NotImplementedError
+
+    def like_song(self, song_id):
+        """
+        :return: int, error code
+        """
+
+        raise NotImplementedError
+
+    def play_song(self, song_id, user_id=None):
+        """
+        :param user_id: str, the listener, kept in the play log
+        :return: int, error code
+        """
+
+        raise NotImplementedError
+
+    def like_songs(self, increments):
+        """
+        :param increments: dict, {song_id: amount}
+        :return: dict, {song_id: error code}
+        """
+
+        raise NotImplementedError
+
+    def play_songs(self, increments, user_id=None):
+        """
+        :param increments: dict, {song_id: amount}
+        :param user_id: str, the listener, kept in the play log
+        :return: dict, {song_id: error code}
+        """
+
+        raise NotImplementedError
+
+    def get_song_plays(self, song_id, period, num_periods):
+        """
+        Plays of a song in a time window, read from the play rollups
+
+        :param period: str, PLAY_PERIOD_HOUR or PLAY_PERIOD_DAY
+        :param num_periods: int, the current period and
+                            the `num_periods` - 1 before it
+        :return: int, number of plays, None if plays aren't logged
+        """
+
+        raise NotImplementedError
+
+    """
+    Users Db
+    """
+
+    def get_users(self, is_admin_only=False):
+        """
+        :return: list of users, first page sorted by username
+        """
+
+        raise NotImplementedError
+
+    def _find_user(self, username):
+        """
+        :return: dict, the user or None if it doesn't exist
+        """
+
+        raise NotImplementedError
+
+    def login_user(self, username, password):
+        """
+        Raises `HashPoolSaturated` if too many logins are pending
+
+        :return: `User` or None if the credentials are invalid
+        """
+
+        from song_server.extensions.hashpool import hash_pool
+        user = User.from_json(self._find_user(username) or {})
+
+        # Error parsing user data or user doesn't exist
+        if user is None:
+            return
+
+        # Password mismatch
+        if not hash_pool.check_password_hash(user.password, password):
+            return
+
+        return user
+
+    def remove_user(self, username):
+        raise NotImplementedError
+
+    """
+    Utils
+    """
+
+    def create_indexes(self):
+        """
+        Create the backend indexes, part of the db migrations,
+        no-op for the indexes that already exist
+        """
+
+    def reset_after_fork(self, flask_app):
+        """
+        Recreate the per process state in a forked worker
+        """
+
+    def get_stats(self):
+        """
+        :return: dict, backend specific metrics
+        """
+
+        raise NotImplementedError
+
+    def drop_all_collections(self):
+        raise NotImplementedError
@@ -1,40 +1,250 @@
+import time
 import pymongo
+from datetime import datetime
+from datetime import timezone
 from pymongo import MongoClient
+from pymongo import UpdateOne
+from pymongo import ReturnDocument
+from pymongo.errors import PyMongoError
+from pymongo.errors import BulkWriteError
 from pymongo.errors import DuplicateKeyError
-from werkzeug.security import check_password_hash
 
 from song_server.shared.configs import *
 from song_server.shared.errorcodes import *
+from song_server.shared.utils import encode_cursor
+from song_server.shared.cache import LruCache
+from song_server.shared.cache import SingleFlight
+from song_server.extensions.dbbase import BaseDbHelper
+from song_server.extensions.counters import CounterAggregator
+from song_server.extensions.counters import ShardedCounters
+from song_server.extensions.playlog import PlayLog
+from song_server.extensions.playlog import BATCH_HISTORY
+from song_server.extensions.playlog import rollup_events
+from song_server.extensions.playlog import window_start
+from song_server.extensions.charts import TopSongs
+from song_server.extensions.suggest import PrefixIndex
+from song_server.extensions.dbmonitor import PoolMonitor
+from song_server.extensions.dbmonitor import CommandMonitor
 from song_server.models.user import User
 from song_server.models.song import Song
+from song_server.models.song import SONG_PUBLIC_FIELDS
 from song_server.models.user import UserRoles
 
 
-class DbHelper:
+# Mongo server error code of unique index violations
+DUPLICATE_KEY_ERROR = 11000
+
+
+def create_indexes(db, is_play_log_enabled=False):
+    """
+    Create every index of the songs and users collections,
+    no-op for the indexes that already exist
+
+    :param db: pymongo database
+    :param is_play_log_enabled: bool, creates the play log collections
+    """
+
+    # Set unique keys
+    db['users'].create_index(
+        [("username", pymongo.ASCENDING)], unique=True)
+    db['songs'].create_index(
+        [("name", pymongo.ASCENDING),
+         ("source_url", pymongo.ASCENDING)], unique=True)
+
+    # Keyset pagination index, (name, _id) gives a total order
+    db['songs'].create_index(
+        [("name", pymongo.ASCENDING),
+         ("_id", pymongo.ASCENDING)])
+
+    # Charts indexes
+    db['songs'].create_index([("times_played", pymongo.DESCENDING)])
+    db['songs'].create_index([("num_likes", pymongo.DESCENDING)])
+
+    # Search index, relevance ranked full text search on names
+    db['songs'].create_index([("name", pymongo.TEXT)])
+
+    # Play log, capped raw events and per song hourly / daily rollups
+    if not is_play_log_enabled:
+        return
+
+    if 'play_events' not in db.list_collection_names():
+        db.create_collection(
+            'play_events', capped=True, size=PLAY_EVENTS_MAX_BYTES)
+    for collection in ['song_plays_hourly', 'song_plays_daily']:
+        db[collection].create_index(
+            [("song_id", pymongo.ASCENDING),
+             ("start", pymongo.ASCENDING)], unique=True)
+    db['song_plays_hourly'].create_index(
+        [("start", pymongo.ASCENDING)],
+        expireAfterSeconds=PLAYS_HOURLY_RETENTION_DAYS * 24 * 3600)
+
+
+def _duplicate_indexes(error):
+    """
+    :param error: `BulkWriteError` of an unordered bulk write
+    :return: list, indexes of the requests failed on a duplicate key,
+             re-raises `error` if any request failed on anything else
+    """
+
+    indexes = []
+    for write_error in error.details.get('writeErrors', []):
+        if write_error.get('code') != DUPLICATE_KEY_ERROR:
+            raise error
+        indexes.append(write_error['index'])
+
+    if error.details.get('writeConcernErrors'):
+        raise error
+
+    return indexes
+
+
+class DbHelper(BaseDbHelper):
+
+    """
+    Mongo storage backend
+    """
 
     def __init__(self, flask_app):
+        self._init_client(flask_app)
+        self._init_caches(flask_app)
+
+    def create_indexes(self):
+        # Unique keys, pagination, charts and search indexes
+        create_indexes(self.col_songs.database, self.play_log is not None)
+
+    def reset_after_fork(self, flask_app):
+        """
+        MongoClient isn't fork safe, a worker forked from a preloaded
+        app creates its own client, caches and counter buffer
+        """
+
+        self._init_client(flask_app)
+        self._init_caches(flask_app)
+
+    def _init_client(self, flask_app):
+
+        # Connection pool and command metrics
+        self.pool_monitor = PoolMonitor(flask_app.config['DB_MAX_POOL_SIZE'])
+        self.command_monitor = CommandMonitor()
 
         # Init DB
-        mongo_client = MongoClient(flask_app.config['DB_SOURCE_URL'])
+        compressors = flask_app.config['DB_COMPRESSORS']
+        mongo_client = MongoClient(
+            flask_app.config['DB_SOURCE_URL'],
+            maxPoolSize=flask_app.config['DB_MAX_POOL_SIZE'],
+            minPoolSize=flask_app.config['DB_MIN_POOL_SIZE'],
+            waitQueueTimeoutMS=flask_app.config['DB_WAIT_QUEUE_TIMEOUT_MS'],
+            socketTimeoutMS=flask_app.config['DB_SOCKET_TIMEOUT_MS'],
+            connectTimeoutMS=flask_app.config['DB_CONNECT_TIMEOUT_MS'],
+            event_listeners=[self.pool_monitor, self.command_monitor],
+            **({'compressors': compressors} if compressors else {}))
         db = mongo_client[flask_app.config['DB_NAME']]
 
         # Collections
         self.col_songs = db['songs']
         self.col_users = db['users']
-
-        # Set unique keys
-        self.col_users.create_index(
-            [("username", pymongo.ASCENDING)], unique=True)
-        self.col_songs.create_index(
-            [("name", pymongo.ASCENDING),
-             ("source_url", pymongo.ASCENDING)], unique=True)
+        self.col_counter_shards = db['song_counter_shards']
+        self.col_meta = db['meta']
+        self.col_play_events = db['play_events']
+        self.col_song_plays = {
+            PLAY_PERIOD_HOUR: db['song_plays_hourly'],
+            PLAY_PERIOD_DAY: db['song_plays_daily'],
+        }
+
+    def _init_caches(self, flask_app):
+
+        # Autocomplete index over song names
+        self.suggest_index = PrefixIndex(
+            flask_app.config['SUGGEST_REFRESH_SEC'], self._get_song_names)
+
+        # In memory top charts, {counter field: top songs}
+        self.charts = {
+            field: TopSongs(
+                field,
+                flask_app.config['CHARTS_CAPACITY'],
+                flask_app.config['CHARTS_REFRESH_SEC'],
+                self._get_top_songs)
+            for field in ['times_played', 'num_likes']
+        }
+
+        # Write-behind buffer for plays / likes
+        self.counters = None
+        if flask_app.config['DB_COUNTER_MODE'] == COUNTER_MODE_BUFFERED:
+            self.counters = CounterAggregator(
+                self.col_songs,
+                flask_app.config['DB_COUNTER_FLUSH_INTERVAL_MS'],
+                flask_app.config['DB_COUNTER_FLUSH_MAX_ENTRIES'],
+                on_flush=self._on_counters_flushed)
+
+        # Counter shards of hot songs, for the strict mode
+        self.sharded_counters = None
+        if self.counters is None and flask_app.config['DB_COUNTER_SHARDS'] > 0:
+            self.sharded_counters = ShardedCounters(
+                self.col_songs,
+                self.col_counter_shards,
+                flask_app.config['DB_COUNTER_SHARDS'],
+                flask_app.config['DB_COUNTER_HOT_THRESHOLD'],
+                flask_app.config['DB_COUNTER_FOLD_INTERVAL_MS'],
+                on_fold=self._on_counters_flushed)
+
+        # Play events, written in batches with their rollups
+        self.play_log = None
+        if flask_app.config['PLAY_LOG_ENABLED']:
+            self.play_log = PlayLog(
+                flask_app.config['PLAY_LOG_CAPACITY'],
+                flask_app.config['PLAY_LOG_BATCH_SIZE'],
+                flask_app.config['PLAY_LOG_FLUSH_INTERVAL_MS'],
+                self._write_play_events)
+
+        # Read-through cache of song pages, keyed on the catalog version
+        # shared by the workers, the one of the ETags, and on the local
+        # generation, bumped even if the shared version can't be
+        self.catalog_generation = 0
+        self.page_cache = None
+        if flask_app.config['PAGE_CACHE_SIZE'] > 0:
+            self.page_cache = LruCache(
+                flask_app.config['PAGE_CACHE_SIZE'],
+                flask_app.config['PAGE_CACHE_TTL_SEC'])
+
+        # Catalog version shared by the workers, (version, fetch ts)
+        self.catalog_version_refresh_sec = \
+            flask_app.config['CATALOG_VERSION_REFRESH_SEC']
+        self._catalog_version = (0, float('-inf'))
+
+        # Concurrent misses of the same read share one query
+        self.single_flight = None
+        if flask_app.config['DB_COALESCE_READS']:
+            self.single_flight = SingleFlight()
 
     @staticmethod
-    def _execute_query(collection, find_query, sort_by, page_number=1):
-        return list(collection.find(find_query).sort(sort_by)\
+    def _execute_query(collection, find_query, sort_by, page_number=1,
+                       projection=None):
+        return list(collection.find(find_query, projection).sort(sort_by)\
             .skip((page_number - 1) * DB_ENTRIES_PER_PAGE)\
             .limit(DB_ENTRIES_PER_PAGE))
 
+    @staticmethod
+    def _execute_keyset_query(collection, find_query, sort_by, last_seen=None,
+                              projection=None):
+        """
+        Paginate using a range query on (`sort_by`, _id) instead of skip,
+        Every page costs the same irrespective of its depth
+
+        :param last_seen: dict, `sort_by` and _id of the last item
+                          of the previous page, None for the first page
+        """
+
+        if last_seen is not None:
+            last_key, last_id = last_seen[sort_by], last_seen['_id']
+            find_query = {'$and': [find_query, {'$or': [
+                {sort_by: {'$gt': last_key}},
+                {sort_by: last_key, '_id': {'$gt': last_id}}
+            ]}]}
+
+        return list(collection.find(find_query, projection)
+            .sort([(sort_by, pymongo.ASCENDING), ('_id', pymongo.ASCENDING)])
+            .limit(DB_ENTRIES_PER_PAGE))
+
     def add_item(self, item):
         if item is None:
             return REQUEST_PARSE_ERROR
@@ -44,7 +254,11 @@ class DbHelper:
 
         try:
             if is_song:
-                self.col_songs.insert_one(item.to_json())
+                song = item.to_json()
+                self.col_songs.insert_one(song)
+                self._bump_catalog_generation()
+                self._offer_to_charts([song])
+                self.suggest_index.add(song['name'])
                 return SUCCESS
             if is_user:
                 self.col_users.insert_one(item.to_json())
@@ -65,7 +279,46 @@ class DbHelper:
     Songs Db
     """
 
+    def add_songs(self, songs):
+        """
+        Insert many songs with a single unordered bulk insert
+
+        :param songs: list of valid `Song`
+        :return: list, the error code of every song, in order
+        """
+
+        if not songs:
+            return []
+
+        ret = [SUCCESS] * len(songs)
+        songs = [s.to_json() for s in songs]
+        try:
+            self.col_songs.insert_many(songs, ordered=False)
+        except BulkWriteError as e:
+            for error in e.details.get('writeErrors', []):
+                ret[error['index']] = SONG_EXISTS \
+                    if error.get('code') == DUPLICATE_KEY_ERROR \
+                    else DB_OPERATION_FAILURE
+        except PyMongoError:
+            return [DB_OPERATION_FAILURE] * len(songs)
+
+        if SUCCESS in ret:
+            added = [s for s, code in zip(songs, ret) if code == SUCCESS]
+            self._bump_catalog_generation()
+            self._offer_to_charts(added)
+            self.suggest_index.add_many([s['name'] for s in added])
+
+        return ret
+
+    def get_song(self, song_id):
+        return self.col_songs.find_one({'_id': song_id}, SONG_PUBLIC_FIELDS)
+
     def get_songs(self, page_number=1, explicit_query=False):
+        return self._read_through(
+            ('page', page_number, explicit_query, DB_ENTRIES_PER_PAGE),
+            lambda: self._get_songs(page_number, explicit_query))
+
+    def _get_songs(self, page_number, explicit_query):
 
         explicit_query = {'is_explicit': {'$ne': True}} \
             if explicit_query else {}
@@ -75,9 +328,62 @@ class DbHelper:
             collection=self.col_songs,
             find_query=find_query,
             sort_by='name',
-            page_number=page_number
+            page_number=page_number,
+            projection=SONG_PUBLIC_FIELDS
         )
 
+    def get_songs_after(self, last_seen=None, explicit_query=False):
+        """
+        Cursor based alternative to `get_songs`
+
+        :param last_seen: dict, decoded cursor returned by a previous call,
+                          None to start from the first page
+        :param explicit_query: bool, filters explicit songs when True
+        :return: tuple, (list of songs, next cursor or None if no more pages)
+        """
+
+        last_key = (last_seen['name'], last_seen['_id']) \
+            if last_seen is not None else None
+
+        return self._read_through(
+            ('after', last_key, explicit_query, DB_ENTRIES_PER_PAGE),
+            lambda: self._get_songs_after(last_seen, explicit_query))
+
+    def _get_songs_after(self, last_seen, explicit_query):
+
+        explicit_query = {'is_explicit': {'$ne': True}} \
+            if explicit_query else {}
+        find_query = {**explicit_query}
+
+        songs = self._execute_keyset_query(
+            collection=self.col_songs,
+            find_query=find_query,
+            sort_by='name',
+            last_seen=last_seen,
+            projection=SONG_PUBLIC_FIELDS
+        )
+
+        next_cursor = None
+        if len(songs) >= DB_ENTRIES_PER_PAGE:
+            last = songs[-1]
+            next_cursor = encode_cursor(
+                {'name': last['name'], '_id': last['_id']})
+
+        return songs, next_cursor
+
+    def get_catalog_version(self):
+        version, fetched_ts = self._catalog_version
+        if time.monotonic() - fetched_ts < self.catalog_version_refresh_sec:
+            return version
+
+        return self._coalesce(('catalog_version',),
+                              self._fetch_catalog_version)
+
+    def _fetch_catalog_version(self):
+        doc = self.col_meta.find_one({'_id': 'catalog'}) or {}
+        self._catalog_version = (doc.get('version', 0), time.monotonic())
+        return self._catalog_version[0]
+
     def remove_song(self, song_name, source_url):
         ret = self.col_songs.delete_one(
             {'name': song_name, 'source_url': source_url})
@@ -85,24 +391,333 @@ class DbHelper:
         if ret.deleted_count <= 0:
             return SONG_NOT_FOUND
 
+        self._bump_catalog_generation()
+        for chart in self.charts.values():
+            chart.remove(name=song_name, source_url=source_url)
+        self.suggest_index.remove(song_name)
+
         return SUCCESS
 
+    def search_songs(self, query, limit, explicit_query=False):
+        """
+        Full text search over song names
+
+        :param query: str, the search terms
+        :param limit: int, max number of songs
+        :param explicit_query: bool, filters explicit songs when True
+        :return: list of songs, most relevant first
+        """
+
+        return self._coalesce(
+            ('search', *self._catalog_key(), query, limit, explicit_query),
+            lambda: self._search_songs(query, limit, explicit_query))
+
+    def _search_songs(self, query, limit, explicit_query):
+
+        explicit_query = {'is_explicit': {'$ne': True}} \
+            if explicit_query else {}
+        find_query = {'$text': {'$search': query}, **explicit_query}
+        score = {'score': {'$meta': 'textScore'}}
+
+        return list(self.col_songs.find(
+            find_query, {**SONG_PUBLIC_FIELDS, **score})
+            .sort([('score', {'$meta': 'textScore'})])
+            .limit(limit))
+
+    def suggest_songs(self, prefix, limit):
+        """
+        Autocomplete song names, served from memory
+
+        :param prefix: str, case insensitive name prefix
+        :param limit: int, max number of names
+        :return: list of song names, sorted
+        """
+
+        return self.suggest_index.suggest(prefix, limit)
+
+    def export_songs(self, last_seen=None, explicit_query=False,
+                     batch_size=100):
+        """
+        Iterate over every song, ordered by _id,
+        Songs are fetched lazily `batch_size` at a time
+
+        :param last_seen: dict, _id of the last song of a previous
+                          export, None to export every song,
+                          best-effort since ObjectIds are only
+                          roughly ordered across workers
+        :param explicit_query: bool, filters explicit songs when True
+        :param batch_size: int, songs fetched per db round trip
+        :return: pymongo cursor of songs
+        """
+
+        explicit_query = {'is_explicit': {'$ne': True}} \
+            if explicit_query else {}
+        since_query = {'_id': {'$gt': last_seen['_id']}} \
+            if last_seen is not None else {}
+        find_query = {**explicit_query, **since_query}
+
+        return self.col_songs.find(find_query, SONG_PUBLIC_FIELDS)\
+            .sort('_id', pymongo.ASCENDING)\
+            .batch_size(batch_size)
+
+    def _get_song_names(self):
+        return (s['name'] for s in self.col_songs.find(
+            {}, {'_id': 0, 'name': 1}).batch_size(10000))
+
+    def get_chart(self, field, limit, explicit_query=False):
+        """
+        Top songs by a counter, served from memory
+
+        :param field: str, 'times_played' or 'num_likes'
+        :param limit: int, number of songs, at most MAX_CHART_LIMIT
+        :param explicit_query: bool, filters explicit songs when True
+        :return: list of songs, highest counter first
+        """
+
+        return self.charts[field].top(limit, explicit_query)
+
+    def _get_top_songs(self, field, limit, explicit_query=False):
+        explicit_query = {'is_explicit': {'$ne': True}} \
+            if explicit_query else {}
+
+        return list(self.col_songs.find(explicit_query, SONG_PUBLIC_FIELDS)
+            .sort([(field, pymongo.DESCENDING), ('_id', pymongo.ASCENDING)])
+            .limit(limit))
+
+    def _offer_to_charts(self, songs):
+        for chart in self.charts.values():
+            for song in songs:
+                chart.offer(song)
+
+    def _on_counters_flushed(self, song_ids):
+        # Buffered / sharded increments are only known once written
+        self._offer_to_charts(list(self.col_songs.find(
+            {'_id': {'$in': song_ids}}, SONG_PUBLIC_FIELDS)))
+
+    def _read_through(self, key, query_func):
+        """
+        Serve a songs query from the page cache, run it on a miss
+
+        :param key: tuple, identifies the query
+        :param query_func: callable, runs the query against the db
+        """
+
+        # Key on the version seen before querying, a page read
+        # while the catalog changes is never served as fresh
+        key = (*self._catalog_key(), *key)
+        if self.page_cache is None:
+            return self._coalesce(key, query_func)
+
+        data = self.page_cache.get(key)
+        if data is None:
+            # Only the first miss queries, then fills the cache
+            def load():
+                page = query_func()
+                self.page_cache.put(key, page)
+                return page
+
+            data = self._coalesce(key, load)
+
+        return data
+
+    def _coalesce(self, key, query_func):
+        """
+        Run a read once for all concurrent callers of `key`,
+        they all get the same result object, which must not be mutated
+        """
+
+        if self.single_flight is None:
+            return query_func()
+
+        return self.single_flight.do(key, query_func)
+
+    def _catalog_key(self):
+        # Writes of other workers invalidate the pages of this one once
+        # their shared version is seen, as they do the ETags
+        return self.get_catalog_version(), self.catalog_generation
+
+    def _bump_catalog_generation(self):
+        self.catalog_generation += 1
+
+        # Other workers see the new version on their next refresh
+        try:
+            doc = self.col_meta.find_one_and_update(
+                {'_id': 'catalog'}, {'$inc': {'version': 1}},
+                upsert=True, return_document=ReturnDocument.AFTER)
+            self._catalog_version = (doc['version'], time.monotonic())
+        except PyMongoError:
+            # ETags still expire with the http max age
+            pass
+
     def like_song(self, song_id):
-        ret = self.col_songs.update_one(
-            {'_id': song_id}, {'$inc': {'num_likes': 1}})
-        
-        if ret.modified_count <= 0:
-            return SONG_NOT_FOUND
+        return self._inc_song_counter(song_id, 'num_likes')
+
+    def play_song(self, song_id, user_id=None):
+        if self.play_log is not None:
+            self.play_log.append(song_id, user_id)
+            return SUCCESS
+
+        return self._inc_song_counter(song_id, 'times_played')
+
+    def like_songs(self, increments):
+        return self._inc_song_counters(increments, 'num_likes')
+
+    def play_songs(self, increments, user_id=None):
+        if self.play_log is not None:
+            for song_id, amount in increments.items():
+                self.play_log.append(song_id, user_id, amount)
+            return {song_id: SUCCESS for song_id in increments}
+
+        return self._inc_song_counters(increments, 'times_played')
+
+    def get_song_plays(self, song_id, period, num_periods):
+        if self.play_log is None:
+            return None
+
+        docs = self.col_song_plays[period].find(
+            {'song_id': song_id,
+             'start': {'$gte': window_start(period, num_periods)}},
+            {'_id': 0, 'plays': 1})
+        return sum(doc['plays'] for doc in docs)
+
+    def _write_play_events(self, batch_id, events):
+        """
+        Append a batch of play events and fold it into the
+        hourly / daily rollups and times_played, a few bulk writes
+        per batch instead of an update per play.
+        Every write skips the documents that already got `batch_id`,
+        a batch retried after a failure is counted once
+        """
+
+        # Drop the plays of unknown songs, like a strict update would
+        song_ids = list({event[0] for event in events})
+        found = {s['_id'] for s in self.col_songs.find(
+            {'_id': {'$in': song_ids}}, {'_id': 1})}
+        events = [event for event in events if event[0] in found]
+        if not events:
+            return
 
-        return SUCCESS
+        # Events of a retried batch are duplicate keys
+        try:
+            self.col_play_events.insert_many([{
+                '_id': {'batch_id': batch_id, 'index': i},
+                'song_id': song_id,
+                'user_id': user_id,
+                'ts': datetime.fromtimestamp(ts, timezone.utc),
+                'count': count,
+            } for i, (song_id, user_id, ts, count) in enumerate(events)],
+                ordered=False)
+        except BulkWriteError as e:
+            _duplicate_indexes(e)
+
+        rollups, totals = rollup_events(events)
+        mark_batch = {'$push': {'batches': {
+            '$each': [batch_id], '$slice': -BATCH_HISTORY}}}
+        for period, collection in self.col_song_plays.items():
+            self._upsert_once(collection, [
+                UpdateOne({'song_id': song_id, 'start': start,
+                           'batches': {'$ne': batch_id}},
+                          {'$inc': {'plays': plays}, **mark_batch},
+                          upsert=True)
+                for (p, song_id, start), plays in rollups.items()
+                if p == period])
+
+        self.col_songs.bulk_write(
+            [UpdateOne({'_id': song_id, 'play_batches': {'$ne': batch_id}},
+                       {'$inc': {'times_played': plays},
+                        '$push': {'play_batches': {
+                            '$each': [batch_id], '$slice': -BATCH_HISTORY}}})
+             for song_id, plays in totals.items()],
+            ordered=False)
+        self._on_counters_flushed(list(totals))
 
-    def play_song(self, song_id):
-        ret = self.col_songs.update_one(
-            {'_id': song_id}, {'$inc': {'times_played': 1}})
+    @staticmethod
+    def _upsert_once(collection, requests):
+        """
+        Unordered bulk upserts filtered on a batch marker,
+        A document that already got the batch doesn't match, its upsert
+        is a duplicate key. Duplicates are retried once, in case another
+        worker inserted the document meanwhile, a duplicate again means
+        the batch was applied
+        """
+
+        try:
+            collection.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            duplicates = [requests[i] for i in _duplicate_indexes(e)]
+            try:
+                collection.bulk_write(duplicates, ordered=False)
+            except BulkWriteError as e:
+                _duplicate_indexes(e)
+
+    def _inc_song_counters(self, increments, field):
+        """
+        Increment a counter of many songs with a single bulk write
+
+        :param increments: dict, {song_id: amount}
+        :param field: str, the counter to be incremented
+        :return: dict, {song_id: error code}
+        """
+
+        if not increments:
+            return {}
+
+        song_ids = list(increments.keys())
+        ret = {song_id: SONG_NOT_FOUND for song_id in song_ids}
+
+        # Buffered mode, written by the aggregator
+        # Find the songs that exist, to report the missing ones
+        if self.counters is not None:
+            found = [s['_id'] for s in self.col_songs.find(
+                {'_id': {'$in': song_ids}}, {'_id': 1})]
+            for song_id in found:
+                ret[song_id] = SUCCESS
+                self.counters.add(song_id, field, increments[song_id])
+            return ret
 
-        if ret.modified_count <= 0:
+        try:
+            self.col_songs.bulk_write(
+                [UpdateOne({'_id': song_id},
+                           {'$inc': {field: increments[song_id]}})
+                 for song_id in song_ids],
+                ordered=False)
+        except PyMongoError:
+            return {song_id: DB_OPERATION_FAILURE for song_id in song_ids}
+
+        # Songs that exist, with their updated counters
+        songs = list(self.col_songs.find(
+            {'_id': {'$in': song_ids}}, SONG_PUBLIC_FIELDS))
+        ret.update({s['_id']: SUCCESS for s in songs})
+        self._offer_to_charts(songs)
+
+        return ret
+
+    def _inc_song_counter(self, song_id, field):
+
+        # Buffered mode, written by the aggregator
+        if self.counters is not None:
+            self.counters.add(song_id, field)
+            return SUCCESS
+
+        # Hot song, written to a counter shard
+        sharded = self.sharded_counters
+        if sharded is not None and sharded.add(song_id, field):
+            return SUCCESS
+
+        # Only the counter is read back, the charts know the rest
+        song = self.col_songs.find_one_and_update(
+            {'_id': song_id}, {'$inc': {field: 1}},
+            projection={field: 1},
+            return_document=ReturnDocument.AFTER)
+
+        if song is None:
             return SONG_NOT_FOUND
 
+        if sharded is not None:
+            sharded.record(song_id)
+
+        for chart in self.charts.values():
+            chart.offer_counter(song_id, field, song[field])
         return SUCCESS
 
     """
@@ -120,19 +735,8 @@ class DbHelper:
             page_number=1
         )
 
-    def login_user(self, username, password):
-        user = self.col_users.find_one({'username': username})
-        user = User.from_json(user or {})
-
-        # Error parsing user data or user doesn't exist
-        if user is None:
-            return
-
-        # Password mismatch
-        if not check_password_hash(user.password, password):
-            return
-
-        return user
+    def _find_user(self, username):
+        return self.col_users.find_one({'username': username})
 
     def remove_user(self, username):
         self.col_users.delete_one({'username':username})
@@ -141,13 +745,58 @@ class DbHelper:
     Utils
     """
 
+    def get_stats(self):
+        counters = self.counters.stats() \
+            if self.counters is not None else {}
+
+        page_cache = self.page_cache.stats() \
+            if self.page_cache is not None else {}
+
+        single_flight = self.single_flight.stats() \
+            if self.single_flight is not None else {}
+
+        sharded_counters = self.sharded_counters.stats() \
+            if self.sharded_counters is not None else {}
+
+        play_log = self.play_log.stats() \
+            if self.play_log is not None else {}
+
+        return {
+            'backend': DB_BACKEND_MONGO,
+            'db_pool': self.pool_monitor.stats(),
+            'db_commands': self.command_monitor.stats(),
+            'catalog_generation': self.catalog_generation,
+            'page_cache': page_cache,
+            'single_flight': single_flight,
+            'charts': {f: c.stats() for f, c in self.charts.items()},
+            'suggest_index': self.suggest_index.stats(),
+            'counters': {
+                'mode': COUNTER_MODE_BUFFERED if self.counters is not None
+                else COUNTER_MODE_STRICT,
+                **counters,
+                'sharding': sharded_counters
+            },
+            'play_log': play_log
+        }
+
     def drop_all_collections(self):
         self.col_users.drop()
         self.col_songs.drop()
+        self.col_counter_shards.drop()
+        self.col_meta.drop()
+        self.col_play_events.drop()
+        for collection in self.col_song_plays.values():
+            collection.drop()
 
 
 def init_db(flask_app):
     global db_helper
+    if flask_app.config['DB_BACKEND'] == DB_BACKEND_MEMORY:
+        # Only imported when used
+        from song_server.extensions.memdbhelper import MemoryDbHelper
+        db_helper = MemoryDbHelper(flask_app)
+        return
+
     db_helper = DbHelper(flask_app)
 
 
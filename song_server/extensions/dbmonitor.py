@@ -0,0 +1,164 @@
+import time
+import threading
+from pymongo import monitoring
+
+
+"""
+Pymongo event listeners, measure where db time goes,
+waiting for a pooled connection vs running commands
+
+Pymongo monitoring docs - https://pymongo.readthedocs.io/en/stable/api/pymongo/monitoring.html
+"""
+
+
+# Db time of the commands run by the current thread, in micro seconds
+_thread_db_time = threading.local()
+
+
+def pop_thread_db_time():
+    """
+    Pymongo runs listeners on the thread that sent the command,
+    a request thread can read the db time it spent
+
+    :return: float, seconds spent in commands since the last call
+    """
+
+    micros = getattr(_thread_db_time, 'micros', 0)
+    _thread_db_time.micros = 0
+    return micros / 1000000
+
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+
+    """
+    Tracks connection checkout wait time and pool saturation
+    """
+
+    def __init__(self, max_pool_size):
+
+        self.max_pool_size = max_pool_size
+
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+        self.open_connections = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.num_checkouts = 0
+        self.num_failed_checkouts = 0
+        self.total_wait_ms = 0
+        self.max_wait_ms = 0
+
+    def connection_check_out_started(self, event):
+        self._local.start_ts = time.perf_counter()
+
+    def connection_checked_out(self, event):
+        wait_ms = self._wait_ms()
+        with self._lock:
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.num_checkouts += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def connection_check_out_failed(self, event):
+        wait_ms = self._wait_ms()
+        with self._lock:
+            self.num_failed_checkouts += 1
+            self.total_wait_ms += wait_ms
+            self.max_wait_ms = max(self.max_wait_ms, wait_ms)
+
+    def connection_checked_in(self, event):
+        with self._lock:
+            self.checked_out -= 1
+
+    def connection_created(self, event):
+        with self._lock:
+            self.open_connections += 1
+
+    def connection_closed(self, event):
+        with self._lock:
+            self.open_connections -= 1
+
+    def connection_ready(self, event):
+        pass
+
+    def pool_created(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        pass
+
+    def pool_closed(self, event):
+        pass
+
+    def stats(self):
+        with self._lock:
+            num_checkouts = max(self.num_checkouts, 1)
+            return {
+                'max_pool_size': self.max_pool_size,
+                'open_connections': self.open_connections,
+                'checked_out': self.checked_out,
+                'max_checked_out': self.max_checked_out,
+                'saturation': self.checked_out / self.max_pool_size,
+                'checkouts': self.num_checkouts,
+                'failed_checkouts': self.num_failed_checkouts,
+                'avg_wait_ms': self.total_wait_ms / num_checkouts,
+                'max_wait_ms': self.max_wait_ms,
+            }
+
+    def _wait_ms(self):
+        start_ts = getattr(self._local, 'start_ts', None)
+        if start_ts is None:
+            return 0
+
+        self._local.start_ts = None
+        return (time.perf_counter() - start_ts) * 1000
+
+
+class CommandMonitor(monitoring.CommandListener):
+
+    """
+    Tracks per command latency, as reported by the driver
+    """
+
+    def __init__(self):
+
+        self._lock = threading.Lock()
+
+        # {command name: [count, failures, total ms, max ms]}
+        self._commands = {}
+
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        self._record(event.command_name, event.duration_micros, False)
+
+    def failed(self, event):
+        self._record(event.command_name, event.duration_micros, True)
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {
+                    'count': count,
+                    'failures': failures,
+                    'avg_ms': total_ms / count,
+                    'max_ms': max_ms,
+                }
+                for name, (count, failures, total_ms, max_ms)
+                in self._commands.items()
+            }
+
+    def _record(self, command_name, duration_micros, is_failure):
+        duration_ms = duration_micros / 1000
+        _thread_db_time.micros = \
+            getattr(_thread_db_time, 'micros', 0) + duration_micros
+
+        with self._lock:
+            command = self._commands.setdefault(command_name, [0, 0, 0, 0])
+            command[0] += 1
+            command[1] += int(is_failure)
+            command[2] += duration_ms
+            command[3] = max(command[3], duration_ms)
@@ -1,6 +1,10 @@
 from song_server.shared.utils import populate_admin_user
 from song_server.extensions.jwthelper import init_jwt_manager
+from song_server.extensions.jwthelper import init_identity_cache
 from song_server.extensions.dbhelper import init_db
+from song_server.extensions.hashpool import init_hash_pool
+from song_server.extensions.profiler import init_profiler
+from song_server.extensions.compression import init_compression
 
 
 def init_extensions(app):
@@ -11,8 +15,64 @@ def init_extensions(app):
     # Init Json web tokens
     init_jwt_manager(app)
 
+    # Init password hashing pool
+    init_hash_pool(app)
+
+    # Init the sampling profiler, if enabled
+    init_profiler(app)
+
+    # Init response compression, if enabled
+    init_compression(app)
+
     # Init db
     init_db(app)
 
-    # Init the first admin user
+    # Indexes and the first admin user, unless migrated once per deploy
+    if app.config['DB_MIGRATE_ON_STARTUP']:
+        migrate_db()
+
+
+def migrate_db():
+    """
+    One off db setup, create the indexes and the first admin user,
+    run on startup or by migrate.py
+    """
+
+    from song_server.extensions.dbhelper import db_helper
+    db_helper.create_indexes()
     populate_admin_user()
+
+
+def prepare_extensions_for_fork():
+    """
+    Stop the processes the parent started, before forking workers,
+    forked children would otherwise try to join them on exit
+    """
+
+    from song_server.extensions.hashpool import hash_pool
+    hash_pool.shutdown()
+
+
+def reinit_extensions_after_fork(app):
+    """
+    Recreate the per process state of the extensions,
+    in every worker forked from a preloaded app.
+    Clients, locks, threads and caches of the parent aren't fork safe,
+    the jwt secret and the config are kept, shared by all workers
+    """
+
+    from song_server.extensions.dbhelper import db_helper
+    from song_server.extensions.hashpool import hash_pool
+
+    init_identity_cache(app)
+    init_profiler(app)
+    hash_pool.reset_after_fork()
+    db_helper.reset_after_fork(app)
+
+    metrics = app.extensions.get('metrics')
+    if metrics is not None:
+        metrics.reset()
+
+    compression = app.extensions.get('compression')
+    if compression is not None:
+        compression.reset()
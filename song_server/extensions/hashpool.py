@@ -0,0 +1,163 @@
+import time
+import threading
+from werkzeug.security import check_password_hash
+from werkzeug.security import generate_password_hash
+
+
+class HashPoolSaturated(Exception):
+    """
+    Raised when too many hashes are already pending
+    """
+
+
+class HashPool:
+
+    """
+    Runs the cpu heavy password hashing in a bounded process pool,
+    so login / add user bursts don't starve the request threads.
+    Once `max_pending` hashes are queued or running, new requests are
+    rejected with `HashPoolSaturated` instead of queueing up
+    """
+
+    def __init__(self, num_workers, max_pending, method, salt_length):
+
+        self.num_workers = num_workers
+        self.method = method
+        self.salt_length = salt_length
+
+        # Workers are spawned on first use
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+        self.max_pending = max_pending
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+        # Metrics
+        self._metrics_lock = threading.Lock()
+        self.pending = 0
+        self.max_seen_pending = 0
+        self.num_hashes = 0
+        self.num_rejected = 0
+        self.total_hash_ms = 0
+        self.max_hash_ms = 0
+        self.total_wait_ms = 0
+
+    def generate_password_hash(self, password):
+        return self._run(generate_password_hash, str(password),
+                         self.method, self.salt_length)
+
+    def check_password_hash(self, pwhash, password):
+        return self._run(check_password_hash, pwhash, password)
+
+    def stats(self):
+        with self._metrics_lock:
+            num_hashes = max(self.num_hashes, 1)
+            return {
+                'workers': self.num_workers,
+                'pending': self.pending,
+                'max_pending': self.max_pending,
+                'max_seen_pending': self.max_seen_pending,
+                'hashes': self.num_hashes,
+                'rejected': self.num_rejected,
+                'avg_hash_ms': self.total_hash_ms / num_hashes,
+                'max_hash_ms': self.max_hash_ms,
+                'avg_wait_ms': self.total_wait_ms / num_hashes,
+            }
+
+    def shutdown(self):
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown()
+                self._executor = None
+
+    def reset_after_fork(self):
+        """
+        A forked worker can't use the executor or locks of its parent
+        """
+
+        # Kept alive, collecting it would wake up the parent's pool
+        self._parent_executor = self._executor
+        self._executor = None
+        self._executor_lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        self._metrics_lock = threading.Lock()
+        self.pending = 0
+
+    def _run(self, func, *args):
+
+        # Back-pressure, reject instead of queueing
+        if not self._slots.acquire(blocking=False):
+            with self._metrics_lock:
+                self.num_rejected += 1
+            raise HashPoolSaturated()
+
+        with self._metrics_lock:
+            self.pending += 1
+            self.max_seen_pending = max(self.max_seen_pending, self.pending)
+
+        start_ts = time.perf_counter()
+        hash_sec = 0
+        try:
+            executor = self._get_executor()
+            if executor is None:
+                ret, hash_sec = _timed_call(func, *args)
+            else:
+                ret, hash_sec = executor.submit(
+                    _timed_call, func, *args).result()
+        finally:
+            self._slots.release()
+            self._record(start_ts, hash_sec)
+
+        return ret
+
+    def _record(self, start_ts, hash_sec):
+        total_ms = (time.perf_counter() - start_ts) * 1000
+        hash_ms = hash_sec * 1000
+
+        with self._metrics_lock:
+            self.pending -= 1
+            self.num_hashes += 1
+            self.total_hash_ms += hash_ms
+            self.max_hash_ms = max(self.max_hash_ms, hash_ms)
+            self.total_wait_ms += max(total_ms - hash_ms, 0)
+
+    def _get_executor(self):
+        if self.num_workers <= 0:
+            return None
+
+        with self._executor_lock:
+            if self._executor is None:
+                # Imported on first use, keeps the app startup short
+                import multiprocessing
+                from concurrent.futures import ProcessPoolExecutor
+
+                # Spawn, workers don't inherit the app's threads or sockets
+                self._executor = ProcessPoolExecutor(
+                    self.num_workers,
+                    mp_context=multiprocessing.get_context('spawn'))
+
+            return self._executor
+
+
+def _timed_call(func, *args):
+    # Runs in the worker process
+    start_ts = time.perf_counter()
+    ret = func(*args)
+    return ret, time.perf_counter() - start_ts
+
+
+def init_hash_pool(flask_app):
+    global hash_pool
+
+    # A single pool per process
+    if hash_pool is not None:
+        return
+
+    hash_pool = HashPool(
+        flask_app.config['HASH_POOL_WORKERS'],
+        flask_app.config['HASH_POOL_MAX_PENDING'],
+        flask_app.config['HASH_METHOD'],
+        flask_app.config['HASH_SALT_LENGTH'])
+
+
+hash_pool = None
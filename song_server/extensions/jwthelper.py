@@ -1,6 +1,7 @@
 from flask_jwt_extended import JWTManager
 
 from song_server.shared.utils import get_secret_key
+from song_server.shared.cache import LruCache
 
 
 """
@@ -12,3 +13,12 @@ JWT basic usage - https://flask-jwt-extended.readthedocs.io/en/stable/basic_usag
 def init_jwt_manager(app):
     app.config['JWT_SECRET_KEY'] = get_secret_key()
     JWTManager(app)
+    init_identity_cache(app)
+
+
+def init_identity_cache(app):
+    # Token signature -> decoded user, used by `parse_user`
+    app.extensions['jwt_identity_cache'] = LruCache(
+        app.config['JWT_IDENTITY_CACHE_SIZE'],
+        app.config['JWT_IDENTITY_CACHE_TTL_SEC']) \
+        if app.config['JWT_IDENTITY_CACHE_SIZE'] > 0 else None
@@ -0,0 +1,430 @@
+import re
+import time
+import heapq
+import bisect
+import threading
+from bson import ObjectId
+
+from song_server.shared.configs import *
+from song_server.shared.errorcodes import *
+from song_server.shared.utils import encode_cursor
+from song_server.extensions.dbbase import BaseDbHelper
+from song_server.extensions.suggest import PrefixIndex
+from song_server.extensions.playlog import rollup_events
+from song_server.extensions.playlog import window_start
+from song_server.models.user import User
+from song_server.models.song import Song
+from song_server.models.song import SONG_PUBLIC_FIELDS
+from song_server.models.user import UserRoles
+
+
+def _id_key(_id):
+    """
+    Sort key of an _id, numbers < strings < ObjectIds as in Mongo
+    """
+
+    if isinstance(_id, ObjectId):
+        return 2, _id
+    if isinstance(_id, str):
+        return 1, _id
+
+    return 0, _id
+
+
+class MemoryCollection:
+
+    """
+    Thread safe in memory collection,
+    Documents are indexed by _id, by a unique key and by a sort key,
+    every read returns copies
+    """
+
+    def __init__(self, unique_fields, sort_field):
+        """
+        :param unique_fields: tuple, fields of the unique key
+        :param sort_field: str, field of the ordered index
+        """
+
+        self.unique_fields = unique_fields
+        self.sort_field = sort_field
+        self.lock = threading.RLock()
+        self.drop()
+
+    def drop(self):
+        with self.lock:
+            self._docs = {}
+            self._unique = {}
+            # Sorted list of (sort field, _id key)
+            self._sorted = []
+
+            # Bumped by every insert / delete, not by counter updates
+            self.version = getattr(self, 'version', 0) + 1
+
+    def count(self):
+        return len(self._docs)
+
+    def insert_one(self, doc):
+        """
+        :param doc: dict, an ObjectId _id is generated if missing
+        :return: bool, False if the _id or unique key already exists
+        """
+
+        doc = dict(doc)
+        doc.setdefault('_id', ObjectId())
+        unique_key = self._unique_key(doc)
+
+        with self.lock:
+            if doc['_id'] in self._docs or unique_key in self._unique:
+                return False
+
+            self._docs[doc['_id']] = doc
+            self._unique[unique_key] = doc['_id']
+            bisect.insort(self._sorted, self._sort_key(doc))
+            self.version += 1
+
+        return True
+
+    def insert_many(self, docs):
+        return [self.insert_one(doc) for doc in docs]
+
+    def find_one(self, _id):
+        with self.lock:
+            doc = self._docs.get(_id)
+            return dict(doc) if doc is not None else None
+
+    def find_unique(self, *values):
+        with self.lock:
+            _id = self._unique.get(values)
+            return dict(self._docs[_id]) if _id is not None else None
+
+    def find_all(self, match):
+        """
+        :param match: callable, filters documents
+        :return: list of matching documents, unordered
+        """
+
+        with self.lock:
+            return [dict(d) for d in self._docs.values() if match(d)]
+
+    def find_sorted(self, match, after=None, skip=0, limit=None):
+        """
+        Scan the ordered index
+
+        :param match: callable, filters documents
+        :param after: tuple, (sort field, _id key) to start after,
+                      None to start from the first document
+        :param skip: int, matching documents to skip
+        :param limit: int, max number of documents, None for all
+        :return: list of documents, ordered by (sort field, _id)
+        """
+
+        ret = []
+        with self.lock:
+            index = bisect.bisect_right(self._sorted, after) \
+                if after is not None else 0
+
+            for index in range(index, len(self._sorted)):
+                if limit is not None and len(ret) >= limit:
+                    break
+
+                doc = self._docs[self._sorted[index][1][1]]
+                if not match(doc):
+                    continue
+                if skip > 0:
+                    skip -= 1
+                    continue
+
+                ret.append(dict(doc))
+
+        return ret
+
+    def inc(self, _id, field, amount=1):
+        """
+        :return: dict, the updated document or None if it doesn't exist
+        """
+
+        with self.lock:
+            doc = self._docs.get(_id)
+            if doc is None:
+                return None
+
+            doc[field] = doc.get(field, 0) + amount
+            return dict(doc)
+
+    def delete_unique(self, *values):
+        """
+        :return: bool, False if no document has this unique key
+        """
+
+        with self.lock:
+            _id = self._unique.pop(values, None)
+            if _id is None:
+                return False
+
+            doc = self._docs.pop(_id)
+            index = bisect.bisect_left(self._sorted, self._sort_key(doc))
+            del self._sorted[index]
+            self.version += 1
+
+        return True
+
+    def _unique_key(self, doc):
+        return tuple(doc.get(f) for f in self.unique_fields)
+
+    def _sort_key(self, doc):
+        return doc.get(self.sort_field), _id_key(doc['_id'])
+
+
+_databases = {}
+_databases_lock = threading.Lock()
+
+
+def get_memory_database(db_name):
+    """
+    Collections of a memory db, shared by every helper of the process
+    like a db server would be, {collection name: `MemoryCollection`}
+    """
+
+    with _databases_lock:
+        if db_name not in _databases:
+            _databases[db_name] = {
+                'songs': MemoryCollection(('name', 'source_url'), 'name'),
+                'users': MemoryCollection(('username',), 'username'),
+            }
+
+        return _databases[db_name]
+
+
+def _public(song):
+    return {k: v for k, v in song.items() if k in SONG_PUBLIC_FIELDS}
+
+
+def _explicit_match(explicit_query):
+    if explicit_query:
+        return lambda s: s.get('is_explicit') is not True
+
+    return lambda s: True
+
+
+class MemoryDbHelper(BaseDbHelper):
+
+    """
+    In process storage backend, for tests and benchmarks,
+    Counters and play rollups are always written through,
+    DB_COUNTER_MODE and PLAY_LOG_ENABLED are ignored
+    """
+
+    def __init__(self, flask_app):
+
+        db = get_memory_database(flask_app.config['DB_NAME'])
+
+        # Collections
+        self.col_songs = db['songs']
+        self.col_users = db['users']
+
+        # Autocomplete index over song names
+        self.suggest_index = PrefixIndex(
+            flask_app.config['SUGGEST_REFRESH_SEC'], self._get_song_names)
+
+        # Play rollups, {(period, song_id): {period start: plays}}
+        self._song_plays = {}
+        self._song_plays_lock = threading.Lock()
+
+    def add_item(self, item):
+        if item is None:
+            return REQUEST_PARSE_ERROR
+
+        if isinstance(item, Song):
+            song = item.to_json()
+            if not self.col_songs.insert_one(song):
+                return SONG_EXISTS
+
+            self.suggest_index.add(song['name'])
+            return SUCCESS
+
+        if isinstance(item, User):
+            if not self.col_users.insert_one(item.to_json()):
+                return USERNAME_EXISTS
+            return SUCCESS
+
+        return REQUEST_PARSE_ERROR
+
+    """
+    Songs Db
+    """
+
+    def add_songs(self, songs):
+        ret = []
+        added_names = []
+        for song in songs:
+            song = song.to_json()
+            if not self.col_songs.insert_one(song):
+                ret.append(SONG_EXISTS)
+                continue
+
+            added_names.append(song['name'])
+            ret.append(SUCCESS)
+
+        self.suggest_index.add_many(added_names)
+        return ret
+
+    def get_song(self, song_id):
+        song = self.col_songs.find_one(song_id)
+        return _public(song) if song is not None else None
+
+    def get_songs(self, page_number=1, explicit_query=False):
+        songs = self.col_songs.find_sorted(
+            _explicit_match(explicit_query),
+            skip=(page_number - 1) * DB_ENTRIES_PER_PAGE,
+            limit=DB_ENTRIES_PER_PAGE)
+
+        return [_public(s) for s in songs]
+
+    def get_songs_after(self, last_seen=None, explicit_query=False):
+        after = (last_seen['name'], _id_key(last_seen['_id'])) \
+            if last_seen is not None else None
+
+        songs = self.col_songs.find_sorted(
+            _explicit_match(explicit_query),
+            after=after,
+            limit=DB_ENTRIES_PER_PAGE)
+
+        next_cursor = None
+        if len(songs) >= DB_ENTRIES_PER_PAGE:
+            last = songs[-1]
+            next_cursor = encode_cursor(
+                {'name': last['name'], '_id': last['_id']})
+
+        return [_public(s) for s in songs], next_cursor
+
+    def remove_song(self, song_name, source_url):
+        if not self.col_songs.delete_unique(song_name, source_url):
+            return SONG_NOT_FOUND
+
+        self.suggest_index.remove(song_name)
+        return SUCCESS
+
+    def search_songs(self, query, limit, explicit_query=False):
+        """
+        Scored by the number of query terms in the song name,
+        no stemming or stop words unlike the Mongo text index
+        """
+
+        terms = set(re.findall(r'\w+', query.casefold()))
+        is_allowed = _explicit_match(explicit_query)
+
+        def score(song):
+            return len(terms.intersection(
+                re.findall(r'\w+', song['name'].casefold())))
+
+        songs = self.col_songs.find_all(
+            lambda s: is_allowed(s) and score(s) > 0)
+        songs = [{**_public(s), 'score': float(score(s))} for s in songs]
+        songs.sort(key=lambda s: (-s['score'], s['name']))
+
+        return songs[:limit]
+
+    def suggest_songs(self, prefix, limit):
+        return self.suggest_index.suggest(prefix, limit)
+
+    def export_songs(self, last_seen=None, explicit_query=False,
+                     batch_size=100):
+        is_allowed = _explicit_match(explicit_query)
+        if last_seen is not None:
+            last_key = _id_key(last_seen['_id'])
+
+            def match(s):
+                return is_allowed(s) and _id_key(s['_id']) > last_key
+        else:
+            match = is_allowed
+
+        songs = self.col_songs.find_all(match)
+        songs.sort(key=lambda s: _id_key(s['_id']))
+
+        return (_public(s) for s in songs)
+
+    def _get_song_names(self):
+        return (s['name'] for s in self.col_songs.find_all(lambda s: True))
+
+    def get_chart(self, field, limit, explicit_query=False):
+        songs = self.col_songs.find_all(_explicit_match(explicit_query))
+        songs = heapq.nsmallest(
+            limit, songs, key=lambda s: (-s[field], _id_key(s['_id'])))
+
+        return [_public(s) for s in songs]
+
+    def like_song(self, song_id):
+        return self._inc_song_counter(song_id, 'num_likes')
+
+    def play_song(self, song_id, user_id=None):
+        return self.play_songs({song_id: 1}, user_id)[song_id]
+
+    def like_songs(self, increments):
+        return self._inc_song_counters(increments, 'num_likes')
+
+    def play_songs(self, increments, user_id=None):
+        ret = self._inc_song_counters(increments, 'times_played')
+
+        now = time.time()
+        rollups, _ = rollup_events(
+            [(song_id, user_id, now, amount)
+             for song_id, amount in increments.items()
+             if ret[song_id] == SUCCESS])
+        with self._song_plays_lock:
+            for (period, song_id, start), plays in rollups.items():
+                song_plays = self._song_plays.setdefault((period, song_id), {})
+                song_plays[start] = song_plays.get(start, 0) + plays
+
+        return ret
+
+    def get_catalog_version(self):
+        return self.col_songs.version
+
+    def get_song_plays(self, song_id, period, num_periods):
+        since = window_start(period, num_periods)
+        with self._song_plays_lock:
+            song_plays = self._song_plays.get((period, song_id), {})
+            return sum(plays for start, plays in song_plays.items()
+                       if start >= since)
+
+    def _inc_song_counters(self, increments, field):
+        return {song_id: self._inc_song_counter(song_id, field, amount)
+                for song_id, amount in increments.items()}
+
+    def _inc_song_counter(self, song_id, field, amount=1):
+        if self.col_songs.inc(song_id, field, amount) is None:
+            return SONG_NOT_FOUND
+
+        return SUCCESS
+
+    """
+    Users Db
+    """
+
+    def get_users(self, is_admin_only=False):
+        match = (lambda u: u.get('user_role') == UserRoles.UR_ADMIN.value) \
+            if is_admin_only else (lambda u: True)
+
+        return self.col_users.find_sorted(match, limit=DB_ENTRIES_PER_PAGE)
+
+    def _find_user(self, username):
+        return self.col_users.find_unique(username)
+
+    def remove_user(self, username):
+        self.col_users.delete_unique(username)
+
+    """
+    Utils
+    """
+
+    def get_stats(self):
+        return {
+            'backend': DB_BACKEND_MEMORY,
+            'songs': self.col_songs.count(),
+            'users': self.col_users.count(),
+            'suggest_index': self.suggest_index.stats(),
+        }
+
+    def drop_all_collections(self):
+        self.col_users.drop()
+        self.col_songs.drop()
@@ -0,0 +1,250 @@
+import time
+import bisect
+import threading
+from flask import current_app
+
+from song_server.shared import errorcodes
+from song_server.extensions.dbmonitor import pop_thread_db_time
+
+
+"""
+Request metrics, exposed in the Prometheus text format on /metrics
+Prometheus exposition format - https://prometheus.io/docs/instrumenting/exposition_formats/
+"""
+
+
+# Error code -> name, ex: -3001 -> 'SONG_EXISTS'
+ERROR_CODE_NAMES = {
+    v: k for k, v in vars(errorcodes).items()
+    if k.isupper() and isinstance(v, int)
+}
+
+
+class EndpointMetrics:
+
+    """
+    Metrics of a single endpoint,
+    Histogram buckets are not cumulative, the last one is +Inf
+    """
+
+    def __init__(self, num_buckets):
+        self.count = 0
+        self.latency = [0] * (num_buckets + 1)
+        self.latency_sum = 0
+        self.db = [0] * (num_buckets + 1)
+        self.db_sum = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.statuses = {}
+
+    def snapshot(self):
+        return {
+            'count': self.count,
+            'latency': list(self.latency),
+            'latency_sum': self.latency_sum,
+            'db': list(self.db),
+            'db_sum': self.db_sum,
+            'request_bytes': self.request_bytes,
+            'response_bytes': self.response_bytes,
+            'statuses': dict(self.statuses),
+        }
+
+
+class Metrics:
+
+    """
+    Per endpoint latency / db time histograms, request / response size,
+    status code and error code counters,
+    A single lock held for a few increments per request
+    """
+
+    def __init__(self, buckets):
+        """
+        :param buckets: sorted list of histogram bounds, in seconds
+        """
+
+        self.buckets = list(buckets)
+        self.reset()
+
+    def reset(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self._error_codes = {}
+
+    def observe(self, endpoint, status, duration, db_duration,
+                request_bytes, response_bytes):
+        """
+        :param endpoint: str, flask endpoint name
+        :param status: int, http status code
+        :param duration: float, request time in seconds
+        :param db_duration: float, db time of the request in seconds
+        """
+
+        latency_index = bisect.bisect_left(self.buckets, duration)
+        db_index = bisect.bisect_left(self.buckets, db_duration)
+
+        with self._lock:
+            metrics = self._endpoints.get(endpoint)
+            if metrics is None:
+                metrics = EndpointMetrics(len(self.buckets))
+                self._endpoints[endpoint] = metrics
+
+            metrics.count += 1
+            metrics.latency[latency_index] += 1
+            metrics.latency_sum += duration
+            metrics.db[db_index] += 1
+            metrics.db_sum += db_duration
+            metrics.request_bytes += request_bytes
+            metrics.response_bytes += response_bytes
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+
+    def record_error_code(self, code):
+        with self._lock:
+            self._error_codes[code] = self._error_codes.get(code, 0) + 1
+
+    def render(self):
+        """
+        :return: str, all metrics in the Prometheus text format
+        """
+
+        with self._lock:
+            endpoints = sorted(
+                (name, m.snapshot()) for name, m in self._endpoints.items())
+            error_codes = sorted(self._error_codes.items())
+
+        lines = []
+        for name, key, help_text in [
+            ('song_server_request_duration_seconds', 'latency',
+             'Request latency, streamed bodies excluded'),
+            ('song_server_db_duration_seconds', 'db',
+             'Db time per request'),
+        ]:
+            lines += [f'# HELP {name} {help_text}',
+                      f'# TYPE {name} histogram']
+            for endpoint, metrics in endpoints:
+                lines += self._render_histogram(
+                    name, endpoint, metrics[key],
+                    metrics[f'{key}_sum'], metrics['count'])
+
+        for name, key, help_text in [
+            ('song_server_request_bytes_total', 'request_bytes',
+             'Request body bytes'),
+            ('song_server_response_bytes_total', 'response_bytes',
+             'Response body bytes, streamed responses excluded'),
+        ]:
+            lines += [f'# HELP {name} {help_text}',
+                      f'# TYPE {name} counter']
+            lines += [f'{name}{{endpoint="{endpoint}"}} {metrics[key]}'
+                      for endpoint, metrics in endpoints]
+
+        name = 'song_server_requests_total'
+        lines += [f'# HELP {name} Requests by status code',
+                  f'# TYPE {name} counter']
+        for endpoint, metrics in endpoints:
+            lines += [
+                f'{name}{{endpoint="{endpoint}",status="{status}"}} {count}'
+                for status, count in sorted(metrics['statuses'].items())]
+
+        name = 'song_server_error_codes_total'
+        lines += [f'# HELP {name} Api error codes returned',
+                  f'# TYPE {name} counter']
+        lines += [
+            f'{name}{{code="{code}",'
+            f'name="{ERROR_CODE_NAMES.get(code, "UNKNOWN")}"}} {count}'
+            for code, count in error_codes]
+
+        return '\n'.join(lines) + '\n'
+
+    def _render_histogram(self, name, endpoint, counts, total, count):
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + ['+Inf'], counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{endpoint="{endpoint}",'
+                         f'le="{bound}"}} {cumulative}')
+
+        lines.append(f'{name}_sum{{endpoint="{endpoint}"}} {total}')
+        lines.append(f'{name}_count{{endpoint="{endpoint}"}} {count}')
+        return lines
+
+
+class MetricsMiddleware:
+
+    """
+    Wsgi middleware timing every request,
+    Reads everything from the environ and start_response, flask's
+    context proxies cost microseconds per access on the hot path
+    """
+
+    def __init__(self, wsgi_app, metrics):
+        self.wsgi_app = wsgi_app
+        self.metrics = metrics
+
+    def __call__(self, environ, start_response):
+        start_ts = time.perf_counter()
+
+        # Db time of a previous request served by this thread
+        pop_thread_db_time()
+
+        response = []
+
+        def _start_response(status, headers, exc_info=None):
+            # Flask drops the request from the environ once it returns
+            request = environ.get('werkzeug.request')
+            rule = request.url_rule if request is not None else None
+            response.append(rule.endpoint if rule is not None else None)
+            response.append(status)
+            response.append(headers)
+            return start_response(status, headers, exc_info)
+
+        try:
+            return self.wsgi_app(environ, _start_response)
+        finally:
+            # Also recorded when an exception reaches the wsgi server,
+            # no response was started, counted as a 500
+            self._observe(environ, response, start_ts)
+
+    def _observe(self, environ, response, start_ts):
+        duration = time.perf_counter() - start_ts
+
+        endpoint, status, headers = response[-3:] if response \
+            else (None, '500', [])
+        response_bytes = 0
+        for key, value in headers:
+            if key == 'Content-Length':
+                response_bytes = int(value)
+                break
+
+        request_bytes = environ.get('CONTENT_LENGTH')
+        self.metrics.observe(
+            endpoint or 'unmatched',
+            int(status[:3]),
+            duration,
+            pop_thread_db_time(),
+            int(request_bytes) if request_bytes else 0,
+            response_bytes)
+
+
+def _metrics_view():
+    return current_app.response_class(
+        current_app.extensions['metrics'].render(),
+        mimetype='text/plain; version=0.0.4')
+
+
+def record_error_code(code):
+    """
+    Count an api error code, no-op if metrics are disabled
+    """
+
+    metrics = current_app.extensions.get('metrics')
+    if metrics is not None and isinstance(code, int):
+        metrics.record_error_code(code)
+
+
+def init_metrics(app):
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    app.extensions['metrics'] = Metrics(app.config['METRICS_BUCKETS_SEC'])
+    app.wsgi_app = MetricsMiddleware(app.wsgi_app, app.extensions['metrics'])
+    app.add_url_rule('/metrics', 'metrics', _metrics_view)
@@ -0,0 +1,208 @@
+import time
+import atexit
+import threading
+import collections
+from datetime import datetime
+from datetime import timezone
+from datetime import timedelta
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+
+from song_server.shared.configs import PLAY_PERIOD_DAY
+from song_server.shared.configs import PLAY_PERIOD_HOUR
+
+
+"""
+Append only log of song plays,
+Events are (song_id, user_id, unix timestamp, count) tuples, buffered
+in memory and written in large batches, rolled up into per song hourly
+and daily play counts.
+Every batch has an id, a failed batch is retried with the same id and
+the writes skip what it already applied
+"""
+
+# Batch ids kept per rollup / song document, to skip applied batches
+BATCH_HISTORY = 32
+
+
+def period_start(ts, period):
+    """
+    :param ts: float, unix timestamp
+    :param period: str, PLAY_PERIOD_HOUR or PLAY_PERIOD_DAY
+    :return: datetime, naive utc start of the hour / day of `ts`
+    """
+
+    start = datetime.fromtimestamp(ts, timezone.utc).replace(
+        minute=0, second=0, microsecond=0, tzinfo=None)
+    if period == PLAY_PERIOD_DAY:
+        start = start.replace(hour=0)
+
+    return start
+
+
+def window_start(period, num_periods, ts=None):
+    """
+    Start of the current period and the `num_periods` - 1 before it
+
+    :return: datetime, naive utc
+    """
+
+    step = timedelta(days=1) if period == PLAY_PERIOD_DAY \
+        else timedelta(hours=1)
+    start = period_start(time.time() if ts is None else ts, period)
+    return start - step * (num_periods - 1)
+
+
+def rollup_events(events):
+    """
+    :param events: list of (song_id, user_id, ts, count)
+    :return: tuple, ({(period, song_id, period start): plays},
+                     {song_id: plays})
+    """
+
+    rollups = collections.Counter()
+    totals = collections.Counter()
+    for song_id, _, ts, count in events:
+        for period in [PLAY_PERIOD_HOUR, PLAY_PERIOD_DAY]:
+            rollups[(period, song_id, period_start(ts, period))] += count
+        totals[song_id] += count
+
+    return rollups, totals
+
+
+class PlayLog:
+
+    """
+    Ring buffer of play events, flushed by a background thread every
+    `flush_interval_ms` or as soon as `batch_size` events are pending,
+    Holds at most `capacity` events, the oldest are dropped first
+    """
+
+    def __init__(self, capacity, batch_size, flush_interval_ms, write_func):
+        """
+        :param write_func: callable(batch_id, events), writes a batch of
+                           at most `batch_size` events with its rollups,
+                           idempotent for a given `batch_id`
+        """
+
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval_sec = flush_interval_ms / 1000
+        self._write_func = write_func
+
+        self._events = collections.deque(maxlen=capacity)
+
+        # [(batch id, events)] of failed writes, retried first, as is
+        self._failed = collections.deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+
+        # Metrics
+        self.num_appended = 0
+        self.num_dropped = 0
+        self.num_flushed = 0
+        self.num_batches = 0
+        self.num_failed_batches = 0
+        self.max_flush_ms = 0
+
+        # Background flusher
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name='play-log', daemon=True)
+        self._thread.start()
+
+        # Flush whatever is left on shutdown
+        atexit.register(self.close)
+
+    def append(self, song_id, user_id=None, count=1):
+        with self._lock:
+            if len(self._events) == self.capacity:
+                self.num_dropped += 1
+            self._events.append((song_id, user_id, time.time(), count))
+            self.num_appended += 1
+            is_full = len(self._events) >= self.batch_size
+
+        if is_full:
+            self._wakeup.set()
+
+    def flush(self):
+        """
+        Write all pending events, in batches of `batch_size`
+
+        :return: int, number of events flushed
+        """
+
+        with self._flush_lock:
+            with self._lock:
+                events = list(self._events)
+                self._events.clear()
+                batches = list(self._failed)
+                self._failed.clear()
+
+            batches += [(ObjectId(), events[i:i + self.batch_size])
+                        for i in range(0, len(events), self.batch_size)]
+
+            num_flushed = 0
+            start_ts = time.monotonic()
+            for i, (batch_id, batch) in enumerate(batches):
+                try:
+                    self._write_func(batch_id, batch)
+                except PyMongoError:
+                    # Db unreachable, retried on the next flush
+                    self.num_failed_batches += 1
+                    self._requeue(batches[i:])
+                    return num_flushed
+
+                self.num_batches += 1
+                self.num_flushed += len(batch)
+                num_flushed += len(batch)
+
+            self.max_flush_ms = max(
+                self.max_flush_ms, (time.monotonic() - start_ts) * 1000)
+            return num_flushed
+
+    def close(self):
+        """
+        Stop the background flusher and flush pending events
+        """
+
+        if self._stopped.is_set():
+            return
+
+        self._stopped.set()
+        self._wakeup.set()
+        self._thread.join()
+        self.flush()
+
+    def stats(self):
+        with self._lock:
+            num_pending = len(self._events) + \
+                sum(len(batch) for _, batch in self._failed)
+
+        return {
+            'pending': num_pending,
+            'capacity': self.capacity,
+            'appended': self.num_appended,
+            'dropped': self.num_dropped,
+            'flushed': self.num_flushed,
+            'batches': self.num_batches,
+            'failed_batches': self.num_failed_batches,
+            'max_flush_ms': self.max_flush_ms,
+        }
+
+    def _requeue(self, batches):
+        # Kept whole with their ids, the oldest are dropped past capacity
+        with self._lock:
+            self._failed.extend(batches)
+            num_pending = sum(len(batch) for _, batch in self._failed)
+            while num_pending > self.capacity:
+                _, batch = self._failed.popleft()
+                num_pending -= len(batch)
+                self.num_dropped += len(batch)
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval_sec)
+            self._wakeup.clear()
+            self.flush()
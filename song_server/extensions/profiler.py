@@ -0,0 +1,93 @@
+import os
+import sys
+import time
+import threading
+
+
+"""
+On demand sampling profiler, for live workers,
+Output is in the collapsed stack format read by flamegraph tools
+FlameGraph - https://github.com/brendangregg/FlameGraph
+"""
+
+
+class SamplingProfiler:
+
+    """
+    Samples the stack of every thread at a fixed interval,
+    Nothing runs outside of a profile, one profile at a time
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+
+        # {code object: frame label}
+        self._labels = {}
+
+    def profile(self, duration_sec, interval_ms):
+        """
+        Sample for `duration_sec`, blocks the calling thread
+
+        :param duration_sec: float, length of the profile
+        :param interval_ms: float, time between two samples
+        :return: dict, {collapsed stack: number of samples},
+                 None if a profile is already running
+        """
+
+        if not self._lock.acquire(blocking=False):
+            return None
+
+        try:
+            stacks = {}
+            own_ident = threading.get_ident()
+            end_ts = time.monotonic() + duration_sec
+
+            while time.monotonic() < end_ts:
+                for ident, frame in sys._current_frames().items():
+                    if ident == own_ident:
+                        continue
+
+                    stack = self._collapse(frame)
+                    stacks[stack] = stacks.get(stack, 0) + 1
+
+                time.sleep(interval_ms / 1000)
+
+            return stacks
+        finally:
+            self._lock.release()
+
+    @staticmethod
+    def format(stacks):
+        """
+        :param stacks: dict, returned by `profile`
+        :return: str, one 'frame;frame;frame count' line per stack,
+                 most sampled first
+        """
+
+        lines = [f'{stack} {count}' for stack, count in
+                 sorted(stacks.items(), key=lambda s: -s[1])]
+        return '\n'.join(lines) + '\n' if lines else ''
+
+    def _collapse(self, frame):
+        labels = []
+        while frame is not None:
+            labels.append(self._label(frame.f_code))
+            frame = frame.f_back
+
+        return ';'.join(reversed(labels))
+
+    def _label(self, code):
+        label = self._labels.get(code)
+        if label is None:
+            path = code.co_filename.split(os.sep)
+            label = f'{code.co_name} ({"/".join(path[-2:])}:' \
+                    f'{code.co_firstlineno})'
+            self._labels[code] = label
+
+        return label
+
+
+def init_profiler(app):
+    # Disabled by default, no profiler exists at all
+    if app.config['PROFILER_ENABLED']:
+        app.extensions['profiler'] = SamplingProfiler()
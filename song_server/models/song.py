@@ -2,6 +2,18 @@ from song_server.shared.configs import *
 from song_server.shared.utils import is_type_valid
 
 
+# Song fields returned by the api, used as db projection
+SONG_PUBLIC_FIELDS = {
+    '_id': 1,
+    'name': 1,
+    'cover_url': 1,
+    'source_url': 1,
+    'is_explicit': 1,
+    'times_played': 1,
+    'num_likes': 1,
+}
+
+
 class Song:
 
     """
@@ -41,6 +41,33 @@ class UserRoles(Enum):
         """
         return self in [self.UR_ADMIN, self.UR_MAINTENANCE]
 
+    def can_view_stats(self):
+        """
+        Privilege check to view internal server stats
+
+        :return: bool, True if user can view stats,
+                       False otherwise
+        """
+        return self == self.UR_ADMIN
+
+    def can_export_songs(self):
+        """
+        Privilege check to export the whole songs catalog
+
+        :return: bool, True if user can export songs,
+                       False otherwise
+        """
+        return self == self.UR_ADMIN
+
+    def can_profile(self):
+        """
+        Privilege check to profile the live server
+
+        :return: bool, True if user can profile the server,
+                       False otherwise
+        """
+        return self == self.UR_ADMIN
+
     @classmethod
     def has_value(cls, value):
         """
@@ -78,6 +105,15 @@ class User:
     def can_add_songs(self):
         return self.user_role.can_add_song()
 
+    def can_view_stats(self):
+        return self.user_role.can_view_stats()
+
+    def can_export_songs(self):
+        return self.user_role.can_export_songs()
+
+    def can_profile(self):
+        return self.user_role.can_profile()
+
     def _get_user_role(self, user_role):
         if user_role is None:
             return UserRoles.UR_USER
@@ -130,6 +166,43 @@ class User:
 
         return None
 
+    @staticmethod
+    def from_claims(data):
+        """
+        Build a user from the jwt identity created by `to_claims`,
+        The password isn't part of the claims
+        """
+
+        if not isinstance(data, dict):
+            return None
+
+        try:
+            user_role = data['role']
+            if not UserRoles.has_value(user_role):
+                return None
+
+            return User(
+                user_id=data['id'],
+                username=data['username'],
+                password=None,
+                user_role=user_role,
+            )
+        except (KeyError, TypeError):
+            pass
+
+        return None
+
+    def to_claims(self):
+        """
+        Minimal identity stored in access tokens
+        """
+
+        return {
+            'id': self.user_id,
+            'username': self.username,
+            'role': self.user_role.value
+        }
+
     def to_json(self):
         cls_vars = vars(self)
         data = {k: v for k, v in cls_vars.items() if k not in ['user_role', 'user_id']}
@@ -0,0 +1,160 @@
+from flask import g
+from flask import abort
+from flask import request
+from flask import jsonify
+from flask import Response
+from flask import Blueprint
+from flask import current_app
+from flask import stream_with_context
+from bson import ObjectId
+
+from song_server.shared.errorcodes import *
+from song_server.shared.configs import *
+from song_server.shared.utils import encode_cursor
+from song_server.shared.utils import decode_cursor
+from song_server.shared.utils import parse_int
+from song_server.shared.serializers import dump_json
+from song_server.shared.decorators import parse_user
+from song_server.extensions.dbhelper import db_helper
+from song_server.extensions.hashpool import hash_pool
+
+bp_admin = Blueprint('admin', __name__)
+
+
+"""
+Admin Service
+"""
+
+
+@bp_admin.route('/stats')
+@parse_user
+def get_stats():
+    """
+    Internal server stats, admin only
+    Request type: GET
+
+    Headers,
+    - access_key: str, the access token, required
+    """
+
+    if not g.user.can_view_stats():
+        abort(400, PRIVILEGE_ERROR)
+
+    compression = current_app.extensions.get('compression')
+    return jsonify({'data': {
+        **db_helper.get_stats(),
+        'hash_pool': hash_pool.stats(),
+        'compression': compression.stats() if compression else None
+    }}), 200
+
+
+@bp_admin.route('/export_songs')
+@parse_user
+def export_songs():
+    """
+    Stream the whole songs catalog as newline delimited json,
+    Songs are ordered by id, the last line holds the `next_since`
+    marker to export only the songs added after this export,
+    `since` is best-effort: ObjectIds are made by each worker's clock
+    and are only roughly ordered, a song inserted while the previous
+    export ran may be missed, run a full export to resync
+    Request type: GET
+
+    Headers,
+    - access_key: str, the access token, required
+
+    Query Params,
+    - is_filter_explicit: bool, 'true' filters explicit songs,
+                          'false' by default
+    - since: str, `next_since` of a previous export, optional
+    - batch_size: int, songs fetched per db round trip,
+                  EXPORT_BATCH_SIZE by default, at most MAX_EXPORT_BATCH_SIZE
+    """
+
+    if not g.user.can_export_songs():
+        abort(400, PRIVILEGE_ERROR)
+
+    is_filter_explicit = request.args.get('is_filter_explicit', 'false')
+    since = request.args.get('since')
+    batch_size = parse_int(request.args.get(
+        'batch_size', str(current_app.config['EXPORT_BATCH_SIZE'])),
+        1, MAX_EXPORT_BATCH_SIZE)
+
+    # Value checks
+    if is_filter_explicit not in ['true', 'false']:
+        abort(400, INVALID_DATA_FORMAT)
+    if batch_size is None:
+        abort(400, INVALID_DATA_FORMAT)
+
+    last_seen = None
+    if since:
+        last_seen = decode_cursor(since, {'_id': (str, ObjectId)})
+        if last_seen is None:
+            abort(400, INVALID_CURSOR)
+
+    songs = db_helper.export_songs(
+        last_seen, is_filter_explicit == 'true', batch_size)
+
+    def generate():
+        # One chunk per db batch, memory use doesn't grow with the catalog
+        lines = []
+        last_id = None
+        for song in songs:
+            last_id = song['_id']
+            lines.append(dump_json(song))
+            if len(lines) >= batch_size:
+                yield b'\n'.join(lines) + b'\n'
+                lines = []
+
+        next_since = encode_cursor({'_id': last_id}) \
+            if last_id is not None else since
+        lines.append(dump_json({'next_since': next_since}))
+        yield b'\n'.join(lines) + b'\n'
+
+    return Response(stream_with_context(generate()),
+                    mimetype='application/x-ndjson')
+
+
+@bp_admin.route('/profile')
+@parse_user
+def profile():
+    """
+    Sample the stacks of every thread of this worker for a while,
+    returns them as collapsed stacks, the input format of flamegraph tools,
+    Disabled unless PROFILER_ENABLED is set
+    Request type: GET
+
+    Headers,
+    - access_key: str, the access token, required
+
+    Query Params,
+    - seconds: int, length of the profile, 10 by default,
+               at most MAX_PROFILE_SEC
+    - interval_ms: int, time between two samples, 10 by default,
+                   from MIN_PROFILE_INTERVAL_MS to MAX_PROFILE_INTERVAL_MS
+    """
+
+    if not g.user.can_profile():
+        abort(400, PRIVILEGE_ERROR)
+
+    profiler = current_app.extensions.get('profiler')
+    if profiler is None:
+        abort(404, FEATURE_DISABLED)
+
+    seconds = parse_int(
+        request.args.get('seconds', '10'), 1, MAX_PROFILE_SEC)
+    interval_ms = parse_int(request.args.get('interval_ms', '10'),
+                            MIN_PROFILE_INTERVAL_MS, MAX_PROFILE_INTERVAL_MS)
+
+    # Value checks
+    if seconds is None:
+        abort(400, INVALID_DATA_FORMAT)
+    if interval_ms is None:
+        abort(400, INVALID_DATA_FORMAT)
+
+    # Another profile is running
+    stacks = profiler.profile(seconds, interval_ms)
+    if stacks is None:
+        abort(429, SERVER_BUSY)
+
+    return Response(profiler.format(stacks), mimetype='text/plain')
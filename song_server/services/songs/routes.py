@@ -1,12 +1,21 @@
+import time
+from flask import g
 from flask import abort
 from flask import request
 from flask import jsonify
 from flask import Blueprint
+from flask import current_app
+from bson import ObjectId
 
 from song_server.shared.errorcodes import *
 from song_server.shared.configs import *
-from song_server.shared.utils import parse_json
 from song_server.shared.utils import is_type_valid
+from song_server.shared.utils import decode_cursor
+from song_server.shared.utils import parse_int
+from song_server.shared.utils import iter_ndjson
+from song_server.shared.serializers import list_response
+from song_server.shared.serializers import negotiate_mimetype
+from song_server.shared.serializers import WIRE_FORMATS
 from song_server.shared.decorators import body_sanity_check
 from song_server.shared.decorators import parse_user
 from song_server.extensions.dbhelper import db_helper
@@ -24,30 +33,246 @@ Songs Service
 def get_all_songs():
     """
     Return a list of all songs in the db paginated,
-    Request type: GET, body optional
+    Request type: GET, cacheable by http caches / CDNs
+
+    Query Params (optional),
+    - page: int, 1 by default
+    - is_filter_explicit: bool, 'true' filters explicit songs,
+                          'false' by default
+    - cursor: str, enables cursor pagination when present,
+              empty for the first page, `next_cursor` of the
+              previous response for the following pages.
+              `page` is ignored in cursor mode
+
+    Body Keys (optional, deprecated, responses aren't cacheable),
+    - page_number, is_filter_explicit, cursor: same as the query params
+
+    Headers (optional),
+    - Accept: application/json by default, application/msgpack or
+              application/cbor for the same data in a binary format
+
+    The ETag changes with the catalog version and every
+    SONGS_HTTP_MAX_AGE_SEC, If-None-Match answers 304 without a db read,
+    SONGS_HTTP_MAX_AGE_SEC 0 disables caching
+    """
+
+    # Legacy clients send the filters in a json body
+    body = request.get_json(silent=True)
+    if body is not None:
+        page_number, is_filter_explicit, cursor = _get_songs_body(body)
+    else:
+        page_number = parse_int(
+            request.args.get('page', '1'), 1, MAX_PAGE_NUMBER)
+        is_filter_explicit = request.args.get('is_filter_explicit', 'false')
+        cursor = request.args.get('cursor')
+
+        # Value checks
+        if page_number is None:
+            abort(400, INVALID_DATA_FORMAT)
+        if is_filter_explicit not in ['true', 'false']:
+            abort(400, INVALID_DATA_FORMAT)
+        is_filter_explicit = is_filter_explicit == 'true'
+
+    last_seen = None
+    if cursor:
+        last_seen = decode_cursor(
+            cursor, {'name': str, '_id': (str, ObjectId)})
+        if last_seen is None:
+            abort(400, INVALID_CURSOR)
+
+    # Same catalog, time bucket and format, same pages,
+    # compressed responses carry the weak form of the ETag
+    mimetype = negotiate_mimetype()
+    max_age = current_app.config['SONGS_HTTP_MAX_AGE_SEC']
+    is_cacheable = body is None and max_age > 0
+    etag = None
+    if is_cacheable:
+        etag = f'{db_helper.get_catalog_version()}-' \
+               f'{int(time.time() // max_age)}-{WIRE_FORMATS[mimetype][0]}'
+
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        response = current_app.response_class(status=304)
+        response.vary.add('Accept')
+    elif cursor is not None:
+        # Cursor mode, resume after the last song of the previous page
+        data, next_cursor = db_helper.get_songs_after(
+            last_seen, is_filter_explicit)
+        response = list_response({
+            'data': data,
+            'next_cursor': next_cursor
+        }, 200, mimetype)
+    else:
+        data = db_helper.get_songs(page_number, is_filter_explicit)
+        response = list_response({'data': data}, 200, mimetype)
+
+    if not is_cacheable:
+        # Shared caches key on the url only, not on the body
+        response.cache_control.no_store = True
+        return response
+
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    return response
+
+
+def _get_songs_body(body):
+    """
+    Filters of the deprecated json body of /get_songs
 
-    Body Keys (optional),
-    - is_filter_explicit: bool, False by default, filters explicit songs when True
-    - page_number: int, 1 by default
+    :return: tuple, (page_number, is_filter_explicit, cursor)
     """
 
-    # Process query filters if any
-    body = request.get_json() or {}
+    if not isinstance(body, dict):
+        abort(400, INVALID_DATA_FORMAT)
+
     is_filter_explicit = body.get('is_filter_explicit') or False
     page_number = body.get('page_number') or 1
+    cursor = body.get('cursor')
 
     # Type checks
     if not is_type_valid(is_filter_explicit, bool):
         abort(400, INVALID_DATA_FORMAT)
-    if not is_type_valid(page_number, int):
+    if not is_type_valid(page_number, int) or \
+            isinstance(page_number, bool):
+        abort(400, INVALID_DATA_FORMAT)
+    if not is_type_valid(cursor, str):
+        abort(400, INVALID_DATA_FORMAT)
+
+    if not 0 < page_number <= MAX_PAGE_NUMBER:
+        abort(400, INVALID_DATA_FORMAT)
+
+    # Cursor mode when the key is present, even if empty
+    if 'cursor' in body and cursor is None:
+        cursor = ''
+
+    return page_number, is_filter_explicit, cursor
+
+
+@bp_songs.route('/charts')
+def get_charts():
+    """
+    Return the most played or most liked songs,
+    Request type: GET
+
+    Query Params,
+    - by: str, 'plays' or 'likes', required
+    - limit: int, number of songs, 10 by default, at most MAX_CHART_LIMIT
+    - is_filter_explicit: bool, 'true' filters explicit songs,
+                          'false' by default
+    """
+
+    fields = {'plays': 'times_played', 'likes': 'num_likes'}
+    field = fields.get(request.args.get('by'))
+    limit = parse_int(request.args.get('limit', '10'), 1, MAX_CHART_LIMIT)
+    is_filter_explicit = request.args.get('is_filter_explicit', 'false')
+
+    # Value checks
+    if field is None:
+        abort(400, INVALID_DATA_FORMAT)
+    if limit is None:
+        abort(400, INVALID_DATA_FORMAT)
+    if is_filter_explicit not in ['true', 'false']:
+        abort(400, INVALID_DATA_FORMAT)
+
+    data = db_helper.get_chart(
+        field, limit, is_filter_explicit == 'true')
+    return list_response({'data': data}, 200)
+
+
+@bp_songs.route('/song_plays')
+def get_song_plays():
+    """
+    Return the number of plays of a song in a recent time window,
+    served from the hourly / daily play rollups
+    Request type: GET
+
+    Query Params,
+    - song_id: str, id of the song, required
+    - period: str, 'hour' or 'day', required
+    - count: int, the current period and the count - 1 before it,
+             1 by default, at most MAX_PLAY_WINDOW_HOURS / DAYS
+    """
+
+    max_counts = {PLAY_PERIOD_HOUR: MAX_PLAY_WINDOW_HOURS,
+                  PLAY_PERIOD_DAY: MAX_PLAY_WINDOW_DAYS}
+    song_id = request.args.get('song_id', '')
+    period = request.args.get('period')
+    count = request.args.get('count', '1')
+
+    # Value checks
+    if not 0 < len(song_id) <= MAX_SONG_ID_LEN:
+        abort(400, INVALID_SONG_DETAILS)
+    if period not in max_counts:
+        abort(400, INVALID_DATA_FORMAT)
+    count = parse_int(count, 1, max_counts[period])
+    if count is None:
         abort(400, INVALID_DATA_FORMAT)
+    if db_helper.get_song(song_id) is None:
+        abort(400, SONG_NOT_FOUND)
+
+    plays = db_helper.get_song_plays(song_id, period, count)
+    if plays is None:
+        abort(404, FEATURE_DISABLED)
+
+    return jsonify({'data': {'song_id': song_id, 'period': period,
+                             'count': count, 'plays': plays}}), 200
+
+
+@bp_songs.route('/search_songs')
+def search_songs():
+    """
+    Full text search over song names, most relevant first
+    Request type: GET
+
+    Query Params,
+    - q: str, the search terms, required
+    - limit: int, number of songs, DB_ENTRIES_PER_PAGE by default,
+             at most MAX_SEARCH_LIMIT
+    - is_filter_explicit: bool, 'true' filters explicit songs,
+                          'false' by default
+    """
+
+    query = request.args.get('q', '').strip()
+    limit = parse_int(request.args.get(
+        'limit', str(DB_ENTRIES_PER_PAGE)), 1, MAX_SEARCH_LIMIT)
+    is_filter_explicit = request.args.get('is_filter_explicit', 'false')
 
-    if page_number <= 0:
+    # Value checks
+    if not 0 < len(query) <= MAX_SONG_NAME_LEN:
+        abort(400, INVALID_DATA_FORMAT)
+    if limit is None:
+        abort(400, INVALID_DATA_FORMAT)
+    if is_filter_explicit not in ['true', 'false']:
         abort(400, INVALID_DATA_FORMAT)
 
-    data = db_helper.get_songs(
-        page_number, is_filter_explicit)
-    return jsonify({'data': parse_json(data)}), 201
+    data = db_helper.search_songs(
+        query, limit, is_filter_explicit == 'true')
+    return list_response({'data': data}, 200)
+
+
+@bp_songs.route('/suggest')
+def suggest_songs():
+    """
+    Autocomplete song names
+    Request type: GET
+
+    Query Params,
+    - prefix: str, case insensitive start of the song name, required
+    - limit: int, number of names, 10 by default, at most MAX_SUGGEST_LIMIT
+    """
+
+    prefix = request.args.get('prefix', '')
+    limit = parse_int(request.args.get('limit', '10'), 1, MAX_SUGGEST_LIMIT)
+
+    # Value checks
+    if not 0 < len(prefix) <= MAX_SONG_NAME_LEN or '\0' in prefix:
+        abort(400, INVALID_DATA_FORMAT)
+    if limit is None:
+        abort(400, INVALID_DATA_FORMAT)
+
+    data = db_helper.suggest_songs(prefix, limit)
+    return list_response({'data': data}, 200)
 
 
 @bp_songs.route('/add_song', methods=['POST'])
@@ -69,7 +294,7 @@ def add_new_song():
     """
 
     # Confirm if the user can add songs
-    if not add_new_song.user.can_add_songs():
+    if not g.user.can_add_songs():
         abort(400, PRIVILEGE_ERROR)
 
     body = request.get_json()
@@ -90,6 +315,69 @@ def add_new_song():
     return jsonify({"message": "New song added"}), 201
 
 
+@bp_songs.route('/add_songs', methods=['POST'])
+@parse_user
+def add_new_songs():
+    """
+    Bulk add songs to the db,
+    The body is streamed and inserted in batches, so any number
+    of songs can be uploaded in a single request
+    Request type: POST, Content-Type: application/x-ndjson
+
+    Headers,
+    - access_key: str, the access token, required
+
+    Body, one json song per line with keys,
+    - name: str, name of the new song, required
+    - cover_url: str, song cover url, required
+    - source_url: str, song source url, required
+    - is_explicit: bool, True if song is explicit, False by default, optional
+
+    Returns the number of songs added, and the line index
+    and error code of every song that wasn't added
+    """
+
+    # Confirm if the user can add songs
+    if not g.user.can_add_songs():
+        abort(400, PRIVILEGE_ERROR)
+
+    num_added = 0
+    errors = []
+
+    def insert_batch(batch):
+        codes = db_helper.add_songs([song for _, song in batch])
+        for (index, _), code in zip(batch, codes):
+            if code != SUCCESS:
+                errors.append({'index': index, 'code': code})
+
+        return codes.count(SUCCESS)
+
+    batch = []
+    lines = iter_ndjson(request.stream, MAX_NDJSON_LINE_LEN)
+    for index, data in lines:
+        if not isinstance(data, dict):
+            errors.append({'index': index, 'code': INVALID_DATA_FORMAT})
+            continue
+
+        new_song = Song(data.get('name'), data.get('cover_url'),
+                        data.get('source_url'),
+                        is_explicit=data.get('is_explicit') or False)
+        if not all([new_song.name, new_song.cover_url, new_song.source_url]) \
+                or not new_song.is_valid():
+            errors.append({'index': index, 'code': INVALID_SONG_DETAILS})
+            continue
+
+        batch.append((index, new_song))
+        if len(batch) >= SONGS_INSERT_BATCH_SIZE:
+            num_added += insert_batch(batch)
+            batch = []
+
+    num_added += insert_batch(batch)
+    errors.sort(key=lambda e: e['index'])
+
+    return jsonify({"num_added": num_added, "errors": errors}), 201
+
+
 @bp_songs.route('/like_song', methods=['POST'])
 @parse_user
 @body_sanity_check(['song_id'])
@@ -141,8 +429,103 @@ def play_song():
         abort(400, INVALID_SONG_DETAILS)
 
     # Play the requested song
-    ret = db_helper.play_song(song_id)
+    ret = db_helper.play_song(song_id, g.user.user_id)
     if ret != SUCCESS:
         abort(400, ret)
 
     return jsonify({"message": "Song played"}), 201
+
+
+@bp_songs.route('/like_songs', methods=['POST'])
+@parse_user
+@body_sanity_check(['songs'])
+def like_songs():
+    """
+    Like many songs at once
+    Request Type: POST
+
+    Headers,
+    - access_key: str, the access token, required
+
+    Body Keys,
+    - songs: list, required, at most MAX_SONGS_PER_BATCH entries of,
+        - song_id: str, id of the song to be liked, required
+        - count: int, number of likes, 1 by default
+
+    Returns the error code of every entry, in request order
+    """
+
+    results = _apply_song_batch(
+        request.get_json()['songs'], db_helper.like_songs)
+    return jsonify({"data": results}), 201
+
+
+@bp_songs.route('/play_songs', methods=['POST'])
+@parse_user
+@body_sanity_check(['songs'])
+def play_songs():
+    """
+    Play many songs at once
+    Request Type: POST
+
+    Headers,
+    - access_key: str, the access token, required
+
+    Body Keys,
+    - songs: list, required, at most MAX_SONGS_PER_BATCH entries of,
+        - song_id: str, id of the song to be played, required
+        - count: int, number of plays, 1 by default
+
+    Returns the error code of every entry, in request order
+    """
+
+    user_id = g.user.user_id
+    results = _apply_song_batch(
+        request.get_json()['songs'],
+        lambda increments: db_helper.play_songs(increments, user_id))
+    return jsonify({"data": results}), 201
+
+
+def _apply_song_batch(entries, apply_func):
+    """
+    Validate a batch of {song_id, count} entries,
+    apply the valid ones with a single db call
+
+    :param entries: list, the request entries
+    :param apply_func: callable, takes {song_id: count},
+                       returns {song_id: error code}
+    :return: list, [{song_id, code}] for every entry
+    """
+
+    if not isinstance(entries, list):
+        abort(400, INVALID_DATA_FORMAT)
+    if not 0 < len(entries) <= MAX_SONGS_PER_BATCH:
+        abort(400, INVALID_DATA_FORMAT)
+
+    # Validate entries, merge counts of repeated songs
+    codes = []
+    increments = {}
+    for entry in entries:
+        song_id = entry.get('song_id') if isinstance(entry, dict) else None
+        count = entry.get('count', 1) if isinstance(entry, dict) else None
+
+        if not isinstance(song_id, str) or len(song_id) > MAX_SONG_ID_LEN:
+            codes.append(INVALID_SONG_DETAILS)
+        elif not isinstance(count, int) or isinstance(count, bool) \
+                or not 0 < count <= MAX_BATCH_ITEM_COUNT:
+            codes.append(INVALID_DATA_FORMAT)
+        else:
+            codes.append(None)
+            increments[song_id] = increments.get(song_id, 0) + count
+
+    ret = apply_func(increments)
+
+    results = []
+    for entry, code in zip(entries, codes):
+        song_id = entry.get('song_id') if isinstance(entry, dict) else None
+        results.append({
+            'song_id': song_id,
+            'code': ret[song_id] if code is None else code
+        })
+
+    return results
@@ -1,3 +1,4 @@
+from flask import g
 from flask import abort
 from flask import request
 from flask import jsonify
@@ -10,6 +11,8 @@ from song_server.shared.utils import is_type_valid
 from song_server.shared.decorators import body_sanity_check
 from song_server.shared.decorators import parse_user
 from song_server.extensions.dbhelper import db_helper
+from song_server.extensions.hashpool import hash_pool
+from song_server.extensions.hashpool import HashPoolSaturated
 from song_server.models.user import User
 
 bp_user = Blueprint('user', __name__)
@@ -49,11 +52,15 @@ def user_login():
     if 0 >= len(password) > MAX_PASSWORD_LEN:
         abort(400, SIGN_IN_FAILURE)
 
-    user = db_helper.login_user(username, password)
+    try:
+        user = db_helper.login_user(username, password)
+    except HashPoolSaturated:
+        abort(429, SERVER_BUSY)
+
     if not user:
         abort(401, SIGN_IN_FAILURE)
 
-    access_key = create_access_token(user.to_json())
+    access_key = create_access_token(user.to_claims())
     ret = {
         "message": "successful login",
         "access_key": access_key
@@ -77,7 +84,7 @@ def add_new_user():
     - password: str, password of the new user unencrypted, required
     """
 
-    if not add_new_user.user.can_add_users():
+    if not g.user.can_add_users():
         abort(400, PRIVILEGE_ERROR)
 
     body = request.get_json()
@@ -85,10 +92,16 @@ def add_new_user():
     password = body['password']
 
     # Create a new user
-    new_user = User(username, password, is_text_password=True)
+    new_user = User(username, password)
     if not new_user.is_valid():
         abort(400, INVALID_USER_DETAILS)
 
+    # Hash the password only once the user is known to be valid
+    try:
+        new_user.password = hash_pool.generate_password_hash(password)
+    except HashPoolSaturated:
+        abort(429, SERVER_BUSY)
+
     ret = db_helper.add_item(new_user)
     if ret != SUCCESS:
         # User addition failed
@@ -0,0 +1,154 @@
+import time
+import threading
+from collections import OrderedDict
+
+
+class LruCache:
+
+    """
+    Thread safe, bounded LRU cache with a per entry time to live
+    """
+
+    def __init__(self, max_size, ttl_sec):
+
+        self.max_size = max_size
+        self.ttl_sec = ttl_sec
+
+        # {key: (expiry_ts, value)}, least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None):
+        """
+        Get the value cached for `key`
+
+        :return: the cached value, `default` if missing or expired
+        """
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expiry_ts, value = entry
+            if expiry_ts <= time.monotonic():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return default
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_sec, value)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            size = len(self._entries)
+
+        return {
+            'size': size,
+            'max_size': self.max_size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+        }
+
+
+class SingleFlight:
+
+    """
+    Coalesces concurrent calls for the same key, thread safe,
+    The first caller runs the function, callers arriving while it runs
+    wait for it and share its result, or its exception
+    """
+
+    def __init__(self):
+
+        # {key: in flight `_Flight`}
+        self._flights = {}
+        self._lock = threading.Lock()
+
+        # Metrics
+        self.calls = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+
+    def do(self, key, func):
+        """
+        :param key: hashable, identifies the call
+        :param func: callable, run once for concurrent callers of `key`
+        :return: the result of `func`
+        """
+
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = _Flight()
+                self._flights[key] = flight
+                self.calls += 1
+                is_leader = True
+            else:
+                flight.waiters += 1
+                self.coalesced += 1
+                self.max_waiters = max(self.max_waiters, flight.waiters)
+                is_leader = False
+
+        if not is_leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func()
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            # Later callers start a new call
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+        return flight.result
+
+    def stats(self):
+        with self._lock:
+            in_flight = len(self._flights)
+
+        return {
+            'in_flight': in_flight,
+            'calls': self.calls,
+            'coalesced': self.coalesced,
+            'max_waiters': self.max_waiters,
+        }
+
+
+class _Flight:
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.waiters = 0
+        self.result = None
+        self.error = None
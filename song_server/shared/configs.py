@@ -11,6 +11,15 @@ MAX_SONG_NAME_LEN = 100
 MIN_URL_LENGTH = 3
 MAX_URL_LENGTH = 100
 MAX_SONG_ID_LEN = 20
+MAX_SONGS_PER_BATCH = 100
+MAX_CHART_LIMIT = 100
+MAX_SEARCH_LIMIT = 50
+MAX_SUGGEST_LIMIT = 20
+MAX_EXPORT_BATCH_SIZE = 10000
+MAX_PAGE_NUMBER = 10 ** 9
+MAX_BATCH_ITEM_COUNT = 1000
+MAX_NDJSON_LINE_LEN = 4096
+SONGS_INSERT_BATCH_SIZE = 1000
 
 # User Configs
 MIN_USERNAME_LEN = 5
@@ -23,8 +32,25 @@ NUM_SONGS = 2500
 NUM_USERS = 250
 COMMON_USER_PASSWORD = 'password'
 
+# Play Log Configs
+PLAY_PERIOD_HOUR = 'hour'
+PLAY_PERIOD_DAY = 'day'
+MAX_PLAY_WINDOW_HOURS = 48
+MAX_PLAY_WINDOW_DAYS = 90
+PLAY_EVENTS_MAX_BYTES = 1024 ** 3
+PLAYS_HOURLY_RETENTION_DAYS = 7
+
+# Profiler Configs
+MAX_PROFILE_SEC = 60
+MIN_PROFILE_INTERVAL_MS = 1
+MAX_PROFILE_INTERVAL_MS = 1000
+
 # DB Configs
 DB_ENTRIES_PER_PAGE = 25
+COUNTER_MODE_STRICT = 'strict'
+COUNTER_MODE_BUFFERED = 'buffered'
+DB_BACKEND_MONGO = 'mongo'
+DB_BACKEND_MEMORY = 'memory'
 
 # Tests
 DATA_FILE_SONGS = 'tests/data/songs.json'
@@ -44,15 +70,135 @@ class DefaultConfig:
     SECRET_KEY = os.urandom(24)
     SESSION_COOKIE_SECURE = True
 
+    # Cache of decoded access tokens, 0 disables caching
+    JWT_IDENTITY_CACHE_SIZE = 4096
+    JWT_IDENTITY_CACHE_TTL_SEC = 60
+
     # DB Configs
+    # Storage backend, 'mongo' or 'memory',
+    # the memory backend keeps the catalog in process and is lost on exit
+    DB_BACKEND = os.environ.get('DB_BACKEND', DB_BACKEND_MONGO)
     DB_SOURCE_URL = 'mongodb://localhost:27017'
     DB_NAME = 'songs_db'
 
+    # Index creation and the first admin user, on every app start,
+    # Turn off to run them once per deploy with migrate.py instead,
+    # the memory backend starts empty and needs them on startup
+    DB_MIGRATE_ON_STARTUP = \
+        os.environ.get('DB_MIGRATE_ON_STARTUP', '1') == '1'
+
+    # Mongo client, pymongo defaults unless set
+    # Compressors is a comma separated list, ex: 'zstd,snappy,zlib'
+    DB_MAX_POOL_SIZE = 100
+    DB_MIN_POOL_SIZE = 0
+    DB_WAIT_QUEUE_TIMEOUT_MS = None
+    DB_SOCKET_TIMEOUT_MS = None
+    DB_CONNECT_TIMEOUT_MS = 20000
+    DB_COMPRESSORS = None
+
+    # Song counters (plays, likes)
+    # strict: every play / like is written through to the db
+    # buffered: increments are merged in memory and flushed periodically,
+    #           unknown song ids are not reported as SONG_NOT_FOUND
+    DB_COUNTER_MODE = COUNTER_MODE_STRICT
+    DB_COUNTER_FLUSH_INTERVAL_MS = 500
+    DB_COUNTER_FLUSH_MAX_ENTRIES = 1000
+
+    # Sharded counters for hot songs, strict mode only, 0 disables
+    # Above DB_COUNTER_HOT_THRESHOLD plays / likes per second in a worker,
+    # the increments of a song go to one of DB_COUNTER_SHARDS documents,
+    # folded into the song every DB_COUNTER_FOLD_INTERVAL_MS
+    DB_COUNTER_SHARDS = 0
+    DB_COUNTER_HOT_THRESHOLD = 50
+    DB_COUNTER_FOLD_INTERVAL_MS = 1000
+
+    # Play event log, mongo backend only
+    # Plays are appended to an in process ring buffer, the oldest events
+    # are dropped once it is full. Events are flushed in batches to the
+    # capped play_events collection, and rolled into hourly / daily play
+    # counts and times_played. Unknown song ids are dropped at flush,
+    # not reported as SONG_NOT_FOUND
+    PLAY_LOG_ENABLED = False
+    PLAY_LOG_CAPACITY = 100000
+    PLAY_LOG_BATCH_SIZE = 5000
+    PLAY_LOG_FLUSH_INTERVAL_MS = 1000
+
+    # Songs page cache, 0 disables caching
+    # Plays / likes may be stale for up to the ttl
+    PAGE_CACHE_SIZE = 256
+    PAGE_CACHE_TTL_SEC = 5
+
+    # Concurrent identical song reads share a single db query
+    DB_COALESCE_READS = True
+
+    # Shared catalog version, read from the db at most every refresh
+    CATALOG_VERSION_REFRESH_SEC = 1
+
+    # Http caching of /get_songs, responses are public for max age,
+    # the ETag changes with the catalog version and every max age,
+    # so plays / likes may be stale for up to the max age, 0 disables it
+    SONGS_HTTP_MAX_AGE_SEC = 5
+
+    # Response compression negotiated with Accept-Encoding
+    # gzip always, br / zstd when the brotli / zstandard packages are
+    # installed. Json responses under COMPRESSION_MIN_BYTES are sent as is
+    COMPRESSION_ENABLED = True
+    COMPRESSION_MIN_BYTES = 1024
+    COMPRESSION_GZIP_LEVEL = 6
+    COMPRESSION_BROTLI_LEVEL = 5
+    COMPRESSION_ZSTD_LEVEL = 3
+
+    # Compressed bytes of responses with a strong ETag, 0 disables caching
+    COMPRESSION_CACHE_SIZE = 256
+    COMPRESSION_CACHE_TTL_SEC = 30
+
+    # Top charts, songs kept in memory per chart
+    # must be >= MAX_CHART_LIMIT, reloaded from the db every refresh
+    CHARTS_CAPACITY = 200
+    CHARTS_REFRESH_SEC = 60
+
+    # Autocomplete index, rebuilt from the db in the background
+    SUGGEST_REFRESH_SEC = 300
+
+    # Catalog export, songs fetched per db round trip
+    EXPORT_BATCH_SIZE = 1000
+
+    # Request metrics on /metrics, latency histogram bounds in seconds
+    METRICS_ENABLED = True
+    METRICS_BUCKETS_SEC = [0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                           0.1, 0.25, 0.5, 1, 2.5, 5, 10]
+
+    # Admin sampling profiler on /profile, off by default
+    PROFILER_ENABLED = False
+
+    # Production server, serve.py
+    # Every worker runs its own hash pool of HASH_POOL_WORKERS processes
+    SERVE_BIND = '127.0.0.1:5000'
+    SERVE_WORKERS = os.cpu_count() or 1
+    SERVE_THREADS = 8
+    SERVE_TIMEOUT_SEC = 30
+
+    # Password hashing, runs in a process pool
+    # 0 workers hashes inline on the request thread,
+    # once max pending hashes are queued logins get a 429
+    HASH_POOL_WORKERS = max((os.cpu_count() or 2) // 2, 1)
+    HASH_POOL_MAX_PENDING = 64
+    HASH_METHOD = 'pbkdf2:sha256:150000'
+    HASH_SALT_LENGTH = 8
+
 
 class DevConfig(DefaultConfig):
     DEBUG = True
 
 
+class ProdConfig(DefaultConfig):
+    # Unhandled exceptions answer the json 500, not the wsgi server
+    DEBUG = False
+
+
 class TestConfig(DefaultConfig):
     TESTING = True
     DB_NAME = 'songs_db_test'
+    DB_BACKEND = os.environ.get('TEST_DB_BACKEND', DB_BACKEND_MONGO)
+    HASH_POOL_WORKERS = 2
+    PROFILER_ENABLED = True
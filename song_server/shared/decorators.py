@@ -1,7 +1,10 @@
 import time
 import functools
+from flask import g
 from flask import abort
 from flask import request
+from flask import current_app
+from flask_jwt_extended import get_jwt
 from flask_jwt_extended import get_jwt_identity
 from flask_jwt_extended import verify_jwt_in_request
 
@@ -50,40 +53,50 @@ def parse_user(func):
     Decorator around a request,
     Parses the user that made the request,
         - Ensures the user parsing is successful
-        - Saves the user as a function attribute before returning
+        - Saves the user in `flask.g` before returning
 
-    User can be accessed using `func.user`
+    User can be accessed using `g.user`, per request,
+    concurrent requests of a threaded worker each see their own user
+
+    Tokens that were verified before are served from the identity
+    cache, skipping the jwt decode and the user construction
     """
 
     @functools.wraps(func)
     def wrapper(*args, **kwargs):
 
+        cache = current_app.extensions.get('jwt_identity_cache')
+        token = _get_bearer_token()
+
+        # Same token as an already verified one, and not expired
+        cached = cache.get(token.rpartition('.')[2]) \
+            if cache is not None and token else None
+        if cached is not None and cached[0] == token \
+                and cached[2] > time.time():
+            g.user = cached[1]
+            return func(*args, **kwargs)
+
         # Ensure the request has a session token
         # No jwt => no user data to parse
         verify_jwt_in_request()
 
-        wrapper.user = User.from_json(get_jwt_identity())
-        if wrapper.user is None:
+        g.user = User.from_claims(get_jwt_identity())
+        if g.user is None:
             abort(400, USER_PARSE_ERROR)
 
+        if cache is not None and token:
+            cache.put(token.rpartition('.')[2],
+                      (token, g.user,
+                       get_jwt().get('exp', float('inf'))))
+
         return func(*args, **kwargs)
 
     return wrapper
 
 
-def timer(func):
-    """
-    Decorator,
-    Prints the time taken for a function to execute
-    """
-
-    @functools.wraps(func)
-    def wrapper(*args, **kwargs):
-        start_ts = time.perf_counter()
-        ret = func(*args, **kwargs)
-        time_elapsed_sec = time.perf_counter() - start_ts
-        print('Timer Result, Func: ', func.__name__, ':', time_elapsed_sec, 'sec')
-
-        return ret
+def _get_bearer_token():
+    auth = request.headers.get('Authorization') or ''
+    if not auth.startswith('Bearer '):
+        return None
 
-    return wrapper
+    return auth[len('Bearer '):]
@@ -7,6 +7,9 @@ INVALID_DATA_FORMAT = -1001
 DB_OPERATION_FAILURE = -1002
 REQUEST_PARSE_ERROR = -1003
 INVALID_PAGE_NUMBER = -1004
+INVALID_CURSOR = -1005
+SERVER_BUSY = -1006
+FEATURE_DISABLED = -1007
 
 # User errors
 SIGN_IN_FAILURE = -2001
@@ -0,0 +1,128 @@
+# Response Serializers
+
+import json
+import cbor2
+import msgpack
+from bson import ObjectId
+from bson import json_util
+from flask import request
+from flask import current_app
+
+
+"""
+Bson aware response encoding,
+Mongo documents are written to the response bytes in a single pass,
+without the dumps -> loads -> jsonify round trip of `parse_json`.
+List endpoints also speak MessagePack / CBOR, picked with `Accept`,
+bson types get the same representation as in json
+"""
+
+MIMETYPE_JSON = 'application/json'
+MIMETYPE_MSGPACK = 'application/msgpack'
+MIMETYPE_X_MSGPACK = 'application/x-msgpack'
+MIMETYPE_CBOR = 'application/cbor'
+
+
+def bson_default(obj):
+    """
+    Json representation of bson types,
+    Same output as `bson.json_util.dumps`
+
+    :param obj: a value the json module can't serialize
+    :return: json serializable representation of `obj`
+    """
+
+    # Fast path, the only bson type in song documents
+    if isinstance(obj, ObjectId):
+        return {'$oid': str(obj)}
+
+    return json_util.default(obj)
+
+
+_encoder = json.JSONEncoder(
+    ensure_ascii=False, separators=(',', ':'), default=bson_default)
+
+
+def dump_json(data):
+    """
+    Serialize data holding bson types to utf-8 json bytes
+
+    :param data: dict / list, possibly holding mongo documents
+    :return: bytes, the json encoded data
+    """
+
+    return _encoder.encode(data).encode()
+
+
+def json_response(data, status=200):
+    """
+    Build a json response from data holding bson types,
+    Drop-in for `jsonify(parse_json(data))`
+
+    :param data: dict / list, possibly holding mongo documents
+    :param status: int, the http status code
+    :return: flask response
+    """
+
+    return current_app.response_class(
+        dump_json(data), status=status, mimetype='application/json')
+
+
+def dump_msgpack(data):
+    """
+    :param data: dict / list, possibly holding mongo documents
+    :return: bytes, the MessagePack encoded data
+    """
+
+    return msgpack.packb(data, default=bson_default, use_bin_type=True)
+
+
+def _cbor_default(encoder, obj):
+    encoder.encode(bson_default(obj))
+
+
+def dump_cbor(data):
+    """
+    :param data: dict / list, possibly holding mongo documents
+    :return: bytes, the CBOR encoded data
+    """
+
+    return cbor2.dumps(data, default=_cbor_default)
+
+
+# {mimetype: (format name, encoder)}, json first, picked on a tie
+WIRE_FORMATS = {
+    MIMETYPE_JSON: ('json', dump_json),
+    MIMETYPE_MSGPACK: ('msgpack', dump_msgpack),
+    MIMETYPE_X_MSGPACK: ('msgpack', dump_msgpack),
+    MIMETYPE_CBOR: ('cbor', dump_cbor),
+}
+
+
+def negotiate_mimetype():
+    """
+    :return: str, the wire format the request `Accept`s,
+             json if none or any is accepted
+    """
+
+    return request.accept_mimetypes.best_match(
+        list(WIRE_FORMATS), MIMETYPE_JSON)
+
+
+def list_response(data, status=200, mimetype=None):
+    """
+    Build a response in the wire format the client accepts
+
+    :param data: dict / list, possibly holding mongo documents
+    :param status: int, the http status code
+    :param mimetype: str, a `negotiate_mimetype` result, negotiated if None
+    :return: flask response
+    """
+
+    mimetype = mimetype or negotiate_mimetype()
+    response = current_app.response_class(
+        WIRE_FORMATS[mimetype][1](data), status=status, mimetype=mimetype)
+
+    # Caches must keep one copy per format
+    response.vary.add('Accept')
+    return response
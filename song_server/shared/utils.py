@@ -1,7 +1,10 @@
 # Utility Functions
 
 import os
+import re
 import json
+import base64
+from bson import ObjectId
 from bson import json_util
 
 
@@ -9,6 +12,79 @@ def parse_json(data):
     return json.loads(json_util.dumps(data))
 
 
+def encode_cursor(data):
+    """
+    Encode `data` into an opaque, url safe cursor string,
+    Bson types (ObjectId etc) are preserved
+
+    :param data: dict, the position to resume from
+    :return: str, the encoded cursor
+    """
+
+    raw = json_util.dumps(data).encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_cursor(cursor, required_keys=None):
+    """
+    Decode a cursor created by `encode_cursor`,
+    Cursors are client input, the values end up in db queries and must
+    not carry query operators, ex: {'name': {'$ne': None}}
+
+    :param cursor: str, the encoded cursor
+    :param required_keys: dict, {key: type or tuple of types},
+                          keys the decoded cursor must have
+    :return: dict, the decoded cursor, None if the cursor is invalid
+    """
+
+    if not isinstance(cursor, str):
+        return
+
+    try:
+        data = json_util.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except (ValueError, TypeError):
+        return
+
+    if not isinstance(data, dict):
+        return
+    for key, types in (required_keys or {}).items():
+        if not isinstance(data.get(key), types):
+            return
+
+    return data
+
+
+def iter_ndjson(stream, max_line_len):
+    """
+    Lazily parse a newline delimited json stream,
+    Only one line is held in memory at a time, empty lines are skipped
+    but still counted, line numbers are those of the body
+
+    :param stream: file like object, yielding bytes
+    :param max_line_len: int, longer lines are treated as invalid
+    :return: generator of (line index from 0, parsed value),
+             the value is None for lines that can't be parsed
+    """
+
+    lines = iter(lambda: stream.readline(max_line_len + 1), b'')
+    for line_no, line in enumerate(lines):
+
+        # Line too long, drop the rest of it
+        if len(line) > max_line_len and not line.endswith(b'\n'):
+            while line and not line.endswith(b'\n'):
+                line = stream.readline(max_line_len + 1)
+            yield line_no, None
+            continue
+
+        if not line.strip():
+            continue
+
+        try:
+            yield line_no, json.loads(line)
+        except ValueError:
+            yield line_no, None
+
+
 def get_secret_key():
     """
     Get a random secret string for cryptographic use
@@ -25,6 +101,7 @@ def populate_admin_user():
     """
 
     from song_server.extensions.dbhelper import db_helper
+    from song_server.extensions.hashpool import hash_pool
     users = db_helper.get_users(is_admin_only=True)
     if len(users) > 0:
         return
@@ -33,11 +110,35 @@ def populate_admin_user():
     from song_server.models.user import User
     from song_server.models.user import UserRoles
 
-    first_admin = User('admin', 'admin', 0,
-                       user_role=UserRoles.UR_ADMIN, is_text_password=True)
+    first_admin = User('admin', 'admin', 0, user_role=UserRoles.UR_ADMIN)
+    first_admin.password = hash_pool.generate_password_hash('admin')
     db_helper.add_item(first_admin)
 
 
+_DIGITS = re.compile('[0-9]+')
+
+
+def parse_int(value, min_value, max_value):
+    """
+    Parse a query param holding a non negative int, ascii digits only,
+    `str.isdigit` also accepts unicode digits `int` can't parse
+
+    :param value: str, the param value
+    :return: int, None if invalid or not within [min_value, max_value]
+    """
+
+    if not isinstance(value, str) or not _DIGITS.fullmatch(value):
+        return
+
+    try:
+        value = int(value)
+    except ValueError:
+        # Longer than the int conversion digits limit
+        return
+
+    return value if min_value <= value <= max_value else None
+
+
 def is_type_valid(value, required_type):
     """
     Check if `value` if of type `required_type` or None
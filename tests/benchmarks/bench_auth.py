@@ -0,0 +1,78 @@
+import os
+import sys
+import timeit
+import argparse
+from flask import g
+from flask import Flask
+from flask_jwt_extended import get_jwt_identity
+from flask_jwt_extended import create_access_token
+from flask_jwt_extended import verify_jwt_in_request
+from werkzeug.security import generate_password_hash
+
+# Make song_server accessible for benchmarks
+song_server_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../'
+sys.path.insert(0, song_server_dir)
+
+from song_server.shared.configs import *
+from song_server.shared.decorators import parse_user
+from song_server.extensions.jwthelper import init_jwt_manager
+from song_server.models.user import User
+from song_server.models.user import UserRoles
+
+
+"""
+Micro benchmark, per request authentication overhead
+Full user document token + from_json vs compact claims + identity cache
+
+python3 tests/benchmarks/bench_auth.py
+"""
+
+
+def legacy_parse_user():
+    # `parse_user` before compact claims
+    verify_jwt_in_request()
+    return User.from_json(get_jwt_identity())
+
+
+@parse_user
+def endpoint():
+    return g.user
+
+
+def bench(flask_app, access_token, func, repeat, number):
+    headers = {'Authorization': f'Bearer {access_token}'}
+    with flask_app.test_request_context(headers=headers):
+        timings = timeit.repeat(func, repeat=repeat, number=number)
+
+    return min(timings) / number * 1000 * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=5000)
+    args = parser.parse_args()
+
+    flask_app = Flask(__name__)
+    flask_app.config.from_object(TestConfig)
+    init_jwt_manager(flask_app)
+
+    user = User('Barbara Rocha', generate_password_hash('password'),
+                user_id='1', user_role=UserRoles.UR_USER)
+    with flask_app.app_context():
+        legacy_token = create_access_token(user.to_json())
+        compact_token = create_access_token(user.to_claims())
+
+    results = [
+        ('full document', legacy_token, legacy_parse_user),
+        ('compact claims', compact_token, endpoint),
+    ]
+
+    print(f'{"token":<16}{"bytes":>8}{"us/request":>12}')
+    for name, access_token, func in results:
+        us = bench(flask_app, access_token, func, args.repeat, args.number)
+        print(f'{name:<16}{len(access_token):>8}{us:>12.2f}')
+
+
+if __name__ == '__main__':
+    main()
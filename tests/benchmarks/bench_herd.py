@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+import argparse
+import threading
+from flask import Flask
+
+# Make song_server accessible for benchmarks
+song_server_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../'
+sys.path.insert(0, song_server_dir)
+
+from song_server.shared.configs import *
+from song_server.extensions.dbhelper import DbHelper
+from tests.benchmarks.bench_pagination import BENCH_DB_NAME
+from tests.benchmarks.bench_pagination import populate
+
+
+"""
+Thundering herd benchmark, concurrent requests for a cold page
+Every round, all threads read the same page right after the page cache
+was cleared, as after a deploy, with and without read coalescing
+Ensure **mongod** is running
+
+python3 tests/benchmarks/bench_herd.py --threads 200 --page 1000
+"""
+
+
+def herd(helper, num_threads, page_number, num_rounds):
+    """
+    :return: tuple, (db queries per round, avg ms of a round)
+    """
+
+    def find_count():
+        return helper.command_monitor.stats().get('find', {}).get('count', 0)
+
+    num_finds = find_count()
+    total_sec = 0
+    for _ in range(num_rounds):
+        if helper.page_cache is not None:
+            helper.page_cache.clear()
+
+        start = threading.Barrier(num_threads + 1)
+
+        def run():
+            start.wait()
+            helper.get_songs(page_number)
+
+        threads = [threading.Thread(target=run) for _ in range(num_threads)]
+        for thread in threads:
+            thread.start()
+
+        start.wait()
+        start_ts = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        total_sec += time.perf_counter() - start_ts
+
+    return (find_count() - num_finds) / num_rounds, \
+        total_sec / num_rounds * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=200)
+    parser.add_argument('--page', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=10)
+    parser.add_argument('--skip-populate', action='store_true')
+    args = parser.parse_args()
+
+    if not args.skip_populate:
+        num_songs = args.page * DB_ENTRIES_PER_PAGE
+        print(f'Populating {num_songs} songs ...')
+        populate(BENCH_DB_NAME, num_songs)
+
+    print(f'{"coalescing":<12}{"queries/round":>16}{"ms/round":>12}')
+    for is_coalescing in [False, True]:
+        flask_app = Flask(__name__)
+        flask_app.config.from_object(TestConfig)
+        flask_app.config['DB_NAME'] = BENCH_DB_NAME
+        flask_app.config['DB_COALESCE_READS'] = is_coalescing
+        helper = DbHelper(flask_app)
+
+        queries, ms = herd(helper, args.threads, args.page, args.rounds)
+        name = 'on' if is_coalescing else 'off'
+        print(f'{name:<12}{queries:>16.1f}{ms:>12.1f}')
+
+
+if __name__ == '__main__':
+    main()
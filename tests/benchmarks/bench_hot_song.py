@@ -0,0 +1,108 @@
+import os
+import sys
+import time
+import argparse
+import threading
+from flask import Flask
+from pymongo import MongoClient
+
+# Make song_server accessible for benchmarks
+song_server_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../'
+sys.path.insert(0, song_server_dir)
+
+from song_server.shared.configs import *
+from song_server.extensions.dbhelper import DbHelper
+
+
+"""
+Contention benchmark, concurrent plays of a single viral song
+Strict counters, every play updates the song document, vs sharded
+counters, plays of the hot song spread over counter shards
+Ensure **mongod** is running
+
+python3 tests/benchmarks/bench_hot_song.py --threads 64 --shards 16
+"""
+
+
+BENCH_DB_NAME = 'songs_db_bench'
+HOT_SONG_ID = 'hot'
+
+
+def populate(db_name):
+    db = MongoClient(TestConfig.DB_SOURCE_URL)[db_name]
+    db['songs'].drop()
+    db['song_counter_shards'].drop()
+    db['songs'].insert_one({
+        '_id': HOT_SONG_ID,
+        'name': 'A viral song',
+        'cover_url': 'www.song_server.com/cover/hot',
+        'source_url': 'www.song_server.com/hot',
+        'is_explicit': False,
+        'times_played': 0,
+        'num_likes': 0
+    })
+
+
+def hammer(helper, num_threads, duration_sec):
+    """
+    :return: tuple, (number of plays, p99 latency in ms)
+    """
+
+    latencies = []
+    lock = threading.Lock()
+    end_ts = time.monotonic() + duration_sec
+
+    def run():
+        thread_latencies = []
+        while time.monotonic() < end_ts:
+            start_ts = time.perf_counter()
+            helper.play_song(HOT_SONG_ID)
+            thread_latencies.append(time.perf_counter() - start_ts)
+
+        with lock:
+            latencies.extend(thread_latencies)
+
+    threads = [threading.Thread(target=run) for _ in range(num_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    latencies.sort()
+    p99 = latencies[int(len(latencies) * 0.99)] * 1000 if latencies else 0
+    return len(latencies), p99
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--threads', type=int, default=64)
+    parser.add_argument('--shards', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10)
+    args = parser.parse_args()
+
+    print(f'{"counters":<12}{"plays/sec":>12}{"p99 ms":>10}{"correct":>10}')
+    for num_shards in [0, args.shards]:
+        populate(BENCH_DB_NAME)
+
+        flask_app = Flask(__name__)
+        flask_app.config.from_object(TestConfig)
+        flask_app.config['DB_NAME'] = BENCH_DB_NAME
+        flask_app.config['PAGE_CACHE_SIZE'] = 0
+        flask_app.config['DB_COUNTER_MODE'] = COUNTER_MODE_STRICT
+        flask_app.config['DB_COUNTER_SHARDS'] = num_shards
+        helper = DbHelper(flask_app)
+
+        num_plays, p99 = hammer(helper, args.threads, args.duration)
+
+        # Every play is counted, once the shards are folded
+        if helper.sharded_counters is not None:
+            helper.sharded_counters.close()
+        times_played = helper.get_song(HOT_SONG_ID)['times_played']
+
+        name = f'{num_shards} shards' if num_shards else 'strict'
+        print(f'{name:<12}{num_plays / args.duration:>12.0f}{p99:>10.2f}'
+              f'{str(times_played == num_plays):>10}')
+
+
+if __name__ == '__main__':
+    main()
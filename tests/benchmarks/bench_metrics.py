@@ -0,0 +1,76 @@
+import os
+import sys
+import timeit
+import argparse
+from flask import Flask
+from werkzeug.test import EnvironBuilder
+
+# Make song_server accessible for benchmarks
+song_server_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../'
+sys.path.insert(0, song_server_dir)
+
+from song_server.shared.configs import *
+from song_server.extensions.metrics import Metrics
+from song_server.extensions.metrics import MetricsMiddleware
+
+
+"""
+Micro benchmark, per request overhead of the metrics middleware
+Wraps a wsgi app that only starts a response, target is under 5 us
+
+python3 tests/benchmarks/bench_metrics.py
+"""
+
+TARGET_US = 5
+
+
+def wsgi_app(environ, start_response):
+    start_response('201 CREATED', [('Content-Type', 'application/json'),
+                                   ('Content-Length', '512')])
+    return [b'']
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=100000)
+    args = parser.parse_args()
+
+    flask_app = Flask(__name__)
+    flask_app.config.from_object(TestConfig)
+
+    @flask_app.route('/get_songs')
+    def get_songs():
+        return ''
+
+    # A matched flask request, as seen by the middleware
+    builder = EnvironBuilder('/get_songs', json={'page_number': 1})
+    environ = builder.get_environ()
+    flask_app.request_context(environ).match_request()
+
+    middleware = MetricsMiddleware(
+        wsgi_app, Metrics(TestConfig.METRICS_BUCKETS_SEC))
+
+    results = [
+        ('no metrics', lambda: wsgi_app(environ, start_response)),
+        ('metrics', lambda: middleware(environ, start_response)),
+    ]
+
+    print(f'{"":<12}{"us/request":>12}')
+    timings = {}
+    for name, func in results:
+        timings[name] = min(timeit.repeat(
+            func, repeat=args.repeat, number=args.number)) \
+            / args.number * 1000 * 1000
+        print(f'{name:<12}{timings[name]:>12.2f}')
+
+    overhead = timings['metrics'] - timings['no metrics']
+    print(f'overhead {overhead:.2f} us/request, target < {TARGET_US} us')
+
+
+if __name__ == '__main__':
+    main()
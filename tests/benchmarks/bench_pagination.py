@@ -0,0 +1,96 @@
+import os
+import sys
+import timeit
+import argparse
+from flask import Flask
+from pymongo import MongoClient
+
+# Make song_server accessible for benchmarks
+song_server_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../'
+sys.path.insert(0, song_server_dir)
+
+from song_server.shared.configs import *
+from song_server.extensions.dbhelper import DbHelper
+
+
+"""
+Benchmark, skip/limit pagination vs keyset (cursor) pagination
+Ensure **mongod** is running
+
+python3 tests/benchmarks/bench_pagination.py --deep-page 10000
+"""
+
+
+BENCH_DB_NAME = 'songs_db_bench'
+
+
+def populate(db_name, num_songs, batch_size=10000):
+    col_songs = MongoClient(TestConfig.DB_SOURCE_URL)[db_name]['songs']
+    col_songs.drop()
+
+    for start in range(0, num_songs, batch_size):
+        col_songs.insert_many([{
+            'name': f'song-{i:09d}',
+            'cover_url': f'www.song_server.com/cover/{i}',
+            'source_url': f'www.song_server.com/{i}',
+            'is_explicit': i % 7 == 0,
+            'times_played': 0,
+            'num_likes': 0
+        } for i in range(start, min(start + batch_size, num_songs))])
+
+
+def cursor_for_page(helper, page_number):
+    # Position of the last song before `page_number`, built once
+    # with skip, so that only the cursor read is measured
+    if page_number <= 1:
+        return None
+
+    songs = helper.get_songs(page_number - 1)
+    return {'name': songs[-1]['name'], '_id': songs[-1]['_id']}
+
+
+def bench(func, repeat, number):
+    timings = timeit.repeat(func, repeat=repeat, number=number)
+    return min(timings) / number * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--deep-page', type=int, default=10000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=20)
+    parser.add_argument('--skip-populate', action='store_true')
+    args = parser.parse_args()
+
+    flask_app = Flask(__name__)
+    flask_app.config.from_object(TestConfig)
+    flask_app.config['DB_NAME'] = BENCH_DB_NAME
+
+    # Every timed read must reach the db, not the page cache
+    flask_app.config['PAGE_CACHE_SIZE'] = 0
+    flask_app.config['DB_COALESCE_READS'] = False
+
+    num_songs = args.deep_page * DB_ENTRIES_PER_PAGE
+    if not args.skip_populate:
+        print(f'Populating {num_songs} songs ...')
+        populate(BENCH_DB_NAME, num_songs)
+
+    helper = DbHelper(flask_app)
+    deep_cursor = cursor_for_page(helper, args.deep_page)
+
+    results = [
+        ('skip/limit', 1, lambda: helper.get_songs(1)),
+        ('skip/limit', args.deep_page,
+         lambda: helper.get_songs(args.deep_page)),
+        ('cursor', 1, lambda: helper.get_songs_after(None)),
+        ('cursor', args.deep_page,
+         lambda: helper.get_songs_after(deep_cursor)),
+    ]
+
+    print(f'{"mode":<12}{"page":>8}{"ms/page":>12}')
+    for mode, page, func in results:
+        print(f'{mode:<12}{page:>8}{bench(func, args.repeat, args.number):>12.3f}')
+
+
+if __name__ == '__main__':
+    main()
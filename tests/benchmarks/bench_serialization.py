@@ -0,0 +1,70 @@
+import os
+import sys
+import timeit
+import argparse
+from bson import ObjectId
+from flask import Flask
+from flask import jsonify
+
+# Make song_server accessible for benchmarks
+song_server_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../'
+sys.path.insert(0, song_server_dir)
+
+from song_server.shared.utils import parse_json
+from song_server.shared.serializers import json_response
+
+
+"""
+Micro benchmark, get_songs response encoding
+parse_json + jsonify vs the single pass bson aware encoder
+
+python3 tests/benchmarks/bench_serialization.py
+"""
+
+
+def make_songs(num_songs):
+    return [{
+        '_id': ObjectId(),
+        'name': f'Song name number {i}, with a few more words',
+        'cover_url': f'https://dummyimage.com/{i}x{i}',
+        'source_url': f'www.song_server.com/{i}',
+        'is_explicit': i % 3 == 0,
+        'times_played': i * 31,
+        'num_likes': i * 7
+    } for i in range(num_songs)]
+
+
+def bench(func, repeat, number):
+    timings = timeit.repeat(func, repeat=repeat, number=number)
+    return min(timings) / number * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[25, 250, 2500])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=50)
+    args = parser.parse_args()
+
+    flask_app = Flask(__name__)
+
+    print(f'{"songs":>8}{"parse_json ms":>16}{"single pass ms":>16}{"speedup":>10}')
+    with flask_app.app_context():
+        for size in args.sizes:
+            songs = make_songs(size)
+
+            # Both encoders must agree on the content
+            assert jsonify({'data': parse_json(songs)}).get_json() == \
+                json_response({'data': songs}).get_json()
+
+            legacy_ms = bench(lambda: jsonify({'data': parse_json(songs)}),
+                              args.repeat, args.number)
+            direct_ms = bench(lambda: json_response({'data': songs}),
+                              args.repeat, args.number)
+            print(f'{size:>8}{legacy_ms:>16.3f}{direct_ms:>16.3f}'
+                  f'{legacy_ms / direct_ms:>9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+import os
+import sys
+import argparse
+import tempfile
+
+# Make song_server accessible for benchmarks
+song_server_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../'
+sys.path.insert(0, song_server_dir)
+
+from song_server.shared.configs import *
+from tests.locust_runner import SERVER_DEV
+from tests.locust_runner import SERVER_PROD
+from tests.locust_runner import read_stats
+from tests.locust_runner import run_locust
+from tests.locust_runner import start_server
+from serve import check_workers
+
+
+"""
+Throughput of flask's development server vs the gunicorn server of
+serve.py, under the locust suite with no think time
+
+Both servers run on mongod by default, reloaded with the test data.
+The memory backend needs no mongod but serves a single worker,
+forked workers would each hold their own copy of the catalog
+
+python3 tests/benchmarks/bench_serving.py --workers 4 --threads 8
+python3 tests/benchmarks/bench_serving.py --workers 1 --db-backend memory
+"""
+
+
+def swarm(server, args, csv_prefix):
+    host, process = start_server(
+        server, args.workers, args.threads, args.db_backend)
+    try:
+        run_locust(host, csv_prefix, args)
+    finally:
+        process.terminate()
+        process.join()
+
+    return read_stats(csv_prefix)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--workers', type=int, default=DevConfig.SERVE_WORKERS)
+    parser.add_argument('--threads', type=int, default=DevConfig.SERVE_THREADS)
+    parser.add_argument('--db-backend', default=DB_BACKEND_MONGO,
+                        choices=[DB_BACKEND_MONGO, DB_BACKEND_MEMORY])
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--spawn-rate', type=int, default=50)
+    parser.add_argument('--run-time', default='30s')
+    args = parser.parse_args()
+
+    # Fail before the dev server run, not once it's over
+    check_workers(args.db_backend, args.workers)
+
+    # Servers and locust run on the same backend, users never wait
+    os.environ['DB_BACKEND'] = args.db_backend
+    os.environ['LOCUST_WAIT_SCALE'] = '0'
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        for server in [SERVER_DEV, SERVER_PROD]:
+            stats = swarm(server, args, os.path.join(tmp_dir, server))
+            results[server] = stats.get('Aggregated')
+
+    print(f'{args.users} users, {args.run_time}, {args.db_backend}, '
+          f'{args.workers} workers x {args.threads} threads')
+    print(f'{"server":<8}{"req/s":>10}{"p50 ms":>10}{"p95 ms":>10}'
+          f'{"p99 ms":>10}{"failures":>10}')
+    for server, stats in results.items():
+        if stats is None:
+            print(f'{server:<8} no request was made')
+            continue
+
+        print(f'{server:<8}{stats["rps"]:>10.1f}{stats["p50_ms"]:>10.0f}'
+              f'{stats["p95_ms"]:>10.0f}{stats["p99_ms"]:>10.0f}'
+              f'{stats["failure_ratio"]:>10.2%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+# Make song_server accessible for benchmarks
+song_server_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../'
+sys.path.insert(0, song_server_dir)
+
+from song_server.shared.configs import *
+
+
+"""
+Startup benchmark, time for a new worker to serve its first request
+Every run is a fresh interpreter, importing the app, creating it and
+serving GET /get_songs, with and without the startup db migrations
+
+Needs mongod for the mongo backend, run migrate.py once beforehand
+python3 tests/benchmarks/bench_startup.py --backend memory
+"""
+
+# Runs in the child interpreter, prints the timings as json
+STARTUP_SCRIPT = '''
+import json, time
+start_ts = time.perf_counter()
+from song_server.app import create_app
+import_ts = time.perf_counter()
+app = create_app()
+create_ts = time.perf_counter()
+app.test_client().get('/get_songs')
+request_ts = time.perf_counter()
+print(json.dumps({
+    'import_ms': (import_ts - start_ts) * 1000,
+    'create_ms': (create_ts - import_ts) * 1000,
+    'request_ms': (request_ts - create_ts) * 1000,
+    'total_ms': (request_ts - start_ts) * 1000,
+}))
+'''
+
+PHASES = ['import_ms', 'create_ms', 'request_ms', 'total_ms']
+
+
+def run_startup(backend, migrate_on_startup):
+    env = dict(os.environ, DB_BACKEND=backend,
+               DB_MIGRATE_ON_STARTUP='1' if migrate_on_startup else '0')
+
+    # Hash pool workers exit with the child, not included in the timings
+    output = subprocess.run(
+        [sys.executable, '-c', STARTUP_SCRIPT], env=env, cwd=song_server_dir,
+        check=True, capture_output=True, text=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--backend', default=DB_BACKEND_MONGO,
+                        choices=[DB_BACKEND_MONGO, DB_BACKEND_MEMORY])
+    parser.add_argument('--runs', type=int, default=10)
+    args = parser.parse_args()
+
+    print(f'{args.backend} backend, median of {args.runs} runs')
+    print(f'{"migrations":<12}' + ''.join(f'{p:>12}' for p in PHASES))
+    for migrate_on_startup in [True, False]:
+        runs = [run_startup(args.backend, migrate_on_startup)
+                for _ in range(args.runs)]
+        medians = [statistics.median(r[p] for r in runs) for p in PHASES]
+
+        name = 'startup' if migrate_on_startup else 'migrate.py'
+        print(f'{name:<12}' + ''.join(f'{m:>12.1f}' for m in medians))
+
+
+if __name__ == '__main__':
+    main()
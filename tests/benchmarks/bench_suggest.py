@@ -0,0 +1,88 @@
+import os
+import sys
+import time
+import random
+import argparse
+
+# Make song_server accessible for benchmarks
+song_server_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../'
+sys.path.insert(0, song_server_dir)
+
+from song_server.extensions.suggest import PrefixIndex
+
+
+"""
+Micro benchmark, autocomplete latency of the in process prefix index
+over a synthetic catalog, no db required
+
+python3 tests/benchmarks/bench_suggest.py --num-names 1000000
+"""
+
+
+WORDS = ('love night heart fire dance dream light baby time world rain '
+         'summer blue gold wild home road river moon star city girl boy '
+         'midnight forever alone together broken young free sweet dark '
+         'electric paradise radio golden highway ocean thunder echo ghost '
+         'shadow silver crazy lonely burning falling rising running').split()
+
+
+def make_names(num_names, rng):
+    return [' '.join(rng.choice(WORDS) for _ in range(rng.randint(1, 5)))
+            + f' {i}' for i in range(num_names)]
+
+
+def percentile(timings, pct):
+    return timings[min(int(len(timings) * pct / 100), len(timings) - 1)]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--num-names', type=int, default=1000000)
+    parser.add_argument('--num-queries', type=int, default=100000)
+    parser.add_argument('--limit', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    names = make_names(args.num_names, rng)
+    index = PrefixIndex(float('inf'), lambda: names)
+
+    start_ts = time.perf_counter()
+    index.build()
+    print(f'Built index of {args.num_names} names in '
+          f'{time.perf_counter() - start_ts:.2f} sec')
+
+    # Prefixes of 1 to 12 characters of real names, mixed case
+    prefixes = []
+    for _ in range(args.num_queries):
+        name = rng.choice(names)
+        prefix = name[:rng.randint(1, 12)]
+        prefixes.append(prefix.upper() if rng.random() < 0.2 else prefix)
+
+    timings = []
+    for prefix in prefixes:
+        start_ts = time.perf_counter()
+        index.suggest(prefix, args.limit)
+        timings.append((time.perf_counter() - start_ts) * 1000 * 1000)
+    timings.sort()
+
+    print(f'{"p50 us":>10}{"p99 us":>10}{"max us":>10}')
+    print(f'{percentile(timings, 50):>10.1f}{percentile(timings, 99):>10.1f}'
+          f'{timings[-1]:>10.1f}')
+
+    # Incremental updates
+    start_ts = time.perf_counter()
+    for i in range(1000):
+        index.add(f'new song {i}')
+    print(f'add: {(time.perf_counter() - start_ts) * 1000:.3f} us / name')
+
+    # A batch of the bulk insert route, merged at once
+    batch = [f'batch song {i}' for i in range(1000)]
+    start_ts = time.perf_counter()
+    index.add_many(batch)
+    print(f'add_many: {(time.perf_counter() - start_ts) * 1000:.3f} '
+          f'us / name')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+import os
+import sys
+import json
+import timeit
+import argparse
+from bson import ObjectId
+
+# Make song_server accessible for benchmarks
+song_server_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../'
+sys.path.insert(0, song_server_dir)
+
+from song_server.shared.serializers import *
+
+
+"""
+Micro benchmark, get_songs page encoding per wire format,
+Encode time, decode time (the client side) and payload size of
+MessagePack / CBOR against json
+
+python3 tests/benchmarks/bench_wire_formats.py
+python3 tests/benchmarks/bench_wire_formats.py --sizes 25 250 2500
+"""
+
+
+def make_songs(num_songs):
+    return [{
+        '_id': ObjectId(),
+        'name': f'Song name number {i}, with a few more words',
+        'cover_url': f'https://dummyimage.com/{i}x{i}',
+        'source_url': f'www.song_server.com/{i}',
+        'is_explicit': i % 3 == 0,
+        'times_played': i * 31,
+        'num_likes': i * 7
+    } for i in range(num_songs)]
+
+
+def formats():
+    """
+    :return: list of (name, encoder, decoder), json first
+    """
+
+    return [
+        ('json', dump_json, json.loads),
+        ('msgpack', dump_msgpack, msgpack.unpackb),
+        ('cbor', dump_cbor, cbor2.loads),
+    ]
+
+
+def bench(func, repeat, number):
+    timings = timeit.repeat(func, repeat=repeat, number=number)
+    return min(timings) / number * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+',
+                        default=[25, 250, 2500])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--number', type=int, default=50)
+    args = parser.parse_args()
+
+    print(f'{"songs":>8}{"format":>10}{"encode ms":>12}{"decode ms":>12}'
+          f'{"bytes":>10}{"vs json":>10}')
+    for size in args.sizes:
+        page = {'data': make_songs(size)}
+        expected = json.loads(dump_json(page))
+        json_bytes = None
+
+        for name, encode, decode in formats():
+            payload = encode(page)
+
+            # Every format must carry the json data
+            assert decode(payload) == expected
+            json_bytes = json_bytes or len(payload)
+
+            encode_ms = bench(lambda: encode(page), args.repeat, args.number)
+            decode_ms = bench(lambda: decode(payload),
+                              args.repeat, args.number)
+            print(f'{size:>8}{name:>10}{encode_ms:>12.3f}{decode_ms:>12.3f}'
+                  f'{len(payload):>10}{len(payload) / json_bytes:>9.2f}x')
+
+
+if __name__ == '__main__':
+    main()
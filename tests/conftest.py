@@ -21,6 +21,7 @@ Pytest Parameterized testing - https://docs.pytest.org/en/6.2.x/example/parametr
 Flask Testing Docs - https://flask.palletsprojects.com/en/2.0.x/testing/
 
 pytest -v (verbose) -s (show print statements)
+TEST_DB_BACKEND=memory pytest (run without a mongo server)
 """
 
 
@@ -32,6 +33,29 @@ def app():
     yield flask_app.test_client()
 
 
+@pytest.fixture
+def play_log():
+    """
+    Play log of the helper serving the songs blueprint,
+    flushed explicitly, None on the memory backend which has no log
+    """
+
+    from song_server.services.songs.routes import db_helper
+    from song_server.extensions.playlog import PlayLog
+
+    if TestConfig.DB_BACKEND != DB_BACKEND_MONGO:
+        yield None
+        return
+
+    db_helper.play_log = PlayLog(1000, 100, 60 * 1000,
+                                 db_helper._write_play_events)
+    db_helper.create_indexes()
+    yield db_helper.play_log
+
+    db_helper.play_log.close()
+    db_helper.play_log = None
+
+
 @pytest.fixture
 def songs_data():
     return _songs
@@ -47,5 +71,6 @@ Pre-Test Setup
 """
 
 # Init Db, Init test data
-db_populate = DbPopulate(TestConfig.DB_SOURCE_URL, TestConfig.DB_NAME)
+db_populate = DbPopulate(
+    TestConfig.DB_SOURCE_URL, TestConfig.DB_NAME, TestConfig.DB_BACKEND)
 _songs, _users = db_populate.load_test_data()
@@ -11,6 +11,8 @@ sys.path.insert(0, song_server_dir)
 
 from song_server.shared.configs import DATA_FILE_SONGS
 from song_server.shared.configs import DATA_FILE_USERS
+from song_server.shared.configs import DB_BACKEND_MEMORY
+from song_server.extensions.memdbhelper import get_memory_database
 from song_server.models.song import Song
 from song_server.models.user import User
 
@@ -23,10 +25,12 @@ Faker docs - https://faker.readthedocs.io/en/master/
 
 class DbPopulate:
 
-    def __init__(self, source_url, db_name):
-        mongo_client = MongoClient(source_url)
+    def __init__(self, source_url, db_name, backend=None):
+        if backend == DB_BACKEND_MEMORY:
+            self.db = get_memory_database(db_name)
+        else:
+            self.db = MongoClient(source_url)[db_name]
 
-        self.db = mongo_client[db_name]
         self.faker = Faker()
 
     def load_test_data(self):
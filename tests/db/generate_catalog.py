@@ -0,0 +1,204 @@
+import os
+import sys
+import time
+import random
+import argparse
+import collections
+from multiprocessing import Pool
+from faker import Faker
+from pymongo import MongoClient
+from werkzeug.security import generate_password_hash
+
+# Make song_server accessible for the generator
+song_server_dir = os.path.dirname(os.path.abspath(__file__)) + '/../../'
+sys.path.insert(0, song_server_dir)
+
+from song_server.shared.configs import *
+from song_server.extensions.dbhelper import create_indexes
+from song_server.models.user import UserRoles
+
+
+"""
+Generates a large synthetic catalog for benchmarks,
+Songs and users are generated in chunks by a process pool and
+streamed into Mongo with unordered insert_many, the indexes are built
+once all data is loaded.
+
+Every chunk is seeded from (seed, chunk number), the same seed gives
+the same catalog whatever the number of workers, with the same Faker
+version. Song ids are '1'..'N' and user ids 1..N like the test data,
+every user has the password COMMON_USER_PASSWORD.
+
+python3 tests/db/generate_catalog.py --songs 1000000 --users 1000000
+"""
+
+CHUNK_SIZE = 10000
+
+# Share of explicit songs and maintenance users
+EXPLICIT_RATIO = 0.15
+MAINTENANCE_RATIO = 0.01
+
+# Plays follow a power law, a few songs get most plays
+PLAYS_PARETO_ALPHA = 1.16
+PLAYS_SCALE = 20
+MAX_TIMES_PLAYED = 10 ** 9
+
+# Worker state, set by `init_worker`
+_faker = None
+_password_hash = None
+
+
+def init_worker(password_hash):
+    global _faker, _password_hash
+    _faker = Faker()
+    _password_hash = password_hash
+
+
+def chunk_random(seed, kind, chunk):
+    """
+    Seed Faker and return a random generator for a single chunk
+    """
+
+    chunk_seed = f'{seed}-{kind}-{chunk}'
+    _faker.seed_instance(chunk_seed)
+    return random.Random(chunk_seed)
+
+
+def song_name(rng):
+    templates = [
+        lambda: _faker.sentence(nb_words=rng.randint(1, 6)).rstrip('.'),
+        lambda: _faker.catch_phrase(),
+        lambda: f'{_faker.word().title()} {_faker.word().title()}',
+        lambda: f'{_faker.sentence(nb_words=rng.randint(1, 4)).rstrip(".")}'
+                f' (feat. {_faker.name()})',
+        lambda: f'{_faker.city()} {rng.choice(["Nights", "Blues", "Love"])}',
+    ]
+
+    name = rng.choice(templates)()
+    while len(name) < MIN_SONG_NAME_LEN:
+        name = f'{name} {_faker.word()}'
+
+    return name[:MAX_SONG_NAME_LEN]
+
+
+def generate_songs(args):
+    """
+    :param args: tuple, (seed, chunk number, first index, last index)
+    :return: list of song documents
+    """
+
+    seed, chunk, start, end = args
+    rng = chunk_random(seed, 'songs', chunk)
+
+    songs = []
+    for index in range(start, end):
+        times_played = min(int(
+            (rng.paretovariate(PLAYS_PARETO_ALPHA) - 1) * PLAYS_SCALE),
+            MAX_TIMES_PLAYED)
+        songs.append({
+            '_id': str(index + 1),
+            'name': song_name(rng),
+            'cover_url': f'https://dummyimage.com/{rng.randint(100, 999)}'
+                         f'x{rng.randint(100, 999)}',
+            'source_url': f'www.song_server.com/{index + 1}',
+            'is_explicit': rng.random() < EXPLICIT_RATIO,
+            'times_played': times_played,
+            'num_likes': int(times_played * rng.betavariate(2, 30)),
+        })
+
+    return songs
+
+
+def generate_users(args):
+    """
+    :param args: tuple, (seed, chunk number, first index, last index)
+    :return: list of user documents
+    """
+
+    seed, chunk, start, end = args
+    rng = chunk_random(seed, 'users', chunk)
+
+    return [{
+        '_id': index + 1,
+        'user_role': UserRoles.UR_MAINTENANCE.value
+        if rng.random() < MAINTENANCE_RATIO else UserRoles.UR_USER.value,
+        # The index keeps names unique
+        'username': f'{_faker.name()} {index + 1}'[:MAX_USERNAME_LEN],
+        'password': _password_hash,
+    } for index in range(start, end)]
+
+
+def chunks(seed, num_items):
+    return [(seed, chunk, start, min(start + CHUNK_SIZE, num_items))
+            for chunk, start in enumerate(range(0, num_items, CHUNK_SIZE))]
+
+
+def load(pool, num_workers, collection, generate_func, seed, num_items,
+         batch_size):
+    """
+    Generate and insert `num_items` documents,
+    At most a couple of chunks per worker are held in memory
+    """
+
+    start_ts = time.monotonic()
+    num_inserted = 0
+
+    def insert(docs):
+        for i in range(0, len(docs), batch_size):
+            collection.insert_many(docs[i:i + batch_size], ordered=False)
+
+        rate = (num_inserted + len(docs)) / \
+            max(time.monotonic() - start_ts, 1e-9)
+        print(f'\r{collection.name}: {num_inserted + len(docs)}/{num_items} '
+              f'({rate:.0f}/sec)', end='', flush=True)
+        return len(docs)
+
+    # Workers keep generating while the main process inserts
+    pending = collections.deque()
+    for chunk in chunks(seed, num_items):
+        pending.append(pool.apply_async(generate_func, (chunk,)))
+        if len(pending) >= num_workers * 2:
+            num_inserted += insert(pending.popleft().get())
+
+    while pending:
+        num_inserted += insert(pending.popleft().get())
+
+    print()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--songs', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=1000000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    parser.add_argument('--batch-size', type=int, default=5000,
+                        help='documents per insert_many')
+    parser.add_argument('--source-url', default=DevConfig.DB_SOURCE_URL)
+    parser.add_argument('--db-name', default=DevConfig.DB_NAME)
+    args = parser.parse_args()
+
+    db = MongoClient(args.source_url)[args.db_name]
+
+    # Drop all existing data, with its indexes
+    db['songs'].drop()
+    db['users'].drop()
+
+    # A single hash for every user, hashing is the slowest part otherwise
+    password_hash = generate_password_hash(
+        COMMON_USER_PASSWORD, DevConfig.HASH_METHOD, DevConfig.HASH_SALT_LENGTH)
+
+    with Pool(args.workers, init_worker, (password_hash,)) as pool:
+        load(pool, args.workers, db['songs'], generate_songs,
+             args.seed, args.songs, args.batch_size)
+        load(pool, args.workers, db['users'], generate_users,
+             args.seed, args.users, args.batch_size)
+
+    # Building the indexes once is faster than updating them per insert
+    start_ts = time.monotonic()
+    create_indexes(db)
+    print(f'indexes: {time.monotonic() - start_ts:.1f} sec')
+
+
+if __name__ == '__main__':
+    main()
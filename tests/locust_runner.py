@@ -0,0 +1,258 @@
+import os
+import sys
+import csv
+import json
+import time
+import socket
+import argparse
+import subprocess
+import multiprocessing
+
+# Make song_server accessible for swarm tests
+song_server_dir = os.path.dirname(os.path.abspath(__file__)) + '/../'
+sys.path.insert(0, song_server_dir)
+
+from tests.db.dbpopulate import DbPopulate
+from song_server.shared.configs import *
+
+
+"""
+Headless Locust run with SLO gating,
+Runs tests/locustfile.py, writes the stats csv files and compares
+p50 / p95 / p99 and throughput of every request against a stored
+baseline, exits 1 once a metric regressed by more than the threshold
+
+Without --host a server is started on the memory backend, no mongod
+needed, flask's development server or the production gunicorn server.
+The memory backend serves a single worker, several --workers of the
+production server need --db-backend mongo, a running mongod
+
+LOCUST_WAIT_SCALE=0 removes the think time, to measure max throughput
+
+python3 tests/locust_runner.py --update-baseline
+python3 tests/locust_runner.py --users 50 --run-time 2m --threshold 20
+python3 tests/locust_runner.py --server prod --workers 1 --threads 8
+python3 tests/locust_runner.py --server prod --workers 4 --db-backend mongo
+"""
+
+LOCUSTFILE = os.path.join(os.path.dirname(__file__), 'locustfile.py')
+DEFAULT_BASELINE = os.path.join(
+    os.path.dirname(__file__), 'data', 'locust_baseline.json')
+
+SERVER_DEV = 'dev'
+SERVER_PROD = 'prod'
+
+# Stats csv column -> (baseline key, True if a higher value is worse)
+SLO_METRICS = {
+    '50%': ('p50_ms', True),
+    '95%': ('p95_ms', True),
+    '99%': ('p99_ms', True),
+    'Requests/s': ('rps', False),
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(server=SERVER_DEV, workers=None, threads=None,
+                 db_backend=DB_BACKEND_MEMORY):
+    """
+    Serve the app from a child process on a free local port,
+    on `db_backend` loaded with the test data
+
+    :param server: str, SERVER_DEV flask's development server,
+                   SERVER_PROD the gunicorn server of serve.py
+    :param db_backend: str, DB_BACKEND_MONGO drops and reloads the
+                       dev db of a running mongod
+    :raise ValueError: more than one worker on the memory backend
+    :return: tuple, (host to swarm, server process)
+    """
+
+    # Fail before the server process starts, not once it's waited for
+    if server == SERVER_PROD:
+        from serve import check_workers
+        check_workers(db_backend, workers or ProdConfig.SERVE_WORKERS)
+
+    port = free_port()
+    process = multiprocessing.Process(
+        target=_serve, args=(server, port, workers, threads, db_backend))
+    process.start()
+
+    # Wait for the server to accept connections
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), 1).close()
+            break
+        except OSError:
+            time.sleep(0.2)
+
+    return f'http://127.0.0.1:{port}', process
+
+
+def _serve(server, port, workers, threads, db_backend):
+    DevConfig.DB_BACKEND = db_backend
+    ProdConfig.DB_BACKEND = db_backend
+    DbPopulate(DevConfig.DB_SOURCE_URL, DevConfig.DB_NAME,
+               db_backend).load_test_data()
+
+    if server == SERVER_PROD:
+        from serve import serve
+        serve(f'127.0.0.1:{port}', workers or ProdConfig.SERVE_WORKERS,
+              threads or ProdConfig.SERVE_THREADS,
+              ProdConfig.SERVE_TIMEOUT_SEC)
+    else:
+        from song_server.app import create_app
+        create_app().run('127.0.0.1', port, threaded=True,
+                         use_reloader=False)
+
+
+def run_locust(host, csv_prefix, args):
+    # The locustfile paths are relative to the host
+    host = host.rstrip('/') + '/'
+    command = [
+        sys.executable, '-m', 'locust',
+        '-f', LOCUSTFILE,
+        '--headless',
+        '--only-summary',
+        '--host', host,
+        '--users', str(args.users),
+        '--spawn-rate', str(args.spawn_rate),
+        '--run-time', args.run_time,
+        '--csv', csv_prefix,
+    ]
+
+    # Locust exits 1 on any failed request, gated below instead
+    subprocess.run(command, cwd=song_server_dir)
+
+
+def read_stats(csv_prefix):
+    """
+    :return: dict, {request name: {baseline key: value}}
+    """
+
+    stats = {}
+    with open(f'{csv_prefix}_stats.csv') as f:
+        for row in csv.DictReader(f):
+            num_requests = int(row['Request Count'])
+            if num_requests == 0:
+                continue
+
+            stats[row['Name']] = {
+                key: float(row[column])
+                for column, (key, _) in SLO_METRICS.items()
+            }
+            stats[row['Name']]['failure_ratio'] = \
+                int(row['Failure Count']) / num_requests
+
+    return stats
+
+
+def find_regressions(stats, baseline, threshold_pct, max_failure_ratio):
+    """
+    :return: list of str, one line per regression, empty if none
+    """
+
+    regressions = []
+    for name, current in sorted(stats.items()):
+        if current['failure_ratio'] > max_failure_ratio:
+            regressions.append(
+                f'{name}: failure ratio {current["failure_ratio"]:.2%}')
+
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+
+        for key, is_higher_worse in SLO_METRICS.values():
+            if expected[key] <= 0:
+                continue
+
+            change_pct = (current[key] - expected[key]) / expected[key] * 100
+            if not is_higher_worse:
+                change_pct = -change_pct
+
+            if change_pct > threshold_pct:
+                regressions.append(
+                    f'{name}: {key} {current[key]:.2f} vs baseline '
+                    f'{expected[key]:.2f} ({change_pct:+.1f}%)')
+
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default=None,
+                        help='server to swarm, a local memory '
+                             'backend server if not set')
+    parser.add_argument('--server', default=SERVER_DEV,
+                        choices=[SERVER_DEV, SERVER_PROD],
+                        help='local server to start without --host')
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--threads', type=int, default=None)
+    parser.add_argument('--db-backend', default=DB_BACKEND_MEMORY,
+                        choices=[DB_BACKEND_MONGO, DB_BACKEND_MEMORY],
+                        help='backend of the local server')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--spawn-rate', type=int, default=10)
+    parser.add_argument('--run-time', default='1m')
+    parser.add_argument('--csv', default='locust',
+                        help='prefix of the stats csv files')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE)
+    parser.add_argument('--update-baseline', action='store_true')
+    parser.add_argument('--threshold', type=float, default=20,
+                        help='max regression of a metric, in percent')
+    parser.add_argument('--max-failure-ratio', type=float, default=0.01)
+    args = parser.parse_args()
+
+    host, process = args.host, None
+    if host is None:
+        os.environ['DB_BACKEND'] = args.db_backend
+        host, process = start_server(
+            args.server, args.workers, args.threads, args.db_backend)
+
+    try:
+        run_locust(host, args.csv, args)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.join()
+
+    stats = read_stats(args.csv)
+    if not stats:
+        print('No request was made, check the locust output')
+        sys.exit(2)
+
+    # Throughput only compares between runs of the same swarm
+    params = {'users': args.users, 'spawn_rate': args.spawn_rate,
+              'run_time': args.run_time}
+
+    if args.update_baseline or not os.path.exists(args.baseline):
+        with open(args.baseline, 'w') as f:
+            json.dump({'params': params, 'stats': stats}, f, indent=2)
+        print(f'Baseline saved to {args.baseline}')
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    if baseline['params'] != params:
+        print(f'Swarm {params} differs from the baseline '
+              f'{baseline["params"]}, rerun with --update-baseline')
+        sys.exit(2)
+
+    regressions = find_regressions(
+        stats, baseline['stats'], args.threshold, args.max_failure_ratio)
+    for regression in regressions:
+        print(f'REGRESSION {regression}')
+
+    if regressions:
+        sys.exit(1)
+
+    print('No regression')
+
+
+if __name__ == '__main__':
+    main()
@@ -1,18 +1,37 @@
 import os
 import sys
+import math
+import uuid
 import locust
 import random
-
-from tests.db.dbpopulate import DbPopulate
+import itertools
 
 # Make song_server accessible for swarm tests
 song_server_dir = os.path.dirname(os.path.abspath(__file__)) + '/../'
 sys.path.insert(0, song_server_dir)
 
+from tests.db.dbpopulate import DbPopulate
+from song_server.shared.configs import DevConfig
+from song_server.shared.configs import DB_BACKEND_MEMORY
+from song_server.shared.configs import DB_ENTRIES_PER_PAGE
+from song_server.shared.configs import COMMON_USER_PASSWORD
+from song_server.models.user import UserRoles
+
 
 """
 Locust Quickstart: https://docs.locust.io/en/stable/quickstart.html
 Locust Docs: https://docs.locust.io/en/stable/writing-a-locustfile.html
+
+Song plays / likes follow a Zipf distribution over the catalog of the
+target db, reads hit the first page, random deep pages and the
+explicit filter. The catalog is only read, a test data catalog or one
+of tests/db/generate_catalog.py, users log in with their common password
+
+LOCUST_LOAD_FIXTURES=1 drops the songs / users of the db and loads the
+test data first. The memory backend of a local server always serves the
+test data, its catalog isn't reachable from here
+
+Headless run with SLO gating - tests/locust_runner.py
 """
 
 
@@ -20,22 +39,82 @@ Locust Docs: https://docs.locust.io/en/stable/writing-a-locustfile.html
 Pre-Test Setup
 """
 
+# Skew of song popularity, the song of rank r is played ~ 1 / r^s
+ZIPF_EXPONENT = float(os.environ.get('LOCUST_ZIPF_EXPONENT', '1.1'))
+
+# Multiplies the users think time, 0 to swarm at max throughput
+WAIT_SCALE = float(os.environ.get('LOCUST_WAIT_SCALE', '1'))
+
+# Opt in, replaces the catalog of the db with the test data
+LOAD_FIXTURES = os.environ.get('LOCUST_LOAD_FIXTURES', '0') == '1'
+
+# Users of each role read from the db to log in with
+MAX_CREDENTIALS = 10000
+
+# Password of the first admin user, see `populate_admin_user`
+ADMIN_PASSWORD = 'admin'
+
+
+def load_catalog():
+    """
+    :return: tuple, (list of (song_id, times_played),
+                     list of (username, UserRoles),
+                     number of songs, number of non explicit songs)
+    """
+
+    db_populate = DbPopulate(
+        DevConfig.DB_SOURCE_URL, DevConfig.DB_NAME, DevConfig.DB_BACKEND)
+
+    if LOAD_FIXTURES or DevConfig.DB_BACKEND == DB_BACKEND_MEMORY:
+        songs, users = db_populate.load_test_data()
+        return ([(s.song_id, s.times_played) for s in songs],
+                [(u.username, u.user_role) for u in users],
+                len(songs), len([s for s in songs if not s.is_explicit]))
+
+    # Only the fields needed, a catalog may hold millions of songs
+    db = db_populate.db
+    songs = [(s['_id'], s.get('times_played', 0)) for s in
+             db['songs'].find({}, {'times_played': 1}).batch_size(10000)]
+    users = [(u['username'], role) for role in UserRoles
+             for u in db['users'].find(
+                 {'user_role': role.value}, {'username': 1})
+             .limit(MAX_CREDENTIALS)]
+    num_clean_songs = db['songs'].count_documents(
+        {'is_explicit': {'$ne': True}})
+
+    return songs, users, len(songs), num_clean_songs
+
+
 # Users
 g_users = []
 g_admins = []
 g_maintainers = []
 
-# Init Db, Init test data
-from song_server.shared.configs import DevConfig
-db_populate = DbPopulate(DevConfig.DB_SOURCE_URL, DevConfig.DB_NAME)
-_songs, _users = db_populate.load_test_data()
-for u in _users:
-    if u.user_role.is_admin():
-        g_admins.append((u.username, "admin"))
-    if u.user_role.is_maintenance():
-        g_maintainers.append((u.username, "password"))
-    if u.user_role.is_user():
-        g_users.append((u.username, "password"))
+_songs, _users, _num_songs, _num_clean_songs = load_catalog()
+for username, user_role in _users:
+    if user_role.is_admin():
+        g_admins.append((username, ADMIN_PASSWORD))
+    if user_role.is_maintenance():
+        g_maintainers.append((username, COMMON_USER_PASSWORD))
+    if user_role.is_user():
+        g_users.append((username, COMMON_USER_PASSWORD))
+
+# Songs ranked by plays, the most played song is the most popular
+g_song_ids = [song_id for song_id, _ in
+              sorted(_songs, key=lambda s: s[1], reverse=True)]
+g_song_cum_weights = list(itertools.accumulate(
+    1 / (rank + 1) ** ZIPF_EXPONENT for rank in range(len(g_song_ids))))
+g_num_pages = max(math.ceil(_num_songs / DB_ENTRIES_PER_PAGE), 1)
+g_num_filtered_pages = max(
+    math.ceil(_num_clean_songs / DB_ENTRIES_PER_PAGE), 1)
+
+
+def scaled_between(min_wait, max_wait):
+    return locust.between(min_wait * WAIT_SCALE, max_wait * WAIT_SCALE)
+
+
+def zipf_song_id():
+    return random.choices(g_song_ids, cum_weights=g_song_cum_weights)[0]
 
 
 """
@@ -44,7 +123,7 @@ Common Tasks
 
 
 def request_login_user(user):
-    if not isinstance(user, ClientUser):
+    if not isinstance(user, SongServerUser):
         return
 
     headers = {
@@ -58,58 +137,88 @@ def request_login_user(user):
 
 
 def request_get_all_songs(user):
-    if not isinstance(user, ClientUser):
+    if not isinstance(user, SongServerUser):
         return
 
-    body = {}
-    user.client.get("get_songs", json=body)
+    user.client.get("get_songs")
+
+
+def request_get_deep_page(user):
+    if not isinstance(user, SongServerUser):
+        return
+
+    params = {"page": random.randint(1, g_num_pages)}
+    user.client.get("get_songs", params=params,
+                    name="/get_songs [deep page]")
+
+
+def request_get_filtered_songs(user):
+    if not isinstance(user, SongServerUser):
+        return
+
+    params = {
+        "is_filter_explicit": "true",
+        "page": random.randint(1, g_num_filtered_pages)
+    }
+    user.client.get("get_songs", params=params,
+                    name="/get_songs [filtered]")
 
 
 def request_like_song(user):
-    if not isinstance(user, ClientUser):
+    if not isinstance(user, SongServerUser):
         return
 
-    body = {"song_id": "3"}
+    body = {"song_id": zipf_song_id()}
     headers = {'Authorization': f'Bearer {user.access_token}'}
     user.client.post("like_song", json=body, headers=headers)
 
 
 def request_play_song(user):
-    if not isinstance(user, ClientUser):
+    if not isinstance(user, SongServerUser):
         return
 
-    body = {"song_id": "3"}
+    body = {"song_id": zipf_song_id()}
     headers = {'Authorization': f'Bearer {user.access_token}'}
     user.client.post("play_song", json=body, headers=headers)
 
 
 def request_add_new_song(user):
-    if not isinstance(user, ClientUser):
+    if not isinstance(user, SongServerUser):
         return
 
+    # Unique name and source url, every song is a new one
+    song_key = uuid.uuid4().hex
     body = {
-        "name": f"song-{random.randint(1, 1000)}",
-        "cover_url": f"cover-url-{random.randint(1, 1000)}",
-        "source_url": f"source-url-{random.randint(1, 1000)}",
+        "name": f"song-{song_key}",
+        "cover_url": f"cover-url-{song_key}",
+        "source_url": f"source-url-{song_key}",
         "is_explicit": bool(random.getrandbits(1))
     }
     headers = {'Authorization': f'Bearer {user.access_token}'}
     user.client.post("add_song", json=body, headers=headers)
 
 
+def request_get_stats(user):
+    if not isinstance(user, SongServerUser):
+        return
+
+    headers = {'Authorization': f'Bearer {user.access_token}'}
+    user.client.get("stats", headers=headers)
+
+
 """
 Locust Users
 """
 
 
-class ClientUser(locust.HttpUser):
-    weight = 100
-    wait_time = locust.between(2, 5)
-    tasks = {
-        request_play_song: 5,
-        request_like_song: 1,
-        request_get_all_songs: 3
-    }
+class SongServerUser(locust.HttpUser):
+
+    """
+    Logs in a random user of `credentials` on start
+    """
+
+    abstract = True
+    credentials = []
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
@@ -119,41 +228,36 @@ class ClientUser(locust.HttpUser):
         self.access_token = None
 
     def on_start(self):
-        self.username, self.password = random.choice(g_users)
+        self.username, self.password = random.choice(self.credentials)
         self.access_token = request_login_user(self)
 
 
-class MaintenanceUser(locust.HttpUser):
-    weight = 5
-    wait_time = locust.between(15, 30)
+class ClientUser(SongServerUser):
+    weight = 100
+    wait_time = scaled_between(2, 5)
+    credentials = g_users
     tasks = {
-        request_add_new_song: 1
+        request_play_song: 5,
+        request_like_song: 1,
+        request_get_all_songs: 3,
+        request_get_deep_page: 1,
+        request_get_filtered_songs: 1
     }
 
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
-        self.username = None
-        self.password = None
-        self.access_token = None
 
-    def on_start(self):
-        self.username, self.password = random.choice(g_maintainers)
-        self.access_token = request_login_user(self)
+class MaintenanceUser(SongServerUser):
+    weight = 5
+    wait_time = scaled_between(15, 30)
+    credentials = g_maintainers
+    tasks = {
+        request_add_new_song: 1
+    }
 
 
-class AdminUser(locust.HttpUser):
+class AdminUser(SongServerUser):
     weight = 1
-    wait_time = locust.between(60, 120)
-    tasks = {}
-
-    def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
-
-        self.username = None
-        self.password = None
-        self.access_token = None
-
-    def on_start(self):
-        self.username, self.password = random.choice(g_admins)
-        self.access_token = request_login_user(self)
+    wait_time = scaled_between(60, 120)
+    credentials = g_admins
+    tasks = {
+        request_get_stats: 1
+    }
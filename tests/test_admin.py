@@ -0,0 +1,247 @@
+import json
+import pytest
+
+from song_server.shared.errorcodes import *
+from song_server.shared.configs import *
+from song_server.shared.utils import encode_cursor
+from song_server.shared.utils import decode_cursor
+from song_server.shared.utils import remove_none_keys
+
+
+"""
+Tests for admin blueprint,
+Located at song_server/services/admin
+"""
+
+
+def login(app, username, password):
+    headers = {'username': username, 'password': password}
+    headers = remove_none_keys(headers)
+    request = app.post('/login', headers=headers)
+
+    access_token = (request.get_json() or {}).get('access_key')
+    if access_token is None:
+        return None
+
+    return {'Authorization': f'Bearer {access_token}'}
+
+
+@pytest.mark.parametrize(
+    "username, password, expected_code, return_code",
+    [
+        # Invalid login
+        (None, None, 401, SUCCESS),
+        ('admin', 'wrong_password', 401, SUCCESS),
+
+        # Only admins can view stats
+        ('Patrick Smith', 'password', 400, PRIVILEGE_ERROR),
+        ('Barbara Rocha', 'password', 400, PRIVILEGE_ERROR),
+
+        # Valid admin request
+        ('admin', 'admin', 200, SUCCESS),
+    ]
+)
+def test_get_stats(app, username, password, expected_code, return_code):
+
+    headers = login(app, username, password)
+    request = app.get('/stats', headers=headers)
+
+    assert request is not None
+    assert request.get_json() is not None
+    assert request.status_code == expected_code
+
+    request_code = request.get_json().get('code') or 0
+    assert request_code == return_code
+    if request.status_code != 200:
+        return
+
+    data = request.get_json().get('data')
+    assert data['backend'] == TestConfig.DB_BACKEND
+    assert 'hash_pool' in data
+    assert 'bytes_out' in data['compression']
+    if data['backend'] == DB_BACKEND_MONGO:
+        assert 'mode' in data['counters']
+        assert 'saturation' in data['db_pool']
+        assert 'db_commands' in data
+        assert 'coalesced' in data['single_flight']
+
+
+@pytest.mark.parametrize(
+    "username, password, params, expected_code, return_code",
+    [
+        # Invalid login
+        ('admin', 'wrong_password', {}, 401, SUCCESS),
+
+        # Only admins can export
+        ('Patrick Smith', 'password', {}, 400, PRIVILEGE_ERROR),
+        ('Barbara Rocha', 'password', {}, 400, PRIVILEGE_ERROR),
+
+        # Valid exports
+        ('admin', 'admin', {}, 200, SUCCESS),
+        ('admin', 'admin', {'batch_size': '3'}, 200, SUCCESS),
+        ('admin', 'admin', {'is_filter_explicit': 'true'}, 200, SUCCESS),
+        ('admin', 'admin', {'since': encode_cursor({'_id': '5'})}, 200, SUCCESS),
+
+        # Invalid params
+        ('admin', 'admin', {'batch_size': '0'}, 400, INVALID_DATA_FORMAT),
+        ('admin', 'admin', {'batch_size': 'all'}, 400, INVALID_DATA_FORMAT),
+        ('admin', 'admin', {'batch_size': '\u00b2'}, 400, INVALID_DATA_FORMAT),
+        ('admin', 'admin', {'is_filter_explicit': 'yes'}, 400, INVALID_DATA_FORMAT),
+        ('admin', 'admin', {'since': 'not-a-cursor'}, 400, INVALID_CURSOR),
+        ('admin', 'admin', {'since': encode_cursor({'_id': 5})}, 400,
+         INVALID_CURSOR),
+        ('admin', 'admin', {'since': encode_cursor({'_id': {'$gt': ''}})}, 400,
+         INVALID_CURSOR),
+    ]
+)
+def test_export_songs(app, songs_data, username, password, params,
+                      expected_code, return_code):
+
+    headers = login(app, username, password)
+    request = app.get('/export_songs', headers=headers, query_string=params)
+
+    assert request is not None
+    assert request.status_code == expected_code
+    if request.status_code != 200:
+        request_code = request.get_json().get('code') or 0
+        assert request_code == return_code
+        return
+
+    assert request.mimetype == 'application/x-ndjson'
+    lines = [json.loads(line) for line in request.data.splitlines()]
+
+    # Every song after `since`, ordered by id
+    since = decode_cursor(params['since'])['_id'] \
+        if 'since' in params else None
+    expected = sorted(
+        [s.to_json() for s in songs_data
+         if (since is None or s.song_id > since) and
+         (params.get('is_filter_explicit') != 'true' or not s.is_explicit)],
+        key=lambda s: s['_id'])
+
+    songs = lines[:-1]
+    assert [s['_id'] for s in songs] == [s['_id'] for s in expected]
+
+    # Resuming from the marker exports nothing more
+    next_since = lines[-1]['next_since']
+    assert decode_cursor(next_since)['_id'] == expected[-1]['_id']
+    request = app.get('/export_songs', headers=headers,
+                      query_string={**params, 'since': next_since})
+    assert request.status_code == 200
+    assert [json.loads(line) for line in request.data.splitlines()] == \
+        [{'next_since': next_since}]
+
+
+@pytest.mark.parametrize(
+    "username, password, params, expected_code, return_code",
+    [
+        # Invalid login
+        ('admin', 'wrong_password', {}, 401, SUCCESS),
+
+        # Only admins can profile
+        ('Patrick Smith', 'password', {}, 400, PRIVILEGE_ERROR),
+        ('Barbara Rocha', 'password', {}, 400, PRIVILEGE_ERROR),
+
+        # Valid profile
+        ('admin', 'admin', {'seconds': '1', 'interval_ms': '5'}, 200, SUCCESS),
+
+        # Invalid params
+        ('admin', 'admin', {'seconds': '0'}, 400, INVALID_DATA_FORMAT),
+        ('admin', 'admin', {'seconds': '3600'}, 400, INVALID_DATA_FORMAT),
+        ('admin', 'admin', {'interval_ms': '0'}, 400, INVALID_DATA_FORMAT),
+        ('admin', 'admin', {'interval_ms': 'fast'}, 400, INVALID_DATA_FORMAT),
+        ('admin', 'admin', {'seconds': '\u00b2'}, 400, INVALID_DATA_FORMAT),
+        ('admin', 'admin', {'interval_ms': '\u00b2'}, 400,
+         INVALID_DATA_FORMAT),
+    ]
+)
+def test_profile(app, username, password, params,
+                 expected_code, return_code):
+    import threading
+
+    # A busy thread for the profiler to sample
+    done = threading.Event()
+
+    def busy_loop():
+        while not done.is_set():
+            sum(range(1000))
+
+    thread = threading.Thread(target=busy_loop, daemon=True)
+    thread.start()
+
+    headers = login(app, username, password)
+    request = app.get('/profile', headers=headers, query_string=params)
+    done.set()
+    thread.join()
+
+    assert request is not None
+    assert request.status_code == expected_code
+    if request.status_code != 200:
+        request_code = request.get_json().get('code') or 0
+        assert request_code == return_code
+        return
+
+    assert request.mimetype == 'text/plain'
+    lines = request.get_data(as_text=True).splitlines()
+    assert all(line.rpartition(' ')[2].isdigit() for line in lines)
+    assert any('busy_loop' in line for line in lines)
+
+
+def test_profile_disabled(app):
+    # As initialized with PROFILER_ENABLED off
+    app.application.extensions.pop('profiler')
+
+    request = app.get('/profile', headers=login(app, 'admin', 'admin'))
+    assert request.status_code == 404
+    assert request.get_json().get('code') == FEATURE_DISABLED
+
+
+def test_reinit_after_fork(app):
+    from song_server.extensions.extinit import prepare_extensions_for_fork
+    from song_server.extensions.extinit import reinit_extensions_after_fork
+
+    headers = login(app, 'admin', 'admin')
+
+    # As done by serve.py around every worker fork
+    prepare_extensions_for_fork()
+    reinit_extensions_after_fork(app.application)
+
+    # Tokens issued before the fork stay valid, the db is reachable
+    request = app.get('/stats', headers=headers)
+    assert request.status_code == 200
+    assert login(app, 'admin', 'admin')
+
+
+@pytest.mark.parametrize(
+    "db_backend, workers, is_valid",
+    [
+        (DB_BACKEND_MONGO, 1, True),
+        (DB_BACKEND_MONGO, 4, True),
+        (DB_BACKEND_MEMORY, 1, True),
+        # Each forked worker would serve its own catalog
+        (DB_BACKEND_MEMORY, 2, False),
+    ]
+)
+def test_serve_check_workers(db_backend, workers, is_valid):
+    from serve import check_workers
+
+    if is_valid:
+        check_workers(db_backend, workers)
+        return
+
+    with pytest.raises(ValueError):
+        check_workers(db_backend, workers)
+
+
+def test_migrate_db(app):
+    from song_server.extensions.dbhelper import db_helper
+    from song_server.extensions.extinit import migrate_db
+
+    # As on a fresh db, without the first admin user
+    db_helper.remove_user('admin')
+    assert login(app, 'admin', 'admin') is None
+
+    # Idempotent, run by every deploy
+    migrate_db()
+    migrate_db()
+    assert login(app, 'admin', 'admin') is not None
@@ -0,0 +1,119 @@
+import gzip
+import json
+import pytest
+
+from song_server.shared.configs import *
+from song_server.extensions.compression import *
+
+
+"""
+Tests for response compression,
+Located at song_server/extensions/compression.py
+"""
+
+
+def decompress(data, encoding):
+    if encoding == ENCODING_GZIP:
+        return gzip.decompress(data)
+    if encoding == ENCODING_BROTLI:
+        return brotli.decompress(data)
+    if encoding == ENCODING_ZSTD:
+        return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+    return data
+
+
+def require_codec(encoding):
+    if encoding == ENCODING_BROTLI and brotli is None:
+        pytest.skip('requires the brotli package')
+    if encoding == ENCODING_ZSTD and zstandard is None:
+        pytest.skip('requires the zstandard package')
+
+
+@pytest.mark.parametrize(
+    "accept_encoding, expected_encoding",
+    [
+        # Not negotiated
+        (None, None),
+        ('identity', None),
+        ('deflate', None),
+        ('gzip;q=0', None),
+
+        # Single encoding
+        ('gzip', ENCODING_GZIP),
+        ('br', ENCODING_BROTLI),
+        ('zstd', ENCODING_ZSTD),
+
+        # Client preference, then server preference
+        ('gzip;q=1.0, br;q=0.5', ENCODING_GZIP),
+        ('gzip, br', ENCODING_BROTLI),
+        ('gzip, zstd', ENCODING_ZSTD),
+    ]
+)
+def test_compress_songs(app, accept_encoding, expected_encoding):
+    require_codec(expected_encoding)
+
+    plain = app.get('/get_songs')
+    headers = {'Accept-Encoding': accept_encoding} if accept_encoding else {}
+    request = app.get('/get_songs', headers=headers)
+
+    assert request.status_code == 200
+    assert 'Accept-Encoding' in request.headers.get('Vary')
+    assert request.headers.get('Content-Encoding') == expected_encoding
+    assert request.content_length == len(request.get_data())
+
+    data = decompress(request.get_data(), expected_encoding)
+    assert json.loads(data) == plain.get_json()
+
+    # Compressed bytes differ, only a weak ETag match is possible
+    etag, is_weak = request.get_etag()
+    assert is_weak == (expected_encoding is not None)
+    assert etag == plain.get_etag()[0]
+
+    request = app.get('/get_songs', headers={
+        **headers, 'If-None-Match': request.headers['ETag']})
+    assert request.status_code == 304
+
+
+def test_compress_small_response(app):
+    # Below COMPRESSION_MIN_BYTES
+    request = app.get('/charts', query_string={'by': 'plays', 'limit': '1'},
+                      headers={'Accept-Encoding': 'gzip'})
+
+    assert request.status_code == 200
+    assert len(request.get_data()) < TestConfig.COMPRESSION_MIN_BYTES
+    assert request.headers.get('Content-Encoding') is None
+    assert 'Accept-Encoding' in request.headers.get('Vary')
+
+
+def test_compression_cache(app):
+    headers = {'Accept-Encoding': 'gzip'}
+    query = {'page': '1', 'is_filter_explicit': 'true'}
+    first = app.get('/get_songs', headers=headers, query_string=query)
+    compressor = app.application.extensions['compression']
+    hits = compressor.cache.stats()['hits']
+    num_compressed = compressor.counters[ENCODING_GZIP]
+
+    # Same url and ETag, the cached bytes are sent
+    second = app.get('/get_songs', headers=headers, query_string=query)
+    assert second.get_etag() == first.get_etag()
+    assert second.get_data() == first.get_data()
+    assert compressor.cache.stats()['hits'] == hits + 1
+    assert compressor.counters[ENCODING_GZIP] == num_compressed
+
+    # Another url is another entry
+    app.get('/get_songs', headers=headers, query_string={'page': '1'})
+    assert compressor.counters[ENCODING_GZIP] == num_compressed + 1
+
+
+def test_compress_export(app, songs_data):
+    request = app.post('/login', headers={
+        'username': 'admin', 'password': 'admin'})
+    headers = {'Authorization': f'Bearer {request.get_json()["access_key"]}'}
+    plain = app.get('/export_songs', headers=headers)
+    request = app.get('/export_songs', headers={
+        **headers, 'Accept-Encoding': 'gzip'})
+
+    assert request.status_code == 200
+    assert request.headers.get('Content-Encoding') == ENCODING_GZIP
+    assert request.headers.get('Content-Length') is None
+    assert gzip.decompress(request.get_data()) == plain.get_data()
@@ -0,0 +1,88 @@
+import pytest
+
+from song_server.shared.errorcodes import *
+
+
+"""
+Tests for request metrics,
+Located at song_server/extensions/metrics.py
+"""
+
+
+def get_metrics(app):
+    request = app.get('/metrics')
+    assert request.status_code == 200
+    assert request.mimetype == 'text/plain'
+
+    # {series: value}
+    metrics = {}
+    for line in request.get_data(as_text=True).splitlines():
+        if line and not line.startswith('#'):
+            series, _, value = line.rpartition(' ')
+            metrics[series] = float(value)
+
+    return metrics
+
+
+@pytest.mark.parametrize(
+    "query, status, error_code",
+    [
+        ({}, 200, None),
+        ({'page': '-1'}, 400, INVALID_DATA_FORMAT),
+    ]
+)
+def test_metrics(app, query, status, error_code):
+    endpoint = 'songs.get_all_songs'
+    error_series = f'song_server_error_codes_total{{code="{error_code}",' \
+                   f'name="INVALID_DATA_FORMAT"}}'
+    before = get_metrics(app)
+
+    request = app.get('/get_songs', query_string=query)
+    assert request.status_code == status
+
+    after = get_metrics(app)
+
+    def delta(series):
+        return after.get(series, 0) - before.get(series, 0)
+
+    assert delta(f'song_server_requests_total{{endpoint="{endpoint}",'
+                 f'status="{status}"}}') == 1
+    assert delta(f'song_server_request_duration_seconds_count'
+                 f'{{endpoint="{endpoint}"}}') == 1
+    assert delta(f'song_server_request_duration_seconds_bucket'
+                 f'{{endpoint="{endpoint}",le="+Inf"}}') == 1
+    assert delta(f'song_server_db_duration_seconds_count'
+                 f'{{endpoint="{endpoint}"}}') == 1
+    assert delta(f'song_server_response_bytes_total'
+                 f'{{endpoint="{endpoint}"}}') == len(request.get_data())
+    assert delta(error_series) == (1 if error_code is not None else 0)
+
+
+@pytest.mark.parametrize("is_propagated", [True, False])
+def test_metrics_unhandled_exception(app, is_propagated):
+    endpoint = 'fail'
+    flask_app = app.application
+    flask_app.config['PROPAGATE_EXCEPTIONS'] = is_propagated
+
+    @flask_app.route('/fail')
+    def fail():
+        raise RuntimeError('unhandled')
+
+    before = get_metrics(app)
+
+    # Handled by the json 500 handler, or raised to the wsgi server
+    if is_propagated:
+        with pytest.raises(RuntimeError):
+            app.get('/fail')
+
+        # No response was started, the endpoint is unknown
+        endpoint = 'unmatched'
+    else:
+        request = app.get('/fail')
+        assert request.status_code == 500
+        assert request.is_json
+
+    after = get_metrics(app)
+    series = f'song_server_requests_total{{endpoint="{endpoint}",' \
+             f'status="500"}}'
+    assert after.get(series, 0) - before.get(series, 0) == 1
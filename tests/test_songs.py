@@ -3,6 +3,7 @@ import pytest
 from song_server.shared.errorcodes import *
 from song_server.shared.configs import *
 from song_server.shared.utils import remove_none_keys
+from song_server.shared.utils import encode_cursor
 
 
 """
@@ -10,41 +11,44 @@ Tests for songs blueprint,
 Located at song_server/services/songs
 """
 
+# Tests of components only the mongo backend has
+mongo_only = pytest.mark.skipif(
+    TestConfig.DB_BACKEND != DB_BACKEND_MONGO,
+    reason='requires the mongo backend')
+
 
 @pytest.mark.parametrize(
-    "is_filter_explicit, page_number, expected_code, return_code",
+    "is_filter_explicit, page, expected_code, return_code",
     [
         # None data
-        (None, None, 201, SUCCESS),
-        (True, None, 201, SUCCESS),
-        # 0 page-number gets converted to 1
-        (None, 0, 201, SUCCESS),
+        (None, None, 200, SUCCESS),
+        ('true', None, 200, SUCCESS),
 
-        # page-number
-        (None, -1, 400, INVALID_DATA_FORMAT),
-        (None, -999, 400, INVALID_DATA_FORMAT),
-        (None, 1, 201, SUCCESS),
-        (None, 99999, 201, SUCCESS),
+        # page
+        (None, '0', 400, INVALID_DATA_FORMAT),
+        (None, '-1', 400, INVALID_DATA_FORMAT),
+        (None, '-999', 400, INVALID_DATA_FORMAT),
+        (None, '\u00b2', 400, INVALID_DATA_FORMAT),
+        (None, str(MAX_PAGE_NUMBER + 1), 400, INVALID_DATA_FORMAT),
+        (None, '1', 200, SUCCESS),
+        (None, '99999', 200, SUCCESS),
 
         # is-filter-explicit
-        (True, 1, 201, SUCCESS),
-        (False, 1, 201, SUCCESS),
+        ('true', '1', 200, SUCCESS),
+        ('false', '1', 200, SUCCESS),
 
-        # Invalid data types
-        (100, "wrong-data", 400, INVALID_DATA_FORMAT),
-        (True, "wrong-data", 400, INVALID_DATA_FORMAT),
-        ("wrong-data", 1, 400, INVALID_DATA_FORMAT),
+        # Invalid values
+        ('100', 'wrong-data', 400, INVALID_DATA_FORMAT),
+        ('true', 'wrong-data', 400, INVALID_DATA_FORMAT),
+        ('wrong-data', '1', 400, INVALID_DATA_FORMAT),
     ]
 )
-def test_get_all_songs(app, songs_data, is_filter_explicit, page_number,
+def test_get_all_songs(app, songs_data, is_filter_explicit, page,
                        expected_code, return_code):
 
-    body = {
-        'is_filter_explicit': is_filter_explicit,
-        'page_number': page_number
-    }
-    body = remove_none_keys(body)
-    request = app.get('/get_songs', json=body)
+    query = remove_none_keys(
+        {'is_filter_explicit': is_filter_explicit, 'page': page})
+    request = app.get('/get_songs', query_string=query)
 
     assert request is not None
     assert request.get_json() is not None
@@ -53,11 +57,11 @@ def test_get_all_songs(app, songs_data, is_filter_explicit, page_number,
     assert request_return_code == return_code
     assert request.status_code == expected_code
 
-    if request.status_code == 201:
+    if request.status_code == 200:
 
         # default transformations within request
-        is_filter_explicit = is_filter_explicit or False
-        page_number = page_number or 1
+        is_filter_explicit = is_filter_explicit == 'true'
+        page_number = int(page or 1)
 
         expected_data = [s.to_json() for s in songs_data
                          if not s.is_explicit or not is_filter_explicit]
@@ -71,6 +75,688 @@ def test_get_all_songs(app, songs_data, is_filter_explicit, page_number,
         assert request.get_json() == dict(data=expected_data)
 
 
+@pytest.mark.parametrize(
+    "body, expected_code, return_code",
+    [
+        # Same filters as the query params
+        ({}, 200, SUCCESS),
+        ({'page_number': 1}, 200, SUCCESS),
+        ({'page_number': 0}, 200, SUCCESS),
+        ({'page_number': 3, 'is_filter_explicit': True}, 200, SUCCESS),
+        ({'cursor': ''}, 200, SUCCESS),
+
+        # Invalid data
+        ({'page_number': -1}, 400, INVALID_DATA_FORMAT),
+        ({'page_number': 'wrong-data'}, 400, INVALID_DATA_FORMAT),
+        ({'is_filter_explicit': 'wrong-data'}, 400, INVALID_DATA_FORMAT),
+        ({'cursor': 100}, 400, INVALID_DATA_FORMAT),
+        ([1], 400, INVALID_DATA_FORMAT),
+    ]
+)
+def test_get_songs_legacy_body(app, body, expected_code, return_code):
+    request = app.get('/get_songs', json=body)
+
+    request_return_code = request.get_json().get('code') or 0
+    assert request_return_code == return_code
+    assert request.status_code == expected_code
+    if request.status_code != 200:
+        return
+
+    # Same data as the query params, never cached
+    query = {'page': str(body.get('page_number') or 1),
+             'is_filter_explicit':
+                 'true' if body.get('is_filter_explicit') else 'false'}
+    if 'cursor' in body:
+        query['cursor'] = body['cursor']
+    assert request.get_json() == \
+        app.get('/get_songs', query_string=query).get_json()
+    assert request.cache_control.no_store
+    assert request.headers.get('ETag') is None
+
+
+@pytest.mark.parametrize(
+    "is_filter_explicit, resume_index, cursor, expected_code, return_code",
+    [
+        # First page
+        (None, None, '', 200, SUCCESS),
+        ('true', None, '', 200, SUCCESS),
+
+        # Resume after a song
+        (None, 0, None, 200, SUCCESS),
+        (None, 4, None, 200, SUCCESS),
+        ('true', 2, None, 200, SUCCESS),
+        # Resume after the last song
+        (None, -1, None, 200, SUCCESS),
+
+        # Invalid cursors
+        (None, None, 'not-a-cursor', 400, INVALID_CURSOR),
+        (None, None, encode_cursor({'name': 'a'}), 400, INVALID_CURSOR),
+        (None, None, encode_cursor({'name': 1, '_id': 'a'}), 400,
+         INVALID_CURSOR),
+        # Query operators are never passed on to the db
+        (None, None, encode_cursor({'name': {'$ne': None}, '_id': 'a'}), 400,
+         INVALID_CURSOR),
+        (None, None, encode_cursor({'name': 'a', '_id': {'$gt': ''}}), 400,
+         INVALID_CURSOR),
+        ('wrong-data', None, '', 400, INVALID_DATA_FORMAT),
+    ]
+)
+def test_get_songs_cursor(app, songs_data, is_filter_explicit, resume_index,
+                          cursor, expected_code, return_code):
+
+    query = remove_none_keys(
+        {'is_filter_explicit': is_filter_explicit, 'cursor': cursor})
+    is_filter_explicit = is_filter_explicit == 'true'
+    expected_data = [s.to_json() for s in songs_data
+                     if not s.is_explicit or not is_filter_explicit]
+    expected_data.sort(key=lambda x: (x['name'], x['_id']))
+
+    # Build the cursor pointing after the song at `resume_index`
+    if resume_index is not None:
+        last = expected_data[resume_index]
+        query['cursor'] = encode_cursor(
+            {'name': last['name'], '_id': last['_id']})
+        expected_data = expected_data[resume_index + 1:] \
+            if resume_index != -1 else []
+
+    request = app.get('/get_songs', query_string=query)
+
+    assert request is not None
+    assert request.get_json() is not None
+
+    request_return_code = request.get_json().get('code') or 0
+    assert request_return_code == return_code
+    assert request.status_code == expected_code
+
+    if request.status_code == 200:
+        expected_data = expected_data[:DB_ENTRIES_PER_PAGE]
+        assert request.get_json() == dict(
+            data=expected_data, next_cursor=None)
+
+
+def test_get_songs_http_cache(app, songs_data, monkeypatch):
+    from song_server.models.song import Song
+    from song_server.services.songs.routes import db_helper
+
+    request = app.get('/get_songs', query_string={'page': '1'})
+    etag = request.headers.get('ETag')
+
+    assert request.status_code == 200
+    assert etag is not None and not etag.startswith('W/')
+    assert request.cache_control.public
+    assert request.cache_control.max_age == \
+        TestConfig.SONGS_HTTP_MAX_AGE_SEC
+
+    # A matching ETag is answered without reading the songs
+    def no_read(*args, **kwargs):
+        raise AssertionError('songs read on a 304')
+
+    with monkeypatch.context() as m:
+        m.setattr(db_helper, 'get_songs', no_read)
+        m.setattr(db_helper, 'get_songs_after', no_read)
+
+        request = app.get('/get_songs', headers={'If-None-Match': etag})
+        assert request.status_code == 304
+        assert request.get_data() == b''
+        assert request.headers.get('ETag') == etag
+
+        request = app.get('/get_songs', query_string={'cursor': ''},
+                          headers={'If-None-Match': etag})
+        assert request.status_code == 304
+
+    # A new song changes the catalog version
+    version = db_helper.get_catalog_version()
+    assert db_helper.add_item(Song('Http cache song', 'url', 'url')) == SUCCESS
+    assert db_helper.get_catalog_version() > version
+
+    request = app.get('/get_songs', headers={'If-None-Match': etag})
+    assert request.status_code == 200
+    assert request.headers.get('ETag') != etag
+
+    assert db_helper.remove_song('Http cache song', 'url') == SUCCESS
+
+
+@mongo_only
+def test_page_cache_other_worker_write(app, songs_data, monkeypatch):
+    from song_server.models.song import Song
+    from song_server.services.songs.routes import db_helper
+
+    def page_names():
+        request = app.get('/get_songs', query_string={'page': '1'})
+        assert request.status_code == 200
+        return [s['name'] for s in request.get_json()['data']], \
+            request.headers['ETag']
+
+    names, etag = page_names()
+
+    # Written by another worker, only the shared version changes here
+    song = Song('AAA other worker song', 'url', 'url').to_json()
+    db_helper.col_songs.insert_one(song)
+    db_helper.col_meta.update_one(
+        {'_id': 'catalog'}, {'$inc': {'version': 1}}, upsert=True)
+
+    # Seen on the next refresh, by the ETag and the cached pages alike
+    monkeypatch.setattr(db_helper, 'catalog_version_refresh_sec', 0)
+    new_names, new_etag = page_names()
+    assert new_etag != etag
+    assert new_names[0] == 'AAA other worker song'
+
+    db_helper.col_songs.delete_one({'_id': song['_id']})
+
+
+def test_get_songs_no_http_cache(app, monkeypatch):
+    monkeypatch.setitem(app.application.config, 'SONGS_HTTP_MAX_AGE_SEC', 0)
+
+    request = app.get('/get_songs')
+    assert request.status_code == 200
+    assert request.cache_control.no_store
+    assert request.headers.get('ETag') is None
+
+
+@pytest.mark.parametrize(
+    "url, query",
+    [
+        ('/get_songs', {}),
+        ('/get_songs', {'cursor': ''}),
+        ('/charts', {'by': 'plays'}),
+        ('/suggest', {'prefix': 's'}),
+    ]
+)
+@pytest.mark.parametrize(
+    "accept, mimetype",
+    [
+        (None, 'application/json'),
+        ('*/*', 'application/json'),
+        ('application/msgpack', 'application/msgpack'),
+        ('application/x-msgpack', 'application/x-msgpack'),
+        ('application/cbor', 'application/cbor'),
+        ('application/cbor;q=0.5, application/msgpack', 'application/msgpack'),
+        ('text/html', 'application/json'),
+    ]
+)
+def test_wire_formats(app, url, query, accept, mimetype):
+    from song_server.shared.serializers import msgpack
+    from song_server.shared.serializers import cbor2
+
+    expected = app.get(url, query_string=query).get_json()
+    headers = {'Accept': accept} if accept else {}
+    request = app.get(url, query_string=query, headers=headers)
+
+    assert request.status_code == 200
+    assert request.mimetype == mimetype
+    assert 'Accept' in request.headers.get('Vary')
+
+    # Same data and schema as the json response
+    data = request.get_data()
+    if 'msgpack' in mimetype:
+        data = msgpack.unpackb(data)
+    elif 'cbor' in mimetype:
+        data = cbor2.loads(data)
+    else:
+        data = request.get_json()
+    assert data == expected
+
+    # Every format has its own ETag
+    if url == '/get_songs' and accept is not None:
+        json_etag = app.get(url, query_string=query).get_etag()[0]
+        assert (request.get_etag()[0] == json_etag) == \
+            (mimetype == 'application/json')
+
+
+@pytest.mark.parametrize(
+    "by, limit, is_filter_explicit, expected_code, return_code",
+    [
+        # Defaults
+        ('plays', None, None, 200, SUCCESS),
+        ('likes', None, None, 200, SUCCESS),
+
+        # Limits
+        ('plays', '1', None, 200, SUCCESS),
+        ('likes', '5', 'false', 200, SUCCESS),
+        ('plays', str(MAX_CHART_LIMIT), 'false', 200, SUCCESS),
+
+        # Explicit filter
+        ('plays', '5', 'true', 200, SUCCESS),
+        ('likes', '100', 'true', 200, SUCCESS),
+
+        # Invalid params
+        (None, None, None, 400, INVALID_DATA_FORMAT),
+        ('songs', None, None, 400, INVALID_DATA_FORMAT),
+        ('plays', '0', None, 400, INVALID_DATA_FORMAT),
+        ('plays', '-1', None, 400, INVALID_DATA_FORMAT),
+        ('plays', 'ten', None, 400, INVALID_DATA_FORMAT),
+        ('plays', '\u00b2', None, 400, INVALID_DATA_FORMAT),
+        ('plays', '9' * 5000, None, 400, INVALID_DATA_FORMAT),
+        ('plays', str(MAX_CHART_LIMIT + 1), None, 400, INVALID_DATA_FORMAT),
+        ('likes', '5', 'yes', 400, INVALID_DATA_FORMAT),
+    ]
+)
+def test_get_charts(app, by, limit, is_filter_explicit,
+                    expected_code, return_code):
+    from song_server.extensions.dbhelper import db_helper
+
+    params = {'by': by, 'limit': limit,
+              'is_filter_explicit': is_filter_explicit}
+    request = app.get('/charts', query_string=remove_none_keys(params))
+
+    assert request is not None
+    assert request.get_json() is not None
+    assert request.status_code == expected_code
+
+    request_code = request.get_json().get('code') or 0
+    assert request_code == return_code
+    if request.status_code != 200:
+        return
+
+    # Same ranking as a sort over the collection
+    field = 'times_played' if by == 'plays' else 'num_likes'
+    expected = [s for s in db_helper.export_songs()
+                if is_filter_explicit != 'true' or not s['is_explicit']]
+    expected.sort(key=lambda s: (-s[field], s['_id']))
+    expected = [s['_id'] for s in expected[:int(limit or 10)]]
+
+    assert [s['_id'] for s in request.get_json()['data']] == expected
+
+
+@pytest.mark.parametrize("song_id, field, by", [
+    ('7', 'times_played', 'plays'),
+    ('8', 'num_likes', 'likes'),
+])
+def test_charts_follow_counters(app, song_id, field, by):
+    # The db helper instance serving the songs blueprint
+    from song_server.services.songs.routes import db_helper
+
+    def chart_top():
+        request = app.get('/charts', query_string={'by': by, 'limit': '1'})
+        assert request.status_code == 200
+        return request.get_json()['data'][0]
+
+    # Push the song to the top of the chart
+    top = chart_top()
+    song = db_helper.get_song(song_id)
+    increment = top[field] - song[field] + 1
+    if field == 'times_played':
+        db_helper.play_songs({song_id: increment})
+    else:
+        db_helper.like_songs({song_id: increment})
+
+    assert chart_top()['_id'] == song_id
+    assert chart_top()[field] == top[field] + 1
+
+    # Restore the counter
+    if field == 'times_played':
+        db_helper.play_songs({song_id: -increment})
+    else:
+        db_helper.like_songs({song_id: -increment})
+
+
+@pytest.mark.parametrize(
+    "song_id, period, count, expected_code, return_code",
+    [
+        # Valid windows
+        ('3', 'hour', None, 200, SUCCESS),
+        ('3', 'hour', str(MAX_PLAY_WINDOW_HOURS), 200, SUCCESS),
+        ('3', 'day', '7', 200, SUCCESS),
+
+        # Song id
+        (None, 'hour', '1', 400, INVALID_SONG_DETAILS),
+        ('song-id' * 100, 'hour', '1', 400, INVALID_SONG_DETAILS),
+        ('song-id', 'hour', '1', 400, SONG_NOT_FOUND),
+        # Period
+        ('3', None, '1', 400, INVALID_DATA_FORMAT),
+        ('3', 'week', '1', 400, INVALID_DATA_FORMAT),
+        # Count
+        ('3', 'hour', '0', 400, INVALID_DATA_FORMAT),
+        ('3', 'hour', '-1', 400, INVALID_DATA_FORMAT),
+        ('3', 'hour', '\u00b2', 400, INVALID_DATA_FORMAT),
+        ('3', 'hour', str(MAX_PLAY_WINDOW_HOURS + 1), 400,
+         INVALID_DATA_FORMAT),
+        ('3', 'day', str(MAX_PLAY_WINDOW_DAYS + 1), 400,
+         INVALID_DATA_FORMAT),
+    ]
+)
+def test_song_plays(app, play_log, song_id, period, count,
+                    expected_code, return_code):
+
+    params = {'song_id': song_id, 'period': period, 'count': count}
+    request = app.get('/song_plays', query_string=remove_none_keys(params))
+
+    assert request is not None
+    assert request.get_json() is not None
+    assert request.status_code == expected_code
+
+    request_code = request.get_json().get('code') or 0
+    assert request_code == return_code
+    if request.status_code != 200:
+        return
+
+    data = request.get_json()['data']
+    assert data['song_id'] == song_id
+    assert data['plays'] >= 0
+
+
+def test_song_plays_rollups(app, play_log):
+    from song_server.services.songs.routes import db_helper
+
+    # Login the user to obtain an access token
+    request = app.post('/login', headers={'username': 'Patrick Smith',
+                                          'password': 'password'})
+    headers = {'Authorization':
+               f'Bearer {request.get_json()["access_key"]}'}
+
+    def song_plays(period):
+        request = app.get('/song_plays', query_string={
+            'song_id': '4', 'period': period, 'count': '2'})
+        assert request.status_code == 200
+        return request.get_json()['data']['plays']
+
+    before = {'hour': song_plays('hour'), 'day': song_plays('day'),
+              'total': db_helper.get_song('4')['times_played']}
+
+    for _ in range(3):
+        request = app.post('/play_song', json={'song_id': '4'},
+                           headers=headers)
+        assert request.status_code == 201
+    request = app.post('/play_songs', headers=headers, json={'songs': [
+        {'song_id': '4', 'count': 2}, {'song_id': 'song-id'}]})
+    assert request.status_code == 201
+
+    if play_log is not None:
+        play_log.flush()
+
+    assert song_plays('hour') == before['hour'] + 5
+    assert song_plays('day') == before['day'] + 5
+    assert db_helper.get_song('4')['times_played'] == before['total'] + 5
+
+
+@mongo_only
+def test_song_plays_retried_batch(app, play_log, monkeypatch):
+    from song_server.services.songs.routes import db_helper
+
+    def song_plays(period):
+        return db_helper.get_song_plays('5', period, 1)
+
+    before = {'hour': song_plays('hour'), 'day': song_plays('day'),
+              'total': db_helper.get_song('5')['times_played']}
+
+    # The rollups are written, times_played fails, the last write
+    songs = FailingCollection(db_helper.col_songs, {1})
+    monkeypatch.setattr(db_helper, 'col_songs', songs)
+    assert db_helper.play_songs({'5': 3}) == {'5': SUCCESS}
+    assert play_log.flush() == 0
+    assert play_log.stats()['failed_batches'] == 1
+    assert play_log.stats()['pending'] == 1
+    assert song_plays('hour') == before['hour'] + 3
+
+    # Retried as is, every write skips what the batch already applied
+    assert play_log.flush() == 1
+    assert play_log.stats()['pending'] == 0
+    assert song_plays('hour') == before['hour'] + 3
+    assert song_plays('day') == before['day'] + 3
+    assert db_helper.get_song('5')['times_played'] == before['total'] + 3
+    assert db_helper.col_play_events.count_documents({'song_id': '5'}) == 1
+
+
+@mongo_only
+def test_song_plays_disabled(app):
+    request = app.get('/song_plays', query_string={
+        'song_id': '3', 'period': 'hour'})
+    assert request.status_code == 404
+    assert request.get_json().get('code') == FEATURE_DISABLED
+
+
+def test_top_songs_capacity():
+    from song_server.extensions.charts import TopSongs
+
+    songs = {str(i): {'_id': str(i), 'name': f'song-{i}', 'source_url': 'url',
+                      'is_explicit': i % 2 == 0, 'times_played': i * 10}
+             for i in range(10)}
+
+    def load(field, limit, explicit_query):
+        ret = [s for s in songs.values()
+               if not explicit_query or not s['is_explicit']]
+        ret.sort(key=lambda s: (-s[field], s['_id']))
+        return [dict(s) for s in ret[:limit]]
+
+    def top_ids(limit, explicit_query=False):
+        return [s['_id'] for s in chart.top(limit, explicit_query)]
+
+    chart = TopSongs('times_played', 3, 60, load)
+    assert top_ids(3) == ['9', '8', '7']
+    assert chart.stats()['loads'] == 1
+
+    # A song outside the top-K enters it
+    songs['2']['times_played'] = 85
+    chart.offer(dict(songs['2']))
+    assert top_ids(3) == ['9', '2', '8']
+
+    # Below the lowest ranked song, ignored
+    songs['1']['times_played'] = 20
+    chart.offer(dict(songs['1']))
+    assert top_ids(3) == ['9', '2', '8']
+
+    # Explicit songs filled the top-K, served by the db
+    assert top_ids(2, explicit_query=True) == ['9', '7']
+    assert chart.stats()['db_fallbacks'] == 1
+
+    # Removal reloads the top-K on the next read
+    del songs['9']
+    chart.remove(name='song-9', source_url='url')
+    assert top_ids(3) == ['2', '8', '7']
+    assert chart.stats()['loads'] == 2
+
+
+def test_top_songs_offer_counter():
+    from song_server.extensions.charts import TopSongs
+
+    songs = {str(i): {'_id': str(i), 'name': f'song-{i}', 'source_url': 'url',
+                      'times_played': i * 10, 'num_likes': i}
+             for i in range(10)}
+    # Offers made while the db is read, [(song_id, times_played)]
+    offers_during_load = []
+
+    def load(field, limit, explicit_query):
+        ret = sorted(songs.values(), key=lambda s: (-s[field], s['_id']))
+        ret = [dict(s) for s in ret[:limit]]
+        for song_id, value in offers_during_load:
+            songs[song_id]['times_played'] = value
+            chart.offer_counter(song_id, 'times_played', value)
+        offers_during_load.clear()
+        return ret
+
+    def top():
+        return [(s['_id'], s['times_played']) for s in chart.top(3)]
+
+    chart = TopSongs('times_played', 3, 60, load)
+    assert top() == [('9', 90), ('8', 80), ('7', 70)]
+
+    # Songs of the top-K are updated in place
+    chart.offer_counter('8', 'times_played', 95)
+    chart.offer_counter('7', 'num_likes', 8)
+    assert top() == [('8', 95), ('9', 90), ('7', 70)]
+    assert chart.top(3)[2]['num_likes'] == 8
+    assert chart.stats()['loads'] == 1
+
+    # An older offer never lowers a counter
+    chart.offer_counter('8', 'times_played', 81)
+    assert top() == [('8', 95), ('9', 90), ('7', 70)]
+
+    # Below the lowest ranked song, or another counter, ignored
+    chart.offer_counter('1', 'times_played', 20)
+    chart.offer_counter('1', 'num_likes', 100)
+    assert top() == [('8', 95), ('9', 90), ('7', 70)]
+    assert chart.stats()['loads'] == 1
+
+    # A song entering the top-K is read from the db
+    songs['8']['times_played'] = 95
+    songs['2']['times_played'] = 91
+    chart.offer_counter('2', 'times_played', 91)
+    assert top() == [('8', 95), ('2', 91), ('9', 90)]
+    assert chart.stats()['loads'] == 2
+
+    # Offers made during a reload aren't lost
+    del songs['9']
+    chart.remove(song_id='9')
+    offers_during_load.append(('8', 100))
+    offers_during_load.append(('6', 99))
+    assert top() == [('8', 100), ('2', 91), ('7', 70)]
+    assert top() == [('8', 100), ('6', 99), ('2', 91)]
+
+
+@pytest.mark.parametrize(
+    "prefix, limit, expected_code, return_code",
+    [
+        # Case insensitive prefixes
+        ('a', None, 200, SUCCESS),
+        ('AL', None, 200, SUCCESS),
+        ('almost human', None, 200, SUCCESS),
+        ('W', '1', 200, SUCCESS),
+        ('Whatever put local society same.', None, 200, SUCCESS),
+
+        # No matches
+        ('zzz', None, 200, SUCCESS),
+        ('Whatever put local society same. ', None, 200, SUCCESS),
+
+        # Invalid params
+        (None, None, 400, INVALID_DATA_FORMAT),
+        ('', None, 400, INVALID_DATA_FORMAT),
+        ('a' * (MAX_SONG_NAME_LEN + 1), None, 400, INVALID_DATA_FORMAT),
+        ('a', '0', 400, INVALID_DATA_FORMAT),
+        ('a', 'ten', 400, INVALID_DATA_FORMAT),
+        ('a', '\u00b2', 400, INVALID_DATA_FORMAT),
+        ('a', str(MAX_SUGGEST_LIMIT + 1), 400, INVALID_DATA_FORMAT),
+    ]
+)
+def test_suggest_songs(app, songs_data, prefix, limit,
+                       expected_code, return_code):
+
+    params = {'prefix': prefix, 'limit': limit}
+    request = app.get('/suggest', query_string=remove_none_keys(params))
+
+    assert request is not None
+    assert request.get_json() is not None
+    assert request.status_code == expected_code
+
+    request_code = request.get_json().get('code') or 0
+    assert request_code == return_code
+    if request.status_code != 200:
+        return
+
+    expected = sorted(s.name for s in songs_data
+                      if s.name.lower().startswith(prefix.lower()))
+    assert request.get_json()['data'] == expected[:int(limit or 10)]
+
+
+def test_suggest_follows_catalog(app):
+    # The db helper instance serving the songs blueprint
+    from song_server.services.songs.routes import db_helper
+    from song_server.models.song import Song
+
+    def suggest(prefix):
+        request = app.get('/suggest', query_string={'prefix': prefix})
+        assert request.status_code == 200
+        return request.get_json()['data']
+
+    assert suggest('suggested') == []
+
+    new_song = Song('Suggested song', 'url', 'url')
+    assert db_helper.add_item(new_song) == SUCCESS
+    assert suggest('suggested') == ['Suggested song']
+
+    assert db_helper.remove_song('Suggested song', 'url') == SUCCESS
+    assert suggest('suggested') == []
+
+
+def test_prefix_index_updates():
+    from song_server.extensions.suggest import PrefixIndex
+
+    index = PrefixIndex(float('inf'), lambda: ['b 1', 'd 1'])
+    assert index.suggest('', 10) == ['b 1', 'd 1']
+
+    # A batch is merged in order
+    index.add_many(['e 1', 'a 1', 'c 1', 'B 1'])
+    assert index.suggest('', 10) == ['a 1', 'B 1', 'b 1', 'c 1', 'd 1', 'e 1']
+
+    index.remove('b 1')
+    index.remove('unknown')
+    assert index.suggest('b', 10) == ['B 1']
+
+
+def test_prefix_index_build_race():
+    import threading
+    from song_server.extensions.suggest import PrefixIndex
+
+    # Songs added / removed while the db is read
+    names = ['a 1']
+    num_loads = []
+    barrier = threading.Barrier(2, timeout=5)
+
+    def load_func():
+        num_loads.append(1)
+        barrier.wait()
+        names.append('b 1')
+        index.add('b 1')
+        return list(names)
+
+    index = PrefixIndex(float('inf'), load_func)
+    threads = [threading.Thread(target=index.suggest, args=('', 10))
+               for _ in range(2)]
+    for thread in threads:
+        thread.start()
+
+    # Concurrent first callers build the index once
+    barrier.wait()
+    for thread in threads:
+        thread.join()
+    assert len(num_loads) == 1
+
+    # Seen by the db read, the replayed add isn't a second copy
+    assert index.stats()['size'] == 2
+    index.remove('b 1')
+    assert index.suggest('b', 10) == []
+
+
+@pytest.mark.parametrize(
+    "query, limit, is_filter_explicit, expected_code, return_code",
+    [
+        ('society', None, None, 200, SUCCESS),
+        ('radio effort', '5', 'false', 200, SUCCESS),
+        ('society', None, 'true', 200, SUCCESS),
+
+        # Invalid params
+        (None, None, None, 400, INVALID_DATA_FORMAT),
+        ('  ', None, None, 400, INVALID_DATA_FORMAT),
+        ('society', '0', None, 400, INVALID_DATA_FORMAT),
+        ('society', '\u00b2', None, 400, INVALID_DATA_FORMAT),
+        ('society', str(MAX_SEARCH_LIMIT + 1), None, 400, INVALID_DATA_FORMAT),
+        ('society', None, 'yes', 400, INVALID_DATA_FORMAT),
+    ]
+)
+def test_search_songs(app, songs_data, query, limit, is_filter_explicit,
+                      expected_code, return_code):
+
+    params = {'q': query, 'limit': limit,
+              'is_filter_explicit': is_filter_explicit}
+    request = app.get('/search_songs', query_string=remove_none_keys(params))
+
+    assert request is not None
+    assert request.get_json() is not None
+    assert request.status_code == expected_code
+
+    request_code = request.get_json().get('code') or 0
+    assert request_code == return_code
+    if request.status_code != 200:
+        return
+
+    # Every result matches at least one of the terms
+    terms = query.lower().split()
+    data = request.get_json()['data']
+    assert len(data) > 0 or is_filter_explicit == 'true'
+    for song in data:
+        assert any(t in song['name'].lower() for t in terms)
+        assert is_filter_explicit != 'true' or not song['is_explicit']
+
+
 @pytest.mark.parametrize(
     "username, password, song_name, cover_url, "
     "source_url, is_explicit, expected_code, return_code",
@@ -178,6 +864,104 @@ def test_add_new_song(app, username, password,
     db_helper.remove_song(song_name, source_url)
 
 
+@pytest.mark.parametrize(
+    "username, password, lines, expected_code, return_code, "
+    "num_added, errors",
+    [
+        # Invalid login
+        ('admin', 'wrong-password', [], 401, SUCCESS, None, None),
+
+        # Users can't add songs
+        ('Barbara Rocha', 'password', [], 400, PRIVILEGE_ERROR, None, None),
+
+        # Empty upload
+        ('admin', 'admin', [], 201, SUCCESS, 0, []),
+
+        # Valid songs
+        ('Patrick Smith', 'password', [
+            '{"name": "bulk-song-1", "cover_url": "url", "source_url": "url"}',
+            '',
+            '{"name": "bulk-song-2", "cover_url": "url", "source_url": "url",'
+            ' "is_explicit": true}',
+        ], 201, SUCCESS, 2, []),
+
+        # Per line errors
+        ('admin', 'admin', [
+            '{"name": "bulk-song-1", "cover_url": "url", "source_url": "url"}',
+            # Duplicate of an existing song
+            '{"name": "Whatever put local society same.", "cover_url": "url",'
+            ' "source_url": "www.song_server.com/2192"}',
+            # Duplicate within the upload
+            '{"name": "bulk-song-1", "cover_url": "url", "source_url": "url"}',
+            # Invalid song details
+            '{"name": "bulk-song-3", "cover_url": "url"}',
+            '{"name": 9921, "cover_url": "url", "source_url": "url"}',
+            '{"name": "bulk-song-3", "cover_url": "url", "source_url": "url",'
+            ' "is_explicit": 100}',
+            # Invalid json
+            '{"name": "bulk-song-3",',
+            '["bulk-song-3"]',
+            '"' + 'a' * MAX_NDJSON_LINE_LEN + '"',
+            '{"name": "bulk-song-4", "cover_url": "url", "source_url": "url"}',
+        ], 201, SUCCESS, 2, [
+            {'index': 1, 'code': SONG_EXISTS},
+            {'index': 2, 'code': SONG_EXISTS},
+            {'index': 3, 'code': INVALID_SONG_DETAILS},
+            {'index': 4, 'code': INVALID_SONG_DETAILS},
+            {'index': 5, 'code': INVALID_SONG_DETAILS},
+            {'index': 6, 'code': INVALID_DATA_FORMAT},
+            {'index': 7, 'code': INVALID_DATA_FORMAT},
+            {'index': 8, 'code': INVALID_DATA_FORMAT},
+        ]),
+
+        # Blank lines count, errors carry the line index of the body
+        ('admin', 'admin', [
+            '{"name": "bulk-song-1", "cover_url": "url", "source_url": "url"}',
+            '',
+            '  ',
+            '{"name": 1}',
+            '',
+            '{"name": "bulk-song-2",',
+        ], 201, SUCCESS, 1, [
+            {'index': 3, 'code': INVALID_SONG_DETAILS},
+            {'index': 5, 'code': INVALID_DATA_FORMAT},
+        ]),
+    ]
+)
+def test_add_new_songs(app, username, password, lines, expected_code,
+                       return_code, num_added, errors):
+
+    # Login the user to obtain an access token
+    headers = {'username': username, 'password': password}
+    request = app.post('/login', headers=headers)
+    access_token = (request.get_json() or {}).get('access_key')
+
+    headers = None
+    if access_token is not None:
+        headers = {'Authorization': f'Bearer {access_token}'}
+
+    request = app.post('/add_songs', data='\n'.join(lines),
+                       content_type='application/x-ndjson', headers=headers)
+
+    # Validate response
+    assert request is not None
+    assert request.get_json() is not None
+    assert request.status_code == expected_code
+
+    request_code = request.get_json().get('code') or 0
+    assert request_code == return_code
+    if request.status_code != 201:
+        return
+
+    assert request.get_json()['num_added'] == num_added
+    assert request.get_json()['errors'] == errors
+
+    # Remove the added songs
+    from song_server.extensions.dbhelper import db_helper
+    for i in range(1, 5):
+        db_helper.remove_song(f'bulk-song-{i}', 'url')
+
+
 @pytest.mark.parametrize(
     "username, password, song_id, "
     "expected_code, return_code",
@@ -282,3 +1066,332 @@ def test_play_song(app, username, password, song_id,
 
     request_code = request.get_json().get('code') or 0
     assert request_code == return_code
+
+
+@pytest.mark.parametrize("endpoint, field", [
+    ('/play_songs', 'times_played'),
+    ('/like_songs', 'num_likes'),
+])
+@pytest.mark.parametrize(
+    "username, password, songs, expected_code, return_code, item_codes",
+    [
+        # Invalid user login
+        ("admin", "wrong-pass", [{'song_id': '5'}], 401, SUCCESS, None),
+
+        # Invalid batches
+        ("admin", "admin", None, 400, INVALID_DATA_FORMAT, None),
+        ("admin", "admin", {'song_id': '5'}, 400, INVALID_DATA_FORMAT, None),
+        ("admin", "admin", [], 400, INVALID_DATA_FORMAT, None),
+        ("admin", "admin", [{'song_id': '5'}] * (MAX_SONGS_PER_BATCH + 1),
+         400, INVALID_DATA_FORMAT, None),
+
+        # Valid batches
+        ("Barbara Rocha", "password", [{'song_id': '5'}], 201, SUCCESS, [SUCCESS]),
+        ("Barbara Rocha", "password",
+         [{'song_id': '5', 'count': 3}, {'song_id': '4', 'count': 2},
+          {'song_id': '5'}], 201, SUCCESS, [SUCCESS, SUCCESS, SUCCESS]),
+
+        # Per item errors
+        ("Patrick Smith", "password",
+         [{'song_id': '5'}, {'song_id': 'song-id'}, {'song_id': 'song-id' * 100},
+          {'song_id': '4', 'count': 0}, {'song_id': '4', 'count': 'one'},
+          {'count': 1}, 'song-id'], 201, SUCCESS,
+         [SUCCESS, SONG_NOT_FOUND, INVALID_SONG_DETAILS,
+          INVALID_DATA_FORMAT, INVALID_DATA_FORMAT,
+          INVALID_SONG_DETAILS, INVALID_SONG_DETAILS]),
+    ]
+)
+def test_song_batches(app, endpoint, field, username, password, songs,
+                      expected_code, return_code, item_codes):
+    from song_server.extensions.dbhelper import db_helper
+
+    # Login the user to obtain an access token
+    headers = {'username': username, 'password': password}
+    request = app.post('/login', headers=headers)
+    access_token = (request.get_json() or {}).get('access_key')
+
+    headers = None
+    if access_token is not None:
+        headers = {'Authorization': f'Bearer {access_token}'}
+
+    # Expected counter increments of the valid entries
+    expected = {}
+    for entry, code in zip(songs or [], item_codes or []):
+        if code == SUCCESS:
+            expected[entry['song_id']] = \
+                expected.get(entry['song_id'], 0) + entry.get('count', 1)
+    before = {song_id: db_helper.get_song(song_id)[field]
+              for song_id in expected}
+
+    body = remove_none_keys({'songs': songs})
+    request = app.post(endpoint, json=body, headers=headers)
+
+    # Validate response
+    assert request is not None
+    assert request.get_json() is not None
+    assert request.status_code == expected_code
+
+    request_code = request.get_json().get('code') or 0
+    assert request_code == return_code
+    if request.status_code != 201:
+        return
+
+    data = request.get_json()['data']
+    assert [d['code'] for d in data] == item_codes
+
+    for song_id, amount in expected.items():
+        after = db_helper.get_song(song_id)[field]
+        assert after == before[song_id] + amount
+
+
+@pytest.mark.parametrize(
+    "song_id, num_plays, num_likes",
+    [
+        ("1", 3, 0),
+        ("2", 0, 2),
+        ("6", 5, 4),
+    ]
+)
+@mongo_only
+def test_counter_aggregator(app, song_id, num_plays, num_likes):
+    from song_server.extensions.dbhelper import db_helper
+    from song_server.extensions.counters import CounterAggregator
+
+    col_songs = db_helper.col_songs
+    before = col_songs.find_one({'_id': song_id})
+
+    # Long interval, only the explicit flush writes
+    aggregator = CounterAggregator(col_songs, 60 * 1000, 1000)
+    for _ in range(num_plays):
+        aggregator.add(song_id, 'times_played')
+    for _ in range(num_likes):
+        aggregator.add(song_id, 'num_likes')
+
+    # Nothing written before the flush
+    assert col_songs.find_one({'_id': song_id}) == before
+
+    aggregator.close()
+    after = col_songs.find_one({'_id': song_id})
+    assert after['times_played'] == before['times_played'] + num_plays
+    assert after['num_likes'] == before['num_likes'] + num_likes
+
+    stats = aggregator.stats()
+    assert stats['pending_songs'] == 0
+    assert stats['flushes'] == 1
+    assert stats['last_flush_size'] == 1
+
+
+@mongo_only
+def test_sharded_counters(app):
+    from song_server.extensions.dbhelper import db_helper
+    from song_server.extensions.counters import ShardedCounters
+
+    song_id = '3'
+    before = db_helper.get_song(song_id)
+
+    # Long interval, only the explicit folds write
+    sharded = ShardedCounters(db_helper.col_songs,
+                              db_helper.col_counter_shards, 4, 2, 60 * 1000)
+
+    # Cold song, the caller writes the song document
+    assert not sharded.add(song_id, 'times_played')
+    for _ in range(3):
+        sharded.record(song_id)
+
+    # Hot song, written to the shards only
+    for _ in range(10):
+        assert sharded.add(song_id, 'times_played')
+    assert sharded.add(song_id, 'num_likes')
+    assert db_helper.get_song(song_id) == before
+
+    assert sharded.fold() == 1
+    after = db_helper.get_song(song_id)
+    assert after['times_played'] == before['times_played'] + 10
+    assert after['num_likes'] == before['num_likes'] + 1
+
+    # Idle for a whole fold, demoted
+    assert sharded.fold() == 0
+    assert not sharded.add(song_id, 'times_played')
+    sharded.close()
+
+    stats = sharded.stats()
+    assert stats['hot_songs'] == 0
+    assert stats['promotions'] == 1
+    assert stats['demotions'] == 1
+    assert stats['sharded_increments'] == 11
+    assert db_helper.get_song(song_id) == after
+
+
+class FailingCollection:
+
+    """
+    Pymongo collection proxy, the bulk writes numbered in `failures`
+    raise, counted from 1
+    """
+
+    def __init__(self, collection, failures):
+        self.collection = collection
+        self.failures = failures
+        self.num_bulk_writes = 0
+
+    def bulk_write(self, requests, **kwargs):
+        from pymongo.errors import PyMongoError
+
+        self.num_bulk_writes += 1
+        if self.num_bulk_writes in self.failures:
+            raise PyMongoError('injected failure')
+
+        return self.collection.bulk_write(requests, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.collection, name)
+
+
+@mongo_only
+@pytest.mark.parametrize(
+    "song_failures, shard_failures",
+    [
+        # The song write fails, the pending fold is kept
+        ({1}, set()),
+        # The song write is done, clearing the pending fold fails
+        (set(), {2}),
+    ]
+)
+def test_sharded_counters_failed_fold(app, song_failures, shard_failures):
+    from song_server.extensions.dbhelper import db_helper
+    from song_server.extensions.counters import ShardedCounters
+
+    song_id = '4'
+    before = db_helper.get_song(song_id)
+
+    # Long interval, only the explicit folds write
+    songs = FailingCollection(db_helper.col_songs, song_failures)
+    shards = FailingCollection(db_helper.col_counter_shards, shard_failures)
+    sharded = ShardedCounters(songs, shards, 4, 0, 60 * 1000)
+    sharded.record(song_id)
+    for _ in range(10):
+        assert sharded.add(song_id, 'times_played')
+
+    # Phase 1 moves the counts to a pending fold, phase 2 fails
+    assert sharded.fold() == 0
+    assert sharded.stats()['failed_folds'] == 1
+    assert db_helper.get_song(song_id)['times_played'] == \
+        before['times_played'] + (10 if not song_failures else 0)
+
+    # Retried on the next fold, added exactly once
+    assert sharded.fold() == 1
+    assert sharded.fold() == 0
+    sharded.close()
+    assert db_helper.get_song(song_id)['times_played'] == \
+        before['times_played'] + 10
+    assert db_helper.col_counter_shards.count_documents(
+        {'pending': {'$ne': None}}) == 0
+
+
+@mongo_only
+def test_sharded_counters_orphans(app):
+    from song_server.extensions.dbhelper import db_helper
+    from song_server.extensions.counters import ShardedCounters
+
+    song_id = '5'
+    before = db_helper.get_song(song_id)
+
+    # Left by a worker killed before its last fold, one shard mid fold
+    db_helper.col_counter_shards.insert_many([
+        {'_id': {'song_id': song_id, 'shard': 0}, 'times_played': 7},
+        {'_id': {'song_id': song_id, 'shard': 1}, 'num_likes': 2,
+         'pending': {'fold_id': 'dead-worker', 'times_played': 5}},
+    ])
+
+    # Long interval, only the explicit folds write
+    sharded = ShardedCounters(db_helper.col_songs,
+                              db_helper.col_counter_shards, 4, 2, 60 * 1000)
+
+    # Not tracked by this process, only a sweep folds them
+    assert sharded.fold() == 0
+    assert sharded.fold(is_sweep=True) == 1
+
+    # The counts behind the pending fold are moved once it's applied
+    assert sharded.fold(is_sweep=True) == 1
+    assert sharded.fold(is_sweep=True) == 0
+    sharded.close()
+
+    after = db_helper.get_song(song_id)
+    assert after['times_played'] == before['times_played'] + 12
+    assert after['num_likes'] == before['num_likes'] + 2
+    assert sharded.stats()['hot_songs'] == 0
+    db_helper.col_counter_shards.delete_many({'_id.song_id': song_id})
+
+
+def test_single_flight():
+    import time
+    import threading
+    from song_server.shared.cache import SingleFlight
+
+    single_flight = SingleFlight()
+    release = threading.Event()
+    num_queries = []
+
+    def query():
+        num_queries.append(1)
+        release.wait(5)
+        return ['page']
+
+    results = []
+    threads = [threading.Thread(
+        target=lambda: results.append(single_flight.do('page-1', query)))
+        for _ in range(8)]
+    for thread in threads:
+        thread.start()
+
+    # Every other caller waits for the first query
+    deadline = time.monotonic() + 5
+    while single_flight.stats()['coalesced'] < 7 \
+            and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(num_queries) == 1
+    assert len(results) == 8
+    assert all(result is results[0] for result in results)
+
+    stats = single_flight.stats()
+    assert stats['in_flight'] == 0
+    assert stats['calls'] == 1
+    assert stats['coalesced'] == 7
+    assert stats['max_waiters'] == 7
+
+    # Once done, the next call queries again, errors reach the caller
+    with pytest.raises(ValueError):
+        single_flight.do('page-1', lambda: int('page'))
+    assert single_flight.do('page-1', lambda: ['new page']) == ['new page']
+
+
+@mongo_only
+def test_page_cache_invalidation(app):
+    # The db helper instance serving the songs blueprint
+    from song_server.services.songs.routes import db_helper
+    from song_server.models.song import Song
+
+    def song_names():
+        request = app.get('/get_songs')
+        assert request.status_code == 200
+        return [s['name'] for s in request.get_json()['data']]
+
+    # Second read is a cache hit
+    hits = db_helper.page_cache.stats()['hits']
+    names = song_names()
+    assert song_names() == names
+    assert db_helper.page_cache.stats()['hits'] == hits + 1
+
+    # Adding a song invalidates the cached page
+    new_song = Song('AAA cached song', 'url', 'url')
+    assert db_helper.add_item(new_song) == SUCCESS
+    assert 'AAA cached song' in song_names()
+
+    # So does removing it
+    assert db_helper.remove_song('AAA cached song', 'url') == SUCCESS
+    assert song_names() == names
@@ -156,3 +156,132 @@ def test_add_new_user(app, request_username, request_password,
     # If a new user was added clean up the user
     from song_server.extensions.dbhelper import db_helper
     db_helper.remove_user(username)
+
+
+@pytest.mark.parametrize(
+    "num_workers, max_pending, is_saturated",
+    [
+        # Inline hashing
+        (0, 1, False),
+        # Process pool
+        (1, 1, False),
+        # No capacity, every hash is rejected
+        (1, 0, True),
+    ]
+)
+def test_hash_pool(num_workers, max_pending, is_saturated):
+    from song_server.extensions.hashpool import HashPool
+    from song_server.extensions.hashpool import HashPoolSaturated
+
+    pool = HashPool(num_workers, max_pending, 'pbkdf2:sha256:1000', 8)
+
+    try:
+        if is_saturated:
+            with pytest.raises(HashPoolSaturated):
+                pool.generate_password_hash('password')
+            assert pool.stats()['rejected'] == 1
+            return
+
+        pwhash = pool.generate_password_hash('password')
+        assert pwhash.startswith('pbkdf2:sha256:1000$')
+        assert pool.check_password_hash(pwhash, 'password')
+        assert not pool.check_password_hash(pwhash, 'wrong-password')
+
+        stats = pool.stats()
+        assert stats['hashes'] == 3
+        assert stats['pending'] == 0
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.parametrize(
+    "username, password, user_role",
+    [
+        ('admin', 'admin', 1),
+        ('Barbara Rocha', 'password', 2),
+        ('Patrick Smith', 'password', 3),
+    ]
+)
+def test_access_key_claims(app, username, password, user_role):
+    import json
+    import base64
+
+    access_token = test_user_login(app, username, password, 201, SUCCESS)
+
+    # Only the minimal identity is stored in the token
+    payload = access_token.split('.')[1]
+    payload = json.loads(base64.urlsafe_b64decode(payload + '=='))
+    assert set(payload['sub'].keys()) == {'id', 'username', 'role'}
+    assert payload['sub']['username'] == username
+    assert payload['sub']['role'] == user_role
+
+    # Repeated requests with the same token hit the identity cache
+    from flask import current_app
+    headers = {'Authorization': f'Bearer {access_token}'}
+    body = {'songs': [{'song_id': '1'}]}
+    with app.application.app_context():
+        cache = current_app.extensions['jwt_identity_cache']
+
+    hits = cache.stats()['hits']
+    for _ in range(3):
+        request = app.post('/play_songs', json=body, headers=headers)
+        assert request.status_code == 201
+    assert cache.stats()['hits'] == hits + 2
+
+    # A tampered token is never served from the cache
+    header, payload, signature = access_token.split('.')
+    tampered = {**json.loads(base64.urlsafe_b64decode(payload + '==')),
+                'sub': {'id': 0, 'username': 'admin', 'role': 1}}
+    tampered = base64.urlsafe_b64encode(
+        json.dumps(tampered).encode()).decode().rstrip('=')
+    headers = {'Authorization': f'Bearer {header}.{tampered}.{signature}'}
+    request = app.post('/play_songs', json=body, headers=headers)
+    assert request.status_code == 422
+
+
+def test_parse_user_concurrent():
+    import threading
+    from flask import g
+    from flask import Flask
+    from flask_jwt_extended import create_access_token
+    from song_server.shared.configs import TestConfig
+    from song_server.shared.decorators import parse_user
+    from song_server.extensions.jwthelper import init_jwt_manager
+    from song_server.models.user import User
+    from song_server.models.user import UserRoles
+
+    flask_app = Flask(__name__)
+    flask_app.config.from_object(TestConfig)
+    init_jwt_manager(flask_app)
+
+    # Both requests are inside the view before either answers
+    barrier = threading.Barrier(2, timeout=5)
+
+    @flask_app.route('/whoami')
+    @parse_user
+    def whoami():
+        barrier.wait()
+        return g.user.username
+
+    usernames = ['Barbara Rocha', 'Patrick Smith']
+    with flask_app.app_context():
+        access_tokens = [create_access_token(User(
+            username, '', user_id=str(i), user_role=UserRoles.UR_USER
+        ).to_claims()) for i, username in enumerate(usernames)]
+
+    # Each thread must see its own user, never the other one's
+    results = [None] * len(usernames)
+
+    def get_user(i):
+        headers = {'Authorization': f'Bearer {access_tokens[i]}'}
+        request = flask_app.test_client().get('/whoami', headers=headers)
+        results[i] = request.get_data(as_text=True)
+
+    threads = [threading.Thread(target=get_user, args=(i,))
+               for i in range(len(usernames))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == usernames